@@ -0,0 +1,146 @@
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+from gmail_async import AsyncGmailClient, get_async_client
+from gmail_quota import RequestScheduler, scheduler as default_scheduler
+from gmail_service import GmailServiceManager, default_manager
+
+# One sub-directory per extra account: accounts/<name>/token.json
+ACCOUNTS_DIR = os.getenv("GMAIL_ACCOUNTS_DIR", "accounts")
+# token.json/credentials.json in the working directory, as before accounts existed
+DEFAULT_ACCOUNT = "default"
+
+# Also a directory name, so no path separators or leading dots
+ACCOUNT_NAME = re.compile(r"^[\w@+-][\w.@+-]*$")
+
+
+class Account:
+    """Everything needed to talk to Gmail as one mailbox.
+
+    Each account owns its token store, per-thread API services, quota
+    bucket and async connection pool, so calls for different accounts never
+    wait on each other's locks, quota or connections. Per-account local
+    data (caches, indexes) lives under ``directory``.
+
+    Args:
+        name (str): Account name used by the tools' ``account`` parameter.
+        directory (str): Holds the account's token and local data files.
+        services (GmailServiceManager): Credentials and API services.
+        scheduler (RequestScheduler): Quota and retry gate for this mailbox.
+        client (AsyncGmailClient): Async client; built on first use if None.
+    """
+
+    def __init__(self, name: str, directory: str, services: GmailServiceManager,
+                 scheduler: Optional[RequestScheduler] = None, client: Optional[AsyncGmailClient] = None):
+        self.name = name
+        self.directory = directory
+        self.services = services
+        self.scheduler = scheduler or RequestScheduler()
+        self._client = client
+        self._client_lock = threading.Lock()
+
+    def get_service(self):
+        """The account's Gmail API service for the calling thread."""
+        return self.services.get_service()
+
+    def get_credentials(self):
+        return self.services.get_credentials()
+
+    @property
+    def client(self) -> AsyncGmailClient:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = AsyncGmailClient(get_credentials=self.get_credentials, scheduler=self.scheduler)
+        return self._client
+
+    def path(self, filename: str) -> str:
+        """Path of a per-account data file."""
+        return os.path.join(self.directory, filename)
+
+    def close(self):
+        self.services.close()
+
+
+class AccountRegistry:
+    """Lazily created accounts, by name.
+
+    The default account uses token.json and credentials.json in the working
+    directory and shares the module-level service, scheduler and async
+    client, so single-mailbox setups behave exactly as before. Any other
+    account ``<name>`` lives in ``<root>/<name>/`` with its own token.json;
+    its credentials.json (the OAuth client) is optional and falls back to the
+    shared one. Authorize a new account by creating its directory and calling
+    any tool with ``account="<name>"`` once.
+
+    Args:
+        root (str): Directory holding one sub-directory per extra account.
+    """
+
+    def __init__(self, root: str = ACCOUNTS_DIR):
+        self.root = root
+        self._accounts: Dict[str, Account] = {}
+        self._lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        """Configured account names, the default account first."""
+        extra = []
+        if os.path.isdir(self.root):
+            extra = sorted(
+                name for name in os.listdir(self.root)
+                if name != DEFAULT_ACCOUNT and ACCOUNT_NAME.match(name)
+                and os.path.isdir(os.path.join(self.root, name))
+            )
+        return [DEFAULT_ACCOUNT, *extra]
+
+    def get(self, name: Optional[str] = None) -> Account:
+        """
+        Return the named account, creating it on first use.
+
+        Args:
+            name (str): Account name; None or "" means the default account.
+
+        Raises:
+            ValueError: No such account is configured.
+        """
+        name = name or DEFAULT_ACCOUNT
+        # Lock-free once created, so busy accounts do not serialize on the registry
+        account = self._accounts.get(name)
+        if account is not None:
+            return account
+        with self._lock:
+            account = self._accounts.get(name)
+            if account is None:
+                account = self._accounts[name] = self._create(name)
+            return account
+
+    def _create(self, name: str) -> Account:
+        if name == DEFAULT_ACCOUNT:
+            return Account(name, ".", default_manager, default_scheduler, get_async_client())
+        directory = os.path.join(self.root, name)
+        if not ACCOUNT_NAME.match(name) or not os.path.isdir(directory):
+            raise ValueError(f"Unknown account {name!r}; configured accounts: {', '.join(self.names())}")
+        credentials_path = os.path.join(directory, "credentials.json")
+        if not os.path.exists(credentials_path):
+            credentials_path = default_manager.credentials_path
+        services = GmailServiceManager(os.path.join(directory, "token.json"), credentials_path)
+        return Account(name, directory, services)
+
+    def loaded(self) -> List[Account]:
+        """Accounts created so far."""
+        with self._lock:
+            return list(self._accounts.values())
+
+    def close(self):
+        for account in self.loaded():
+            account.close()
+
+
+registry = AccountRegistry()
+
+
+def get_account(name: Optional[str] = None) -> Account:
+    """Get a configured account by name, the default one if None"""
+    return registry.get(name)
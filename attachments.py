@@ -0,0 +1,223 @@
+import base64
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from typing import AsyncIterable, Optional
+
+from executors import run_io
+
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", "attachments")
+
+# Bytes read from the HTTP stream per iteration
+CHUNK_SIZE = 256 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attachments (
+    message_id TEXT NOT NULL,
+    part_id TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    filename TEXT,
+    mime_type TEXT,
+    PRIMARY KEY (message_id, part_id)
+);
+CREATE INDEX IF NOT EXISTS attachments_by_hash ON attachments (sha256);
+"""
+
+_DATA_KEY = re.compile(rb'"data"\s*:\s*"')
+
+
+class Base64UrlDecoder:
+    """Incremental base64url decoder that keeps only a <4 byte carry between chunks."""
+
+    def __init__(self):
+        self._carry = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self._carry + chunk
+        usable = len(data) - len(data) % 4
+        self._carry = data[usable:]
+        return base64.urlsafe_b64decode(data[:usable]) if usable else b""
+
+    def flush(self) -> bytes:
+        data, self._carry = self._carry, b""
+        if not data:
+            return b""
+        return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+async def iter_attachment_data(chunks: AsyncIterable[bytes]):
+    """
+    Decode the "data" field of a streamed attachments.get JSON body.
+
+    The response is requested with fields=data, so the body is just
+    {"data": "<base64url>"}; base64url never contains quotes or escapes,
+    so the string can be decoded as it arrives instead of parsing the
+    whole document in memory.
+
+    Yields:
+        bytes: Decoded attachment content, chunk by chunk.
+    """
+    decoder = Base64UrlDecoder()
+    prefix = b""
+    in_data = False
+    async for chunk in chunks:
+        if not in_data:
+            prefix += chunk
+            match = _DATA_KEY.search(prefix)
+            if match is None:
+                continue
+            in_data = True
+            chunk, prefix = prefix[match.end():], b""
+        end = chunk.find(b'"')
+        if end != -1:
+            yield decoder.feed(chunk[:end])
+            break
+        yield decoder.feed(chunk)
+    if not in_data:
+        raise ValueError("attachment response has no data field")
+    yield decoder.flush()
+
+
+async def _inline_data(data: str):
+    decoder = Base64UrlDecoder()
+    yield decoder.feed(data.encode("ascii"))
+    yield decoder.flush()
+
+
+class AttachmentStore:
+    """Content-addressed attachment files on disk.
+
+    Files live at ``<root>/<sha[:2]>/<sha256>``, so identical attachments
+    received in different messages are stored once. A small SQLite index
+    maps (message ID, part ID) to the stored hash; attachments already in
+    the index are not downloaded again.
+    """
+
+    def __init__(self, root: str = ATTACHMENTS_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def lookup(self, message_id: str, part_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, size, filename, mime_type FROM attachments"
+                " WHERE message_id = ? AND part_id = ?",
+                (message_id, part_id),
+            ).fetchone()
+        if row is None or not os.path.exists(self.path_for(row[0])):
+            return None
+        return self._record(*row)
+
+    def _record(self, sha256, size, filename, mime_type, deduplicated=True):
+        return {
+            "filename": filename,
+            "mime_type": mime_type,
+            "size": size,
+            "sha256": sha256,
+            "path": self.path_for(sha256),
+            "deduplicated": deduplicated,
+        }
+
+    def _open_temp(self):
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".download-")
+        return os.fdopen(fd, "wb"), temp_path
+
+    def _commit(self, temp_path: str, digest: str) -> bool:
+        """Move a finished download into place; returns False if the content was already stored."""
+        final_path = self.path_for(digest)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        if os.path.exists(final_path):
+            os.unlink(temp_path)
+            return False
+        os.replace(temp_path, final_path)
+        return True
+
+    def _index(self, message_id, part_id, digest, size, filename, mime_type):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO attachments VALUES (?, ?, ?, ?, ?, ?)",
+                (message_id, part_id, digest, size, filename, mime_type),
+            )
+
+    async def save_stream(self, message_id: str, part_id: str, chunks: AsyncIterable[bytes],
+                          filename: str = "", mime_type: str = "") -> dict:
+        """Write decoded chunks to a temp file while hashing, then store by SHA-256.
+
+        Disk writes, hashing and the index update run in the I/O pool, so a
+        large download never blocks the event loop.
+        """
+        sha = hashlib.sha256()
+        size = 0
+        out, temp_path = await run_io(self._open_temp)
+
+        def write(data: bytes):
+            sha.update(data)
+            out.write(data)
+
+        try:
+            try:
+                async for data in chunks:
+                    if data:
+                        await run_io(write, data)
+                        size += len(data)
+            finally:
+                await run_io(out.close)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        digest = sha.hexdigest()
+        stored = await run_io(self._store, temp_path, message_id, part_id, digest, size, filename, mime_type)
+        return self._record(digest, size, filename, mime_type, deduplicated=not stored)
+
+    def _store(self, temp_path, message_id, part_id, digest, size, filename, mime_type) -> bool:
+        stored = self._commit(temp_path, digest)
+        self._index(message_id, part_id, digest, size, filename, mime_type)
+        return stored
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+async def save_attachment(client, store: AttachmentStore, message_id: str, part: dict) -> dict:
+    """
+    Save one attachment part of a message, downloading it only if needed.
+
+    Args:
+        client: AsyncGmailClient used for messages.attachments.get.
+        store: AttachmentStore to write to.
+        message_id (str): Gmail message ID.
+        part (dict): The attachment's part from a format=full payload.
+
+    Returns:
+        dict: 'filename', 'mime_type', 'size', 'sha256', 'path' and
+        'deduplicated' (True when no new file had to be written).
+    """
+    part_id = part.get("partId", "")
+    filename = part.get("filename", "")
+    mime_type = part.get("mimeType", "")
+    known = await run_io(store.lookup, message_id, part_id)
+    if known is not None:
+        return known
+
+    body = part.get("body", {})
+    attachment_id = body.get("attachmentId")
+    if body.get("data") or not attachment_id:
+        # Small parts come inline with the message and empty files have no
+        # body at all; nothing to download
+        return await store.save_stream(message_id, part_id, _inline_data(body.get("data", "")), filename, mime_type)
+
+    async with client.stream_attachment(message_id, attachment_id) as response:
+        return await store.save_stream(
+            message_id, part_id, iter_attachment_data(response.aiter_bytes(CHUNK_SIZE)), filename, mime_type,
+        )
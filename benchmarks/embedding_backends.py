@@ -0,0 +1,159 @@
+"""
+Compare embedding backends on the template set: latency, memory and recall@k.
+
+Each backend runs in its own subprocess so load time and peak RSS are
+measured in isolation. Recall@k is the overlap of each backend's top-k
+templates with the reference backend's (the first one listed), using
+exact cosine search, so it isolates what the backend changes.
+
+    python benchmarks/embedding_backends.py --backends torch onnx onnx-int8 --json results.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_QUERIES = [
+    "Request of leave for 2 days",
+    "ask my manager to reschedule our meeting",
+    "follow up on the invoice I sent last week",
+    "complain about a delayed delivery",
+    "thank the team for their help on the launch",
+    "apply for the data analyst position",
+    "apologize for missing the deadline",
+    "congratulate a colleague on the promotion",
+    "request a reference letter from my professor",
+    "remind the client about the pending payment",
+    "invite the team to a farewell lunch",
+    "ask for an extension on the assignment",
+]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def load_corpus(prompts_path):
+    with open(prompts_path, encoding="utf-8") as file:
+        prompts = json.load(file).get("prompts", [])
+    texts = [prompt["prompt"] for prompt in prompts]
+    queries = DEFAULT_QUERIES + [prompt["purpose of mail"] for prompt in prompts if prompt.get("purpose of mail")]
+    return texts, queries
+
+
+def worker(args):
+    """Run one backend and print its measurements as JSON."""
+    import numpy as np
+    from embedding_backends import EmbeddingConfig, load_embeddings
+
+    texts, queries = load_corpus(args.prompts)
+    baseline_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    embeddings = load_embeddings(EmbeddingConfig(args.model, backend=args.worker))
+    embeddings.embed_query("warm up")
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    corpus = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    corpus_seconds = time.perf_counter() - start
+
+    latencies = []
+    query_vectors = []
+    for _ in range(args.repeat):
+        for query in queries:
+            start = time.perf_counter()
+            vector = embeddings.embed_query(query)
+            latencies.append(time.perf_counter() - start)
+            if len(query_vectors) < len(queries):
+                query_vectors.append(vector)
+
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    query_matrix = np.asarray(query_vectors, dtype=np.float32)
+    query_matrix /= np.linalg.norm(query_matrix, axis=1, keepdims=True)
+    k = min(args.k, len(texts))
+    top_k = np.argsort(-(query_matrix @ corpus.T), axis=1)[:, :k].tolist()
+
+    print(json.dumps({
+        "backend": args.worker,
+        "model": args.model,
+        "dimension": int(corpus.shape[1]),
+        "load_seconds": load_seconds,
+        "corpus_docs_per_second": len(texts) / corpus_seconds if corpus_seconds else None,
+        "query_ms_p50": percentile(latencies, 0.5) * 1000,
+        "query_ms_p95": percentile(latencies, 0.95) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+        "model_rss_mb": peak_rss_mb() - baseline_rss,
+        "top_k": top_k,
+    }))
+
+
+def recall_at_k(results, reference):
+    hits = total = 0
+    for found, expected in zip(results, reference):
+        hits += len(set(found) & set(expected))
+        total += len(expected)
+    return hits / total if total else None
+
+
+def run(args):
+    reports = []
+    for backend in args.backends:
+        command = [sys.executable, os.path.abspath(__file__), "--worker", backend,
+                   "--model", args.model, "--prompts", os.path.abspath(args.prompts), "--k", str(args.k),
+                   "--repeat", str(args.repeat)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1:] or ["failed"]
+            reports.append({"backend": backend, "error": error[0]})
+            continue
+        reports.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    reference = next((report for report in reports if "top_k" in report), None)
+    reference_top_k = reference["top_k"] if reference else None
+    for report in reports:
+        if "top_k" in report:
+            report[f"recall@{args.k}"] = recall_at_k(report.pop("top_k"), reference_top_k)
+            report["reference"] = reference["backend"]
+
+    for report in reports:
+        if "error" in report:
+            print(f"{report['backend']:<10} error: {report['error']}")
+            continue
+        print(f"{report['backend']:<10} load {report['load_seconds']:6.2f}s  "
+              f"query p50 {report['query_ms_p50']:7.2f} ms  p95 {report['query_ms_p95']:7.2f} ms  "
+              f"docs/s {report['corpus_docs_per_second'] or 0:8.1f}  "
+              f"peak RSS {report['peak_rss_mb']:7.1f} MB  recall@{args.k} {report[f'recall@{args.k}']:.3f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(reports, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+                        help="First backend is the recall reference")
+    parser.add_argument("--model", default="sentence-transformers/all-mpnet-base-v2")
+    parser.add_argument("--prompts", default=os.path.join(ROOT, "templates", "prompts.json"))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the query set")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args)
+    else:
+        run(args)
@@ -0,0 +1,251 @@
+"""
+In-memory stand-in for the Gmail REST API, for offline benchmarks.
+
+Serves the endpoints the servers use (profile, messages list/get incl.
+batch requests, drafts, history, watch, attachments) over a synthetic
+mailbox. Point the servers at it with GMAIL_API_ENDPOINT:
+
+    python benchmarks/fake_gmail_server.py --port 8089 --messages 500
+    GMAIL_API_ENDPOINT=http://127.0.0.1:8089/ python gmail_server.py
+"""
+import argparse
+import base64
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+USER_PATH = re.compile(r"^/gmail/v1/users/[^/]+/(?P<rest>.*)$")
+BATCH_PATHS = ("/batch", "/batch/gmail/v1")
+
+
+def b64url(data: str) -> str:
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+
+def make_message(index: int, body_size: int = 2000) -> dict:
+    """A multipart/alternative message like most real mail."""
+    subject = f"Benchmark message {index}"
+    text = (f"Hello, this is message {index} about the quarterly report and the invoice. " * 40)[:body_size]
+    html = f"<html><body><p>{text}</p></body></html>"
+    headers = [
+        {"name": "Subject", "value": subject},
+        {"name": "From", "value": f"sender{index % 50}@example.com"},
+        {"name": "To", "value": "me@example.com"},
+        {"name": "Date", "value": "Mon, 1 Jul 2024 09:00:00 +0000"},
+    ]
+    return {
+        "id": f"m{index:06d}",
+        "threadId": f"t{index // 3:06d}",
+        "labelIds": ["INBOX", "UNREAD"] if index % 2 == 0 else ["INBOX"],
+        "snippet": text[:100],
+        "historyId": str(1000 + index),
+        "internalDate": str(1719824400000 + index * 1000),
+        "sizeEstimate": len(text) + len(html),
+        "payload": {
+            "partId": "",
+            "mimeType": "multipart/alternative",
+            "filename": "",
+            "headers": headers,
+            "body": {"size": 0},
+            "parts": [
+                {"partId": "0", "mimeType": "text/plain", "filename": "",
+                 "headers": [{"name": "Content-Type", "value": "text/plain; charset=utf-8"}],
+                 "body": {"size": len(text), "data": b64url(text)}},
+                {"partId": "1", "mimeType": "text/html", "filename": "",
+                 "headers": [{"name": "Content-Type", "value": "text/html; charset=utf-8"}],
+                 "body": {"size": len(html), "data": b64url(html)}},
+            ],
+        },
+    }
+
+
+def shape_message(message: dict, fmt: str, metadata_headers=None) -> dict:
+    """Trim a full message resource to what messages.get returns for a format."""
+    result = {key: message[key] for key in ("id", "threadId", "labelIds", "snippet", "historyId",
+                                              "internalDate", "sizeEstimate")}
+    if fmt == "full":
+        result["payload"] = message["payload"]
+    elif fmt == "metadata":
+        wanted = {name.lower() for name in metadata_headers or []}
+        headers = message["payload"]["headers"]
+        result["payload"] = {"headers": [h for h in headers if not wanted or h["name"].lower() in wanted]}
+    elif fmt == "raw":
+        result["raw"] = b64url(json.dumps(message["payload"]))
+    return result
+
+
+class FakeGmail:
+    """Mailbox state and request dispatch, independent of the HTTP layer."""
+
+    def __init__(self, messages: int = 500, body_size: int = 2000):
+        self.messages = [make_message(i, body_size) for i in range(messages)]
+        self.by_id = {message["id"]: message for message in self.messages}
+        self.history_id = 1000 + messages
+        self.drafts = itertools.count(1)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def handle(self, method: str, target: str, body: bytes):
+        """Returns (status, JSON-able payload)."""
+        url = urlparse(target)
+        query = parse_qs(url.query)
+        match = USER_PATH.match(url.path)
+        if match is None:
+            return 404, {"error": {"code": 404, "message": "not found"}}
+        parts = match.group("rest").strip("/").split("/")
+        with self._lock:
+            self.calls[f"{method} {parts[0]}"] += 1
+
+        if parts == ["profile"]:
+            return 200, {"emailAddress": "me@example.com", "messagesTotal": len(self.messages),
+                         "threadsTotal": len(self.messages) // 3, "historyId": str(self.history_id)}
+        if parts == ["messages"] and method == "GET":
+            return 200, self.list_messages(query)
+        if len(parts) == 2 and parts[0] == "messages" and method == "GET":
+            message = self.by_id.get(parts[1])
+            if message is None:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            return 200, shape_message(message, query.get("format", ["full"])[0], query.get("metadataHeaders"))
+        if len(parts) == 4 and parts[0] == "messages" and parts[2] == "attachments":
+            return 200, {"size": 1024, "data": b64url("x" * 1024)}
+        if parts == ["drafts"] and method == "POST":
+            draft_id = f"r{next(self.drafts)}"
+            return 200, {"id": draft_id, "message": {"id": f"d{draft_id}", "labelIds": ["DRAFT"]}}
+        if parts == ["history"]:
+            return 200, {"historyId": str(self.history_id)}
+        if parts == ["watch"]:
+            return 200, {"historyId": str(self.history_id), "expiration": str(int(time.time() * 1000) + 7 * 86400000)}
+        if parts == ["stop"]:
+            return 204, None
+        return 404, {"error": {"code": 404, "message": f"unsupported: {method} {url.path}"}}
+
+    def list_messages(self, query: dict) -> dict:
+        matches = self.messages
+        label_ids = query.get("labelIds", [])
+        q = query.get("q", [""])[0]
+        if "is:unread" in q:
+            label_ids = [*label_ids, "UNREAD"]
+        if label_ids:
+            matches = [m for m in matches if all(label in m["labelIds"] for label in label_ids)]
+        start = int(query.get("pageToken", ["0"])[0])
+        size = min(int(query.get("maxResults", ["100"])[0]), 500)
+        page = matches[start:start + size]
+        result = {"messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+                  "resultSizeEstimate": len(matches)}
+        if start + size < len(matches):
+            result["nextPageToken"] = str(start + size)
+        return result
+
+
+def parse_batch(body: bytes, content_type: str):
+    """Split a multipart/mixed batch body into (content_id, method, target, body) requests."""
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1).encode()
+    requests = []
+    for part in body.split(b"--" + boundary):
+        part = part.strip(b"\r\n")
+        if not part or part == b"--":
+            continue
+        outer_headers, _, inner = part.replace(b"\r\n", b"\n").partition(b"\n\n")
+        content_id = re.search(rb"Content-ID:\s*<([^>]+)>", outer_headers, re.IGNORECASE)
+        request_line, _, rest = inner.partition(b"\n")
+        method, target, _ = request_line.decode().split(" ", 2)
+        _, _, request_body = rest.partition(b"\n\n")
+        requests.append((content_id.group(1).decode() if content_id else "", method, target, request_body))
+    return requests
+
+
+def render_batch(responses, boundary: str = "batch_fake_gmail") -> bytes:
+    chunks = []
+    for content_id, status, payload in responses:
+        body = "" if payload is None else json.dumps(payload)
+        chunks.append(
+            f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} OK\r\nContent-Type: application/json; charset=UTF-8\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n{body}\r\n"
+        )
+    chunks.append(f"--{boundary}--\r\n")
+    return "".join(chunks).encode()
+
+
+class FakeGmailServer:
+    """Threaded HTTP front end for FakeGmail.
+
+    Args:
+        messages (int): Size of the synthetic mailbox.
+        latency (float): Seconds added to every HTTP request, to mimic the network.
+        port (int): 0 picks a free port.
+    """
+
+    def __init__(self, messages: int = 500, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0,
+                 body_size: int = 2000):
+        gmail = self.gmail = FakeGmail(messages, body_size)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, body: bytes, content_type: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method: str):
+                if latency:
+                    time.sleep(latency)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                path = urlparse(self.path).path
+                if path == "/_stats":
+                    self._reply(200, json.dumps(dict(gmail.calls)).encode())
+                elif path in BATCH_PATHS:
+                    responses = [(cid, *gmail.handle(m, target, b))
+                                 for cid, m, target, b in parse_batch(body, self.headers["Content-Type"])]
+                    self._reply(200, render_batch(responses), 'multipart/mixed; boundary="batch_fake_gmail"')
+                else:
+                    status, payload = gmail.handle(method, self.path, body)
+                    self._reply(status, b"" if payload is None else json.dumps(payload).encode())
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FakeGmailServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-gmail", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the fake Gmail API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeGmailServer(args.messages, args.latency_ms / 1000, port=args.port)
+    print(f"Fake Gmail listening on {server.url}")
+    server._server.serve_forever()
@@ -0,0 +1,267 @@
+"""
+Startup and per-tool latency benchmarks for the MCP servers, over stdio.
+
+Each server is spawned the way an MCP client would, in a scratch directory
+with a synthetic prompts.json and a dummy token, and with Gmail calls sent to
+the in-process fake Gmail API (benchmarks/fake_gmail_server.py). Reported
+per server: cold start (spawn -> initialize), time to first tool result and
+peak RSS; per tool: first-call latency, p50/p99/mean over sequential calls
+and throughput under concurrent calls. Results are printed and written as
+JSON; pass --baseline to diff against an earlier run.
+
+    python benchmarks/mcp_servers.py --output bench.json
+    python benchmarks/mcp_servers.py --output new.json --baseline bench.json
+
+Embedding settings (EMBEDDING_BACKEND, EMBEDDING_MODEL, ...) are passed
+through to the servers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_gmail_server import FakeGmailServer  # noqa: E402
+
+QUERY = "Request of leave for 2 days"
+
+# Tools exercised per server, with their arguments
+SERVERS = {
+    "gmail_server": {
+        "script": "gmail_server.py",
+        "tools": {
+            "prompt_templates": {"query": QUERY},
+            "get_unread_emails_after_date": {"user_id": "me", "after_date": "2024/01/01", "max_results": 50},
+            "gmail_create_draft": {"to": "bench@example.com", "subject": "Benchmark", "body": "Hello"},
+        },
+    },
+    "duplicate_server": {
+        "script": "duplicate_server.py",
+        "tools": {
+            "vector_search_email": {"query": QUERY, "k": 3},
+            "gmail_create_draft": {"to": "bench@example.com", "subject": "Benchmark", "body": "Hello"},
+        },
+    },
+}
+# Cheap tool both servers have, used for time-to-first-tool
+FIRST_TOOL = ("gmail_get_status", {})
+
+PASSTHROUGH_ENV = ("EMBEDDING_", "VECTOR_INDEX_", "HF_", "TRANSFORMERS_", "OMP_", "TELEMETRY_")
+
+CATEGORIES = ["leave", "meeting", "follow-up", "complaint", "gratitude", "application", "apology",
+              "invoice", "reminder", "introduction"]
+
+
+def write_workspace(directory: str, templates: int):
+    """Synthetic prompts.json and a token.json the fake Gmail accepts."""
+    os.makedirs(os.path.join(directory, "templates"), exist_ok=True)
+    prompts = [
+        {
+            "prompt": f"Write a {category} email, variant {i}, to {{{{recipient}}}} about {{{{topic}}}}.",
+            "category": category,
+            "template type": "formal" if i % 2 else "informal",
+            "purpose of mail": f"{category} {i}",
+        }
+        for i in range(templates)
+        for category in [CATEGORIES[i % len(CATEGORIES)]]
+    ]
+    with open(os.path.join(directory, "templates", "prompts.json"), "w", encoding="utf-8") as file:
+        json.dump({"prompts": prompts}, file)
+
+    expiry = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    with open(os.path.join(directory, "token.json"), "w", encoding="utf-8") as file:
+        json.dump({"token": "fake", "refresh_token": "fake", "client_id": "fake", "client_secret": "fake",
+                   "token_uri": "https://oauth2.googleapis.com/token", "expiry": expiry}, file)
+
+
+def server_env(gmail_url: str) -> dict:
+    env = {key: value for key, value in os.environ.items() if key.startswith(PASSTHROUGH_ENV)}
+    env.update({
+        "GMAIL_API_ENDPOINT": gmail_url,
+        "TEMPLATES_WATCH_INTERVAL": "0",
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def child_peak_rss_mb(module: str):
+    """Peak RSS (VmHWM) of our child process running module, Linux only."""
+    for pid in filter(str.isdigit, os.listdir("/proc") if os.path.isdir("/proc") else []):
+        try:
+            with open(f"/proc/{pid}/status", encoding="utf-8") as file:
+                status = dict(line.split(":", 1) for line in file if ":" in line)
+            with open(f"/proc/{pid}/cmdline", "rb") as file:
+                cmdline = file.read().decode(errors="replace")
+        except OSError:
+            continue
+        if int(status["PPid"]) == os.getpid() and module in cmdline:
+            return int(status["VmHWM"].split()[0]) / 1024
+    return None
+
+
+def is_error(result) -> bool:
+    if result.isError:
+        return True
+    text = next((item.text for item in result.content if getattr(item, "text", None)), "")
+    return text.lstrip().startswith(("Error", "❌", "Status: Error"))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def bench_tool(session, name, arguments, iterations, concurrency, total):
+    start = time.perf_counter()
+    first = await session.call_tool(name, arguments)
+    first_ms = (time.perf_counter() - start) * 1000
+    errors = int(is_error(first))
+    error_sample = first.content[0].text[:200] if errors and first.content else None
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = await session.call_tool(name, arguments)
+        latencies.append((time.perf_counter() - start) * 1000)
+        errors += is_error(result)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            return await session.call_tool(name, arguments)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(call() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    errors += sum(map(is_error, results))
+
+    return {
+        "first_call_ms": first_ms,
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+        "mean_ms": statistics.fmean(latencies),
+        "min_ms": min(latencies),
+        "throughput_per_s": total / elapsed if elapsed else None,
+        "concurrency": concurrency,
+        "calls": 1 + iterations + total,
+        "errors": errors,
+        "error_sample": error_sample,
+    }
+
+
+async def bench_server(name, spec, workspace, gmail_url, args):
+    # Import the module and run its FastMCP app, rather than executing the script:
+    # duplicate_server.py's __main__ is a self-test that prints to stdout and exits
+    module = os.path.splitext(spec["script"])[0]
+    launcher = f"import sys; sys.path.insert(0, {ROOT!r}); import {module}; {module}.mcp.run(transport='stdio')"
+    parameters = StdioServerParameters(
+        command=sys.executable,
+        args=["-c", launcher],
+        env=server_env(gmail_url),
+        cwd=workspace,
+    )
+    report = {"script": spec["script"], "tools": {}}
+    spawned = time.perf_counter()
+    with open(os.path.join(workspace, f"{name}.stderr.log"), "w") as errlog:
+        async with stdio_client(parameters, errlog=errlog) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                report["cold_start_ms"] = (time.perf_counter() - spawned) * 1000
+                await session.call_tool(*FIRST_TOOL)
+                report["time_to_first_tool_ms"] = (time.perf_counter() - spawned) * 1000
+                for tool, arguments in spec["tools"].items():
+                    report["tools"][tool] = await bench_tool(
+                        session, tool, arguments, args.iterations, args.concurrency, args.throughput_calls
+                    )
+                report["peak_rss_mb"] = child_peak_rss_mb(f"import {module};")
+    return report
+
+
+def compare(current: dict, baseline: dict):
+    print("\nChange vs baseline (positive = slower):")
+    for server, report in current["servers"].items():
+        before = baseline.get("servers", {}).get(server)
+        if not before or "error" in report or "error" in before:
+            continue
+        for key in ("cold_start_ms", "time_to_first_tool_ms"):
+            if before.get(key):
+                print(f"  {server:<17} {key:<28} {100 * (report[key] / before[key] - 1):+7.1f}%")
+        for tool, stats in report["tools"].items():
+            old = before["tools"].get(tool)
+            if not old:
+                continue
+            for key in ("p50_ms", "p99_ms"):
+                print(f"  {server:<17} {tool + ' ' + key:<28} {100 * (stats[key] / old[key] - 1):+7.1f}%")
+
+
+def print_report(results: dict):
+    for server, report in results["servers"].items():
+        if "error" in report:
+            print(f"{server}: failed: {report['error']}")
+            continue
+        print(f"{server}: cold start {report['cold_start_ms']:.0f} ms, first tool "
+              f"{report['time_to_first_tool_ms']:.0f} ms, peak RSS {report['peak_rss_mb'] or 0:.0f} MB")
+        for tool, stats in report["tools"].items():
+            print(f"  {tool:<30} first {stats['first_call_ms']:8.1f} ms  p50 {stats['p50_ms']:7.2f} ms  "
+                  f"p99 {stats['p99_ms']:7.2f} ms  {stats['throughput_per_s']:7.1f}/s  errors {stats['errors']}")
+
+
+async def main(args):
+    gmail = FakeGmailServer(messages=args.messages, latency=args.gmail_latency_ms / 1000).start()
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "servers": {},
+    }
+    try:
+        with tempfile.TemporaryDirectory(prefix="mcp-bench-") as workspace:
+            write_workspace(workspace, args.templates)
+            for name in args.servers:
+                try:
+                    results["servers"][name] = await bench_server(name, SERVERS[name], workspace, gmail.url, args)
+                except Exception as error:
+                    log_path = os.path.join(workspace, f"{name}.stderr.log")
+                    stderr = open(log_path).read().strip().splitlines()[-1:] if os.path.exists(log_path) else []
+                    results["servers"][name] = {"error": f"{error!r} {' '.join(stderr)}".strip()}
+        results["gmail_api_calls"] = dict(gmail.gmail.calls)
+    finally:
+        gmail.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    parser.add_argument("--iterations", type=int, default=50, help="Sequential calls per tool")
+    parser.add_argument("--throughput-calls", type=int, default=100, help="Calls per tool in the throughput run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--templates", type=int, default=200, help="Synthetic templates in prompts.json")
+    parser.add_argument("--messages", type=int, default=500, help="Messages in the fake mailbox")
+    parser.add_argument("--gmail-latency-ms", type=float, default=0.0, help="Added to every fake Gmail request")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            compare(results, json.load(file))
@@ -0,0 +1,137 @@
+"""
+Template variable lookup, category lookup and placeholder rendering:
+per-call regex parsing and list scans vs templates compiled once (template_index).
+
+Runs over a synthetic corpus (10k templates by default) shaped like
+duplicate_server's email_templates, checks both paths give the same
+answers, and prints operations per second for each.
+
+    python benchmarks/template_render.py --templates 10000 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from template_index import TemplateIndex  # noqa: E402
+
+PLACEHOLDER = re.compile(r'\{\{(\w+)\}\}')
+
+WORDS = ("please", "write", "email", "about", "regarding", "polite", "formal", "the", "for", "to", "with",
+         "meeting", "project", "invoice", "deadline", "update", "request", "team", "client", "schedule")
+VARIABLES = ("recipient", "date", "topic", "project_name", "manager", "reason", "amount", "deadline",
+             "company", "position", "event", "product")
+
+
+def make_corpus(count: int, categories: int, seed: int = 0):
+    rng = random.Random(seed)
+    templates = []
+    for i in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 40))]
+        for _ in range(rng.randint(0, 5)):
+            words.insert(rng.randrange(len(words) + 1), "{{" + rng.choice(VARIABLES) + "}}")
+        templates.append({
+            "template": " ".join(words) + ".",
+            "category": f"Category{i % categories}",
+            "keywords": [],
+            "description": "",
+        })
+    return templates
+
+
+# The per-call implementations the index replaces
+
+def regex_variables(text):
+    return list(dict.fromkeys(PLACEHOLDER.findall(text)))
+
+
+def scan_categories(templates):
+    return sorted({template["category"] for template in templates})
+
+
+def scan_category(templates, category):
+    return [i for i, template in enumerate(templates) if template["category"].lower() == category.lower()]
+
+
+def regex_render(text, values):
+    return PLACEHOLDER.sub(lambda match: str(values.get(match.group(1), match.group(0))), text)
+
+
+def rate(function, repeat: int):
+    """Calls per second of function() over `repeat` calls."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return repeat / (time.perf_counter() - start)
+
+
+def run(args):
+    templates = make_corpus(args.templates, args.categories)
+    rng = random.Random(1)
+    values = {name: f"<{name}>" for name in VARIABLES[::2]}
+    sample = [rng.randrange(len(templates)) for _ in range(args.lookups)]
+    category_queries = [f"category{rng.randrange(args.categories)}" for _ in range(50)]
+
+    start = time.perf_counter()
+    index = TemplateIndex(templates)
+    compile_seconds = time.perf_counter() - start
+
+    for i in sample[:500]:
+        text = templates[i]["template"]
+        assert list(index[i].variables) == regex_variables(text)
+        assert index[i].render(values) == regex_render(text, values)
+    assert index.categories == scan_categories(templates)
+    assert [t.template_id for t in index.by_category("category3")] == scan_category(templates, "category3")
+
+    # Both sides iterate a plain list, so only the per-template work is compared
+    texts = [templates[i]["template"] for i in sample]
+    compiled = [index[i] for i in sample]
+    results = {
+        "templates": args.templates,
+        "categories": args.categories,
+        "compile_seconds": compile_seconds,
+        "variables_per_s": {
+            "regex": rate(lambda: [regex_variables(text) for text in texts], 1) * len(texts),
+            "compiled": rate(lambda: [template.variables for template in compiled], 1) * len(compiled),
+        },
+        "render_per_s": {
+            "regex": rate(lambda: [regex_render(text, values) for text in texts], 1) * len(texts),
+            "compiled": rate(lambda: [template.render(values) for template in compiled], 1) * len(compiled),
+        },
+        "list_categories_per_s": {
+            "scan": rate(lambda: scan_categories(templates), args.category_calls),
+            "compiled": rate(lambda: list(index.categories), args.category_calls),
+        },
+        "category_lookup_per_s": {
+            "scan": rate(lambda: [scan_category(templates, c) for c in category_queries],
+                         max(1, args.category_calls // 50)) * len(category_queries),
+            "compiled": rate(lambda: [index.by_category(c) for c in category_queries],
+                             args.category_calls) * len(category_queries),
+        },
+    }
+
+    print(f"{args.templates} templates, {args.categories} categories, compiled in {compile_seconds * 1000:.1f} ms")
+    for name, rates in results.items():
+        if not isinstance(rates, dict):
+            continue
+        before, after = rates.values()
+        print(f"  {name:<24} {before:14,.0f} -> {after:14,.0f}  ({after / before:6.1f}x)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--templates", type=int, default=10000)
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--lookups", type=int, default=100000, help="Variable lookups and renders per run")
+    parser.add_argument("--category-calls", type=int, default=200)
+    parser.add_argument("--json", help="Also write the results to this file")
+    run(parser.parse_args())
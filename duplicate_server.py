@@ -1,29 +1,26 @@
-from typing import Any
+import asyncio
 import httpx
 from mcp.server.fastmcp import FastMCP
 
 import os
-import base64
-from email.message import EmailMessage
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+import telemetry
+from embedding_cache import CachedEmbeddings, LRUCache, normalize_query
+from accounts import get_account
+from executors import run_cpu, stats as pool_stats
+from gmail_async import BULK_DRAFT_CONCURRENCY, create_drafts_bulk, failed_drafts
+from template_index import TemplateIndex, compile_template
+from vector_db import batch_similarity_search_with_score, template_ids
 
-from typing import List, TypedDict, Any, Optional, Tuple
+from typing import List, Awaitable, Optional, Tuple
+# pydantic (used by FastMCP for tool schemas) needs typing_extensions.TypedDict before 3.12
+from typing_extensions import TypedDict
 
-from langchain_core.tools import tool
-from langgraph.prebuilt import ToolNode
-from uuid import uuid4
 from langchain_core.documents import Document
-from langchain_core.vectorstores import VectorStore
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_core.embeddings import Embeddings
-import re
-from langchain_openai import OpenAIEmbeddings
+import threading
+import time
+from contextlib import asynccontextmanager
 
 email_templates = [
     {
@@ -136,32 +133,42 @@ email_templates = [
     }
 ]
 
-SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+# Placeholders and the category index are parsed once here, not per request
+template_index = TemplateIndex(email_templates)
 
-mcp = FastMCP("gmail")
 import os
 from dotenv import load_dotenv
 
 load_dotenv()  # ✅ Correct function to load .env file
 
-# Optionally, set it in os.environ again (not required if using os.getenv)
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+# Smaller model than vector_db's; EMBEDDING_MODEL / EMBEDDING_BACKEND override it
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
 class EmailTemplateVectorSearch:
     """Vector search system for email templates"""
     
-    def __init__(self, embedding_model: Optional[Embeddings] = None):
-        # Initialize embeddings model
+    def __init__(self, embedding_model: Optional[Embeddings] = None, index_config=None):
+        # Imported here so the server starts without loading the embedding stack
+        from embedding_backends import EmbeddingConfig, load_embeddings
+        from faiss_index import IndexConfig, build_index, make_vector_store
+
+        # Initialize embeddings model (torch, onnx or onnx-int8, see EmbeddingConfig)
         if embedding_model is None:
-            self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        else:
-            self.embeddings = embedding_model
+            embedding_model = load_embeddings(EmbeddingConfig.from_env(EMBEDDING_MODEL))
+        # Repeated queries skip the model (embeddings) and the search (results)
+        self.embeddings = CachedEmbeddings(embedding_model)
+        self.result_cache = LRUCache(name="search_results")
         
         # Create documents for vector search
         self.documents = self._create_documents()
         
-        # Initialize vector store
-        self.vector_store = FAISS.from_documents(self.documents, self.embeddings)
+        # Initialize vector store (cosine similarity over normalized vectors)
+        if index_config is None:
+            index_config = IndexConfig.from_env()
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in self.documents])
+        index = build_index(vectors, len(vectors[0]), index_config)
+        ids, _ = template_ids(email_templates)
+        self.vector_store = make_vector_store(self.embeddings, index, self.documents, ids)
         
     def _create_documents(self) -> List[Document]:
         """Create Document objects for vector search"""
@@ -192,8 +199,33 @@ class EmailTemplateVectorSearch:
     
     def search_templates(self, query: str, k: int = 3) -> List[Tuple[Document, float]]:
         """Search for relevant email templates using vector similarity"""
-        results = self.vector_store.similarity_search_with_score(query, k=k)
+        from faiss_index import search_store
+
+        return self.result_cache.get_or_compute(
+            (normalize_query(query), k),
+            lambda: search_store(self.vector_store, query, k),
+        )
+
+    def batch_search_templates(self, queries: List[str], k: int = 3) -> List[List[Tuple[Document, float]]]:
+        """Search for many queries with one embedding call and one FAISS search"""
+        keys = [(normalize_query(query), k) for query in queries]
+        results = [self.result_cache.get(key) for key in keys]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            found = batch_similarity_search_with_score(
+                self.vector_store, [queries[i] for i in pending], k=k
+            )
+            for i, hits in zip(pending, found):
+                results[i] = hits
+                self.result_cache.put(keys[i], hits)
         return results
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters for the query embedding and search result caches"""
+        return {
+            "query_embeddings": self.embeddings.cache.stats(),
+            "search_results": self.result_cache.stats(),
+        }
     
     def get_best_template(self, query: str) -> Tuple[int, str, float]:
         """Get the best matching template for a query"""
@@ -203,35 +235,34 @@ class EmailTemplateVectorSearch:
             template_id = doc.metadata['template_id']
             template = doc.metadata['template']
             return template_id, template, score
-        return -1, "", 1.0
+        return -1, "", 0.0
 
 def extract_variables(template: str) -> List[str]:
-    """Extract variable names from a template"""
-    variables = re.findall(r'\{\{(\w+)\}\}', template)
-    return list(set(variables))
-
-def get_service():
-    """Get Gmail service with authentication"""
-    creds = None
-
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-            creds = flow.run_local_server(port=0)
-
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
-
-    service = build("gmail", "v1", credentials=creds)
-    return service
-
-# Initialize the vector search system
-email_vector_search = EmailTemplateVectorSearch()
+    """Extract variable names from a template, in order of first appearance"""
+    return list(compile_template(template).variables)
+
+# The vector search system is built on first use (or by the optional warm-up)
+_email_vector_search: Optional[EmailTemplateVectorSearch] = None
+_email_vector_search_lock = threading.Lock()
+
+def get_email_vector_search() -> EmailTemplateVectorSearch:
+    """Get the shared vector search system, building it on first use"""
+    global _email_vector_search
+    if _email_vector_search is None:
+        with _email_vector_search_lock:
+            if _email_vector_search is None:
+                _email_vector_search = EmailTemplateVectorSearch()
+    return _email_vector_search
+
+@asynccontextmanager
+async def lifespan(server):
+    # Opt-in: build the vector search system while the client handshakes
+    if os.getenv("EMBEDDINGS_WARMUP"):
+        threading.Thread(target=get_email_vector_search, name="vector-search-warmup", daemon=True).start()
+    yield {}
+
+mcp = FastMCP("gmail", lifespan=lifespan)
+telemetry.instrument(mcp, "duplicate_server")
 
 class EmailTemplateResult(TypedDict):
     """Type definition for email template search results"""
@@ -244,7 +275,7 @@ class EmailTemplateResult(TypedDict):
     variables: List[str]
 
 @mcp.tool()
-def vector_search_email(query: str, k: int = 3) -> List[EmailTemplateResult]:
+async def vector_search_email(query: str, k: int = 3) -> List[EmailTemplateResult]:
     """
     Vector search for email templates based on natural language query.
     
@@ -256,37 +287,62 @@ def vector_search_email(query: str, k: int = 3) -> List[EmailTemplateResult]:
         List of matching email templates with metadata and similarity scores
     """
     try:
-        results = email_vector_search.search_templates(query, k=k)
-        
-        template_results = []
-        for doc, score in results:
-            template_result: EmailTemplateResult = {
-                "template": doc.metadata['template'],
-                "category": doc.metadata['category'],
-                "keywords": doc.metadata['keywords'],
-                "description": doc.metadata['description'],
-                "similarity_score": 1 - score,  # Convert distance to similarity
-                "template_id": doc.metadata['template_id'],
-                "variables": extract_variables(doc.metadata['template'])
-            }
-            template_results.append(template_result)
-        
-        return template_results
+        # Model loading, embedding and FAISS run in the CPU pool, never on the event loop
+        results = await run_cpu(lambda: get_email_vector_search().search_templates(query, k=k))
+        return [to_template_result(doc, score) for doc, score in results]
     
     except Exception as e:
         # Return empty list with error information
-        return [{
-            "template": f"Error: {str(e)}",
-            "category": "error",
-            "keywords": [],
-            "description": "An error occurred during search",
-            "similarity_score": 0.0,
-            "template_id": -1,
-            "variables": []
-        }]
+        return [search_error_result(e)]
 
 @mcp.tool()
-def generate_email_content(query: str, variables: dict = None) -> str:
+async def batch_vector_search(queries: List[str], k: int = 3) -> List[List[EmailTemplateResult]]:
+    """
+    Vector search for email templates for many queries at once.
+    
+    All queries are embedded in one model call and searched in one FAISS
+    lookup, so classifying a batch of emails scales with batch size rather
+    than call count.
+    
+    Args:
+        queries: Natural language descriptions, e.g. one per incoming email
+        k: Number of results to return per query (default: 3)
+    
+    Returns:
+        One list of matching email templates per query, in query order
+    """
+    try:
+        batches = await run_cpu(lambda: get_email_vector_search().batch_search_templates(queries, k=k))
+        return [[to_template_result(doc, score) for doc, score in results] for results in batches]
+    
+    except Exception as e:
+        return [[search_error_result(e)] for _ in queries]
+
+def to_template_result(doc: Document, score: float) -> EmailTemplateResult:
+    """Convert a search hit into an EmailTemplateResult"""
+    return {
+        "template": doc.metadata['template'],
+        "category": doc.metadata['category'],
+        "keywords": doc.metadata['keywords'],
+        "description": doc.metadata['description'],
+        "similarity_score": score,  # Cosine similarity
+        "template_id": doc.metadata['template_id'],
+        "variables": list(template_index[doc.metadata['template_id']].variables)
+    }
+
+def search_error_result(e: Exception) -> EmailTemplateResult:
+    return {
+        "template": f"Error: {str(e)}",
+        "category": "error",
+        "keywords": [],
+        "description": "An error occurred during search",
+        "similarity_score": 0.0,
+        "template_id": -1,
+        "variables": []
+    }
+
+@mcp.tool()
+async def generate_email_content(query: str, variables: dict = None) -> str:
     """
     Generate email content using the best matching template and LLM.
     
@@ -302,24 +358,27 @@ def generate_email_content(query: str, variables: dict = None) -> str:
     
     try:
         # Get the best matching template
-        template_id, template, score = email_vector_search.get_best_template(query)
+        template_id, template, score = await run_cpu(lambda: get_email_vector_search().get_best_template(query))
         
         if template_id == -1:
             return "No suitable template found for your query."
         
-        # Get template metadata
-        template_data = email_templates[template_id]
-        required_vars = extract_variables(template)
-        
-        # Create the prompt for LLM
-        prompt = f"""
+        compiled = template_index[template_id]
+        return build_email_prompt(query, compiled.data, list(compiled.variables), variables)
+    
+    except Exception as e:
+        return f"Error generating email: {str(e)}"
+
+def build_email_prompt(query: str, template_data: dict, required_vars: List[str], variables: dict) -> str:
+    """Create the LLM prompt for writing an email from an already matched template"""
+    return f"""
         Based on the following email template and user requirements, generate a professional email:
         
         Template Category: {template_data['category']}
         Template Description: {template_data['description']}
         User Query: {query}
         
-        Email Template: {template}
+        Email Template: {template_data['template']}
         
         Required Variables:
         {chr(10).join([f"- {var}: {variables.get(var, '[PLEASE PROVIDE]')}" for var in required_vars])}
@@ -331,14 +390,9 @@ def generate_email_content(query: str, variables: dict = None) -> str:
         3. Fill in any missing variables with reasonable placeholders
         4. Make the content specific and actionable
         """
-        
-        return prompt
-    
-    except Exception as e:
-        return f"Error generating email: {str(e)}"
 
 @mcp.tool()
-def gmail_create_draft(to: str, subject: str, body: str) -> str:
+async def gmail_create_draft(to: str, subject: str, body: str, account: Optional[str] = None) -> str:
     """
     Create a Gmail draft with the specified content.
     
@@ -346,33 +400,53 @@ def gmail_create_draft(to: str, subject: str, body: str) -> str:
         to: Recipient email address
         subject: Email subject line
         body: Email body content
+        account: Account to create the draft in; the default account if omitted
     
     Returns:
         Success message with draft ID or error message
     """
     try:
-        service = get_service()
-
-        message = EmailMessage()
-        message.set_content(body)
-        message["To"] = to
-        message["From"] = "me"
-        message["Subject"] = subject
-
-        encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        create_message = {"message": {"raw": encoded_message}}
+        client = get_account(account).client
+    except ValueError as error:
+        return f"❌ An error occurred: {error}"
+    return await draft_result(client.create_draft(to, subject, body))
 
-        draft = service.users().drafts().create(userId="me", body=create_message).execute()
+async def draft_result(upload: Awaitable[dict]) -> str:
+    """Wait for a draft upload (coroutine or running task) and describe the outcome"""
+    try:
+        draft = await upload
 
         return f"✅ Draft created successfully! Draft ID: {draft['id']}"
     
-    except HttpError as error:
+    except httpx.HTTPStatusError as error:
         return f"❌ Gmail API error: {error}"
     except Exception as error:
         return f"❌ An error occurred: {error}"
 
 @mcp.tool()
-def create_email_draft_from_query(query: str, to: str, variables: dict = None) -> str:
+async def gmail_create_drafts_bulk(items: List[dict], concurrency: int = BULK_DRAFT_CONCURRENCY,
+                                   account: Optional[str] = None) -> List[dict]:
+    """
+    Create many Gmail drafts concurrently.
+    
+    Args:
+        items: Each has 'to', 'subject', 'body' and optional 'variables'
+            used to fill {{name}} placeholders in the subject and body
+        concurrency: Maximum number of drafts uploaded at the same time
+        account: Account to create the drafts in; the default account if omitted
+    
+    Returns:
+        Per-item results with 'index', 'to', 'success' and 'draft_id' or 'error'
+    """
+    try:
+        client = get_account(account).client
+    except ValueError as error:
+        return failed_drafts(items, error)
+    return await create_drafts_bulk(items, concurrency=concurrency, client=client)
+
+@mcp.tool()
+async def create_email_draft_from_query(query: str, to: str, variables: dict = None,
+                                        account: Optional[str] = None) -> str:
     """
     Complete workflow: Search template, generate content, and create Gmail draft.
     
@@ -380,6 +454,7 @@ def create_email_draft_from_query(query: str, to: str, variables: dict = None) -
         query: Natural language description of email needed
         to: Recipient email address
         variables: Dictionary of template variables
+        account: Account to create the draft in; the default account if omitted
     
     Returns:
         Status message with draft creation result
@@ -387,27 +462,40 @@ def create_email_draft_from_query(query: str, to: str, variables: dict = None) -
     if variables is None:
         variables = {}
     
+    timings = {}
+    started = stage_start = time.perf_counter()
+
+    def stage_done(name):
+        nonlocal stage_start
+        now = time.perf_counter()
+        timings[name] = (now - stage_start) * 1000
+        stage_start = now
+
+    upload = None
     try:
-        # Step 1: Find best template
-        template_id, template, score = email_vector_search.get_best_template(query)
-        
-        if template_id == -1:
+        client = get_account(account).client
+
+        # Stage 1: find the best template; its one embedding call and FAISS lookup run in the CPU pool
+        hits = await run_cpu(lambda: get_email_vector_search().search_templates(query, 1))
+        stage_done("search")
+        if not hits:
             return "❌ No suitable template found for your query."
+        doc, score = hits[0]
+        compiled = template_index[doc.metadata['template_id']]
+        template_data = compiled.data
+        required_vars = list(compiled.variables)
         
-        # Step 2: Generate email prompt for LLM
-        email_prompt = generate_email_content(query, variables)
-        
-        # Step 3: Extract subject from query or use default
-        template_data = email_templates[template_id]
+        # Stage 2: build the LLM prompt, subject and draft body from the matched template
+        email_prompt = build_email_prompt(query, template_data, required_vars, variables)
         default_subject = f"{template_data['category'].title()} - {query[:50]}..."
         subject = variables.get('subject', default_subject)
         
-        # Step 4: Create draft (using the prompt as body for now)
+        # Using the prompt as body for now
         # In a real implementation, you'd send this prompt to an LLM to generate the actual email
         draft_body = f"""
 [AI-Generated Email Draft]
 
-Template Used: {template_data['category']} (Similarity: {1-score:.3f})
+Template Used: {template_data['category']} (Similarity: {score:.3f})
 Query: {query}
 
 {email_prompt}
@@ -415,22 +503,40 @@ Query: {query}
 ---
 This draft was created using AI email templates. Please review and edit before sending.
         """
-        
-        result = gmail_create_draft(to, subject, draft_body)
-        
-        return f"""
+        stage_done("prompt")
+
+        # Stage 3: start the upload, and let it send its request before formatting
+        # the report, so the formatting overlaps the drafts.create round trip
+        upload_started = time.perf_counter()
+        upload = asyncio.create_task(client.create_draft(to, subject, draft_body))
+        await asyncio.sleep(0)
+        report = f"""
 📧 Email Draft Workflow Complete!
 
-Template Match: {template_data['category']} (Similarity: {1-score:.3f})
+Template Match: {template_data['category']} (Similarity: {score:.3f})
 Subject: {subject}
 Recipient: {to}
-Required Variables: {extract_variables(template)}
-
+Required Variables: {required_vars}
+"""
+        stage_done("format")
+        result = await draft_result(upload)
+        # Upload time includes the overlapped formatting
+        timings["draft"] = (time.perf_counter() - upload_started) * 1000
+        timings["total"] = (time.perf_counter() - started) * 1000
+
+        stages = " | ".join(f"{name} {ms:.1f}" for name, ms in timings.items())
+        return f"""{report}
 {result}
+
+Stage timings (ms): {stages}
         """
     
     except Exception as e:
         return f"❌ Error in draft creation workflow: {str(e)}"
+    finally:
+        # Only still pending if the workflow failed or was cancelled before awaiting it
+        if upload is not None and not upload.done():
+            upload.cancel()
 
 @mcp.tool()
 def list_template_categories() -> List[str]:
@@ -441,8 +547,7 @@ def list_template_categories() -> List[str]:
         List of unique email categories
     """
     try:
-        categories = list(set(template['category'] for template in email_templates))
-        return sorted(categories)
+        return list(template_index.categories)
     except Exception as e:
         return [f"Error: {str(e)}"]
 
@@ -458,21 +563,18 @@ def get_template_by_category(category: str) -> List[EmailTemplateResult]:
         List of templates in the specified category
     """
     try:
-        category_templates = []
-        for i, template_data in enumerate(email_templates):
-            if template_data['category'].lower() == category.lower():
-                template_result: EmailTemplateResult = {
-                    "template": template_data['template'],
-                    "category": template_data['category'],
-                    "keywords": template_data['keywords'],
-                    "description": template_data['description'],
-                    "similarity_score": 1.0,
-                    "template_id": i,
-                    "variables": extract_variables(template_data['template'])
-                }
-                category_templates.append(template_result)
-        
-        return category_templates
+        return [
+            {
+                "template": compiled.text,
+                "category": compiled.category,
+                "keywords": compiled.data['keywords'],
+                "description": compiled.data['description'],
+                "similarity_score": 1.0,
+                "template_id": compiled.template_id,
+                "variables": list(compiled.variables)
+            }
+            for compiled in template_index.by_category(category)
+        ]
     
     except Exception as e:
         return [{
@@ -486,16 +588,55 @@ def get_template_by_category(category: str) -> List[EmailTemplateResult]:
         }]
 
 @mcp.tool()
-def gmail_get_status() -> str:
+def gmail_quota_stats(account: Optional[str] = None) -> dict:
+    """
+    Get Gmail API scheduler counters of an account.
+    
+    Args:
+        account: Account name; the default account if omitted
+    
+    Returns:
+        Requests, quota units used, retries, failures, throttling and queue depth
+    """
+    return get_account(account).scheduler.stats()
+
+@mcp.tool()
+async def embedding_cache_stats() -> dict:
+    """
+    Get hit/miss counters for the query embedding and search result caches.
+    
+    Returns:
+        Cache statistics keyed by cache name
+    """
+    vector_search = _email_vector_search
+    if vector_search is None:
+        # Nothing searched yet; don't load the model just to report empty caches
+        return {name: LRUCache(name=name).stats() for name in ("query_embeddings", "search_results")}
+    return vector_search.cache_stats()
+
+@mcp.tool()
+def executor_stats() -> dict:
+    """
+    Get worker pool counters; the CPU pool runs embedding and FAISS work.
+    
+    Returns:
+        Per pool workers, queue size, calls in flight and waiting, rejections and totals
+    """
+    return pool_stats()
+
+@mcp.tool()
+async def gmail_get_status(account: Optional[str] = None) -> str:
     """
-    Check Gmail authentication and connection status.
+    Check Gmail authentication and connection status of an account.
+    
+    Args:
+        account: Account name; the default account if omitted
     
     Returns:
         Status message indicating connection state
     """
     try:
-        service = get_service()
-        profile = service.users().getProfile(userId='me').execute()
+        profile = await get_account(account).client.get_profile()
         email = profile['emailAddress']
         return f"✅ Gmail Status: Connected and ready! Authenticated as: {email}"
     except Exception as e:
@@ -506,12 +647,12 @@ if __name__ == "__main__":
     try:
         # Test vector search
         print("Testing vector search...")
-        results = vector_search_email("I need to thank my colleague", k=2)
+        results = asyncio.run(vector_search_email("I need to thank my colleague", k=2))
         print(f"Found {len(results)} templates")
         
         # Test Gmail status
         print("Testing Gmail connection...")
-        status = gmail_get_status()
+        status = asyncio.run(gmail_get_status())
         print(status)
         
     except Exception as e:
@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# "torch" is sentence-transformers on PyTorch; the ONNX backends need only
+# onnxruntime + tokenizers (pip install ".[onnx]"), not torch
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+DEFAULT_BATCH_SIZE = 32
+# sentence-transformers truncates MiniLM/mpnet inputs around this length too
+DEFAULT_MAX_LENGTH = 256
+
+# Downloaded and quantized ONNX models are kept here
+MODELS_DIR = os.getenv("EMBEDDING_MODELS_DIR", "models")
+
+
+class EmbeddingConfig:
+    """Which embedding model to run and how.
+
+    Args:
+        model_name: Hugging Face repo ID (e.g. "sentence-transformers/all-MiniLM-L6-v2")
+            or a local directory. ONNX backends need onnx/model.onnx (or model.onnx)
+            and tokenizer.json in it; the sentence-transformers repos ship both.
+        backend: One of BACKENDS. "onnx-int8" quantizes the ONNX weights to
+            int8 once and caches the result under MODELS_DIR.
+        batch_size: Texts per inference call when embedding documents.
+        max_length: Token limit per text; defaults to the model's own setting.
+        threads: ONNX Runtime intra-op threads; 0 lets it decide.
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch", batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_length: Optional[int] = None, threads: int = 0):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.threads = threads
+
+    @classmethod
+    def from_env(cls, default_model: str) -> "EmbeddingConfig":
+        """Read EMBEDDING_* environment variables, falling back to default_model and torch."""
+        max_length = os.getenv("EMBEDDING_MAX_LENGTH")
+        return cls(
+            model_name=os.getenv("EMBEDDING_MODEL") or default_model,
+            backend=os.getenv("EMBEDDING_BACKEND", "torch").lower(),
+            batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE") or DEFAULT_BATCH_SIZE),
+            max_length=int(max_length) if max_length else None,
+            threads=int(os.getenv("EMBEDDING_THREADS") or 0),
+        )
+
+    def key(self) -> str:
+        """Identifies the vectors this config produces; persisted indexes rebuild when it changes."""
+        if self.backend == "torch":
+            return self.model_name
+        return f"{self.model_name}@{self.backend}"
+
+
+def load_embeddings(config: EmbeddingConfig) -> Embeddings:
+    """Instantiate the configured backend."""
+    if config.backend == "torch":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(model_name=config.model_name)
+    return OnnxEmbeddings(
+        config.model_name,
+        quantized=config.backend == "onnx-int8",
+        batch_size=config.batch_size,
+        max_length=config.max_length,
+        threads=config.threads,
+    )
+
+
+def embedding_dimension(embeddings: Embeddings) -> int:
+    """Output dimension of any backend, without embedding anything when the backend knows it."""
+    dimension = getattr(embeddings, "dimension", None)
+    if dimension:
+        return dimension
+    client = getattr(embeddings, "client", None)
+    if client is not None and hasattr(client, "get_sentence_embedding_dimension"):
+        return client.get_sentence_embedding_dimension()
+    return len(embeddings.embed_query("dimension"))
+
+
+def _model_file(model_name: str, filename: str, required: bool = True) -> Optional[str]:
+    """Path of a model file from a local directory or the Hugging Face Hub cache."""
+    if os.path.isdir(model_name):
+        path = os.path.join(model_name, filename)
+        if os.path.exists(path):
+            return path
+        if required:
+            raise FileNotFoundError(path)
+        return None
+
+    from huggingface_hub import hf_hub_download
+    from huggingface_hub.errors import EntryNotFoundError
+
+    try:
+        return hf_hub_download(model_name, filename)
+    except EntryNotFoundError:
+        if required:
+            raise
+        return None
+
+
+def quantize_model(source: str, target: str):
+    """Dynamically quantize an ONNX model's weights to int8 (activations stay float)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    partial = f"{target}.partial"
+    quantize_dynamic(source, partial, weight_type=QuantType.QInt8)
+    os.replace(partial, target)
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence-transformers style embeddings on ONNX Runtime.
+
+    Tokenizes with the model's fast tokenizer, runs the transformer in ONNX
+    Runtime and applies the same mean pooling + L2 normalization as the
+    sentence-transformers models, so vectors match the torch backend up to
+    numerical (or, with int8, quantization) error. Texts are sorted by length
+    before batching so each batch pads only as far as it needs to.
+    """
+
+    def __init__(self, model_name: str, quantized: bool = False, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_length: Optional[int] = None, threads: int = 0, models_dir: str = MODELS_DIR):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        model_path = (_model_file(model_name, "onnx/model.onnx", required=False)
+                      or _model_file(model_name, "model.onnx"))
+        if quantized:
+            target = os.path.join(models_dir, model_name.strip("/").replace("/", "--"), "model_int8.onnx")
+            if not os.path.exists(target):
+                quantize_model(model_path, target)
+            model_path = target
+
+        if max_length is None:
+            max_length = DEFAULT_MAX_LENGTH
+            config_path = _model_file(model_name, "sentence_bert_config.json", required=False)
+            if config_path:
+                with open(config_path, encoding="utf-8") as file:
+                    max_length = json.load(file).get("max_seq_length", max_length)
+        self.tokenizer = Tokenizer.from_file(_model_file(model_name, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self._dimension = None
+        # InferenceSession.run is thread-safe, the tokenizer's padding state is not
+        self._lock = threading.Lock()
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = self.encode(["dimension"]).shape[1]
+        return self._dimension
+
+    def _run(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        output = self.session.run(None, feeds)[0]
+        if output.ndim == 3:
+            # Mean over real tokens only
+            mask = attention_mask[..., None].astype(output.dtype)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return (output / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a (len(texts), dimension) float32 matrix, in input order."""
+        if not texts:
+            return np.zeros((0, self._dimension or 0), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = None
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            vectors = self._run([texts[i] for i in batch])
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[batch] = vectors
+        self._dimension = result.shape[1]
+        return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+import telemetry
+
+# Default bounds for the query caches
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL: Optional[float] = None
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace so trivially different queries share a cache entry."""
+    return " ".join(text.split())
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry TTL and hit/miss counters.
+
+    ``name`` labels the cache's lookups in telemetry.
+    """
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, ttl: Optional[float] = QUERY_CACHE_TTL,
+                 name: str = "lru"):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    telemetry.record_cache(self.name, hits=1)
+                    return value
+                del self._data[key]
+            self.misses += 1
+        telemetry.record_cache(self.name, misses=1)
+        return default
+
+    def put(self, key: Hashable, value: Any):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        # Computed outside the lock; concurrent misses may both compute
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that memoizes ``embed_query`` in an LRUCache.
+
+    Vector stores call ``embed_query`` for every search, so wrapping their
+    embedding function lets repeated queries skip the model entirely.
+    Document embedding is passed straight through.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: Optional[LRUCache] = None):
+        self.embeddings = embeddings
+        self.cache = cache if cache is not None else LRUCache(name="query_embeddings")
+
+    def _embed_query(self, text: str) -> tuple:
+        with telemetry.span("embed", **{"embed.texts": 1}):
+            return tuple(self.embeddings.embed_query(text))
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get_or_compute(normalize_query(text), lambda: self._embed_query(text))
+        return list(vector)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many queries, running the model once for all cache misses."""
+        keys = [normalize_query(text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+
+        pending = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                pending.setdefault(key, text)
+        if pending:
+            with telemetry.span("embed", **{"embed.texts": len(pending)}):
+                fresh = self.embeddings.embed_documents(list(pending.values()))
+            computed = {}
+            for key, vector in zip(pending, fresh):
+                computed[key] = tuple(vector)
+                self.cache.put(key, computed[key])
+            vectors = [computed[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+        return [list(vector) for vector in vectors]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with telemetry.span("embed", **{"embed.texts": len(texts)}):
+            return self.embeddings.embed_documents(texts)
+
+    def __getattr__(self, name):
+        # Expose the wrapped model's attributes (e.g. ``client``)
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
@@ -0,0 +1,155 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import telemetry
+
+# Embedding and FAISS work: a few threads, since ONNX/torch/FAISS already use several cores per call
+CPU_WORKERS = int(os.getenv("EXECUTOR_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+CPU_QUEUE_SIZE = int(os.getenv("EXECUTOR_CPU_QUEUE", "32"))
+# Blocking Gmail calls mostly wait on the network, so many more threads
+IO_WORKERS = int(os.getenv("EXECUTOR_IO_WORKERS", "16"))
+IO_QUEUE_SIZE = int(os.getenv("EXECUTOR_IO_QUEUE", "128"))
+# Seconds a call may wait for a free slot before it is rejected; 0 waits indefinitely
+QUEUE_TIMEOUT = float(os.getenv("EXECUTOR_QUEUE_TIMEOUT", "30"))
+
+
+class ExecutorBusy(RuntimeError):
+    """A pool stayed full for longer than its queue timeout."""
+
+
+class BoundedExecutor:
+    """Thread pool with a bounded queue, for running blocking tool work off the event loop.
+
+    At most ``workers + queue_size`` calls are admitted at once. Further
+    callers wait (without blocking the event loop) for a slot, which pushes
+    back on clients flooding one kind of work, and give up with
+    ``ExecutorBusy`` after ``queue_timeout`` seconds. A slot is held until
+    the call has really finished, even if its caller was cancelled, so
+    abandoned calls still count against the bound.
+
+    Context variables (e.g. the active telemetry span) are carried into the
+    worker thread, as with ``asyncio.to_thread``.
+
+    Args:
+        name (str): Pool name, used for thread names and stats.
+        workers (int): Worker threads.
+        queue_size (int): Calls allowed to wait for a worker.
+        queue_timeout (float): Seconds to wait for a slot; 0 waits indefinitely.
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int, queue_timeout: float = QUEUE_TIMEOUT):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.queue_timeout = queue_timeout
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # One semaphore per event loop, as asyncio primitives are bound to a loop
+        self._slots = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "waiting": 0,
+            "max_waiting": 0,
+            "wait_seconds": 0.0,
+        }
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix=f"{self.name}-pool")
+        return self._pool
+
+    def _slots_for(self, loop) -> asyncio.Semaphore:
+        slots = self._slots.get(loop)
+        if slots is None:
+            with self._lock:
+                slots = self._slots.setdefault(loop, asyncio.Semaphore(self.workers + self.queue_size))
+        return slots
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._metrics[key] += delta
+            self._metrics["max_in_flight"] = max(self._metrics["max_in_flight"], self._metrics["in_flight"])
+            self._metrics["max_waiting"] = max(self._metrics["max_waiting"], self._metrics["waiting"])
+
+    async def _acquire(self, slots: asyncio.Semaphore):
+        if not slots.locked():
+            await slots.acquire()
+            return
+        self._count(waiting=1)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(slots.acquire(), self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            self._count(rejected=1)
+            raise ExecutorBusy(
+                f"The {self.name} pool is busy ({self.workers} workers, {self.queue_size} queued calls); try again later"
+            ) from None
+        finally:
+            waited = time.monotonic() - started
+            self._count(waiting=-1, wait_seconds=waited)
+            if telemetry.ENABLED:
+                telemetry.EXECUTOR_WAIT.observe(waited * 1000, pool=self.name)
+
+    async def run(self, function: Callable, *args, **kwargs):
+        """Run ``function(*args, **kwargs)`` in the pool and return its result."""
+        loop = asyncio.get_running_loop()
+        slots = self._slots_for(loop)
+        await self._acquire(slots)
+        self._count(submitted=1, in_flight=1)
+
+        def finished(_):
+            self._count(completed=1, in_flight=-1)
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(slots.release)
+
+        try:
+            context = contextvars.copy_context()
+            future = self._executor().submit(functools.partial(context.run, function, *args, **kwargs))
+        except BaseException:
+            self._count(in_flight=-1)
+            slots.release()
+            raise
+        future.add_done_callback(finished)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "queue_size": self.queue_size, **self._metrics}
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+cpu_pool = BoundedExecutor("cpu", CPU_WORKERS, CPU_QUEUE_SIZE)
+io_pool = BoundedExecutor("io", IO_WORKERS, IO_QUEUE_SIZE)
+
+
+async def run_cpu(function: Callable, *args, **kwargs):
+    """Run CPU-bound work (embedding, FAISS search) in the CPU pool"""
+    return await cpu_pool.run(function, *args, **kwargs)
+
+
+async def run_io(function: Callable, *args, **kwargs):
+    """Run blocking Gmail API work in the I/O pool"""
+    return await io_pool.run(function, *args, **kwargs)
+
+
+def stats() -> dict:
+    return {"cpu": cpu_pool.stats(), "io": io_pool.stats()}
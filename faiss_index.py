@@ -0,0 +1,158 @@
+import os
+import warnings
+
+import faiss
+import numpy as np
+
+import telemetry
+
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw")
+
+# k-means wants roughly this many training points per IVF centroid
+MIN_POINTS_PER_CENTROID = 39
+# 8-bit PQ codebooks have 256 centroids per sub-quantizer to train
+PQ_MIN_TRAINING_POINTS = 256 * MIN_POINTS_PER_CENTROID
+
+
+class IndexConfig:
+    """Index type and tuning knobs for the template vector stores.
+
+    Vectors are L2-normalized and searched by inner product, so scores are
+    cosine similarities (higher is better) for every index type.
+
+    Args:
+        index_type: One of INDEX_TYPES. "flat" is exact brute force; "ivf" and
+            "ivfpq" cluster vectors into nlist cells (PQ also compresses them);
+            "hnsw" is a graph index that needs no training.
+        nlist: IVF cells. Capped automatically for small corpora.
+        nprobe: IVF cells visited per query; higher is slower but more exact.
+        pq_m: PQ sub-quantizers; must divide the embedding dimension.
+        hnsw_m: HNSW neighbours per node.
+        ef_construction: HNSW build-time search depth.
+        ef_search: HNSW query-time search depth.
+    """
+
+    def __init__(self, index_type: str = "flat", nlist: int = 256, nprobe: int = 8,
+                 pq_m: int = 16, hnsw_m: int = 32, ef_construction: int = 200,
+                 ef_search: int = 64):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+
+    @classmethod
+    def from_env(cls) -> "IndexConfig":
+        """Read VECTOR_INDEX_* environment variables, falling back to defaults."""
+        defaults = cls()
+
+        def env_int(name, default):
+            value = os.getenv(name)
+            return int(value) if value else default
+
+        return cls(
+            index_type=os.getenv("VECTOR_INDEX_TYPE", defaults.index_type).lower(),
+            nlist=env_int("VECTOR_INDEX_NLIST", defaults.nlist),
+            nprobe=env_int("VECTOR_INDEX_NPROBE", defaults.nprobe),
+            pq_m=env_int("VECTOR_INDEX_PQ_M", defaults.pq_m),
+            hnsw_m=env_int("VECTOR_INDEX_HNSW_M", defaults.hnsw_m),
+            ef_construction=env_int("VECTOR_INDEX_EF_CONSTRUCTION", defaults.ef_construction),
+            ef_search=env_int("VECTOR_INDEX_EF_SEARCH", defaults.ef_search),
+        )
+
+    def build_key(self) -> dict:
+        """Settings that change the built index; a mismatch means rebuild."""
+        return {
+            "metric": "cosine",
+            "index_type": self.index_type,
+            "nlist": self.nlist,
+            "pq_m": self.pq_m,
+            "hnsw_m": self.hnsw_m,
+            "ef_construction": self.ef_construction,
+        }
+
+
+def normalized(vectors) -> np.ndarray:
+    """Return a float32, L2-normalized copy of a vector matrix."""
+    matrix = np.array(vectors, dtype=np.float32, copy=True)
+    if matrix.size:
+        faiss.normalize_L2(matrix)
+    return matrix
+
+
+def build_index(vectors, dimension: int, config: IndexConfig) -> faiss.Index:
+    """
+    Build, train and fill an inner-product index over normalized vectors.
+
+    IVF variants fall back to simpler indexes when the corpus is too small
+    to train them (ivfpq -> ivf -> flat).
+    """
+    matrix = normalized(vectors).reshape(-1, dimension)
+    count = len(matrix)
+    metric = faiss.METRIC_INNER_PRODUCT
+    index_type = config.index_type
+
+    if index_type == "ivfpq" and (count < PQ_MIN_TRAINING_POINTS or dimension % config.pq_m):
+        index_type = "ivf"
+    nlist = min(config.nlist, count // MIN_POINTS_PER_CENTROID)
+    if index_type in ("ivf", "ivfpq") and nlist < 1:
+        index_type = "flat"
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config.hnsw_m, metric)
+        index.hnsw.efConstruction = config.ef_construction
+    else:
+        quantizer = faiss.IndexFlatIP(dimension)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, config.pq_m, 8, metric)
+
+    if not index.is_trained:
+        index.train(matrix)
+    if count:
+        index.add(matrix)
+    apply_search_params(index, config)
+    return index
+
+
+def apply_search_params(index: faiss.Index, config: IndexConfig):
+    """Set the query-time knobs (nprobe / efSearch) on a built or loaded index."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(config.nprobe, ivf.nlist)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = config.ef_search
+
+
+def make_vector_store(embeddings, index: faiss.Index, documents: list, ids: list):
+    """Wrap an inner-product index in a langchain FAISS store with cosine scores."""
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    with warnings.catch_warnings():
+        # langchain warns that normalize_L2 is unusual for inner product, but
+        # normalizing queries is exactly what turns inner product into cosine
+        warnings.simplefilter("ignore", UserWarning)
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=InMemoryDocstore(dict(zip(ids, documents))),
+            index_to_docstore_id=dict(enumerate(ids)),
+            normalize_L2=True,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+
+
+def search_store(store, query: str, k: int):
+    """``store.similarity_search_with_score`` with the query embedding and the FAISS lookup traced apart."""
+    vector = store.embedding_function.embed_query(query)
+    with telemetry.span("faiss.search", **{"faiss.k": k, "faiss.ntotal": store.index.ntotal}):
+        return store.similarity_search_with_score_by_vector(vector, k=k)
@@ -0,0 +1,216 @@
+import asyncio
+import base64
+import importlib.util
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from typing import Callable, List, Optional
+
+import httpx
+
+from executors import run_cpu
+from gmail_fetch import LIST_FIELDS, fetch_params
+from gmail_quota import RequestScheduler, quota_units, scheduler as default_scheduler
+from gmail_service import API_ENDPOINT, get_credentials
+from template_index import compile_template
+
+GMAIL_API_URL = f"{API_ENDPOINT or 'https://gmail.googleapis.com/'}gmail/v1/"
+
+# Shared pool limits; keep-alive lets concurrent tool calls reuse connections
+POOL_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60)
+TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+# Default cap on in-flight drafts.create calls for one bulk request
+BULK_DRAFT_CONCURRENCY = 10
+# Cap on in-flight messages.get calls for one get_messages request
+FETCH_CONCURRENCY = 10
+
+# HTTP/2 needs the optional "h2" package (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def build_draft_request(to: str, subject: str, body: str) -> dict:
+    """Build the drafts.create request body for a plain-text email."""
+    message = EmailMessage()
+    message.set_content(body)
+    message["To"] = to
+    message["From"] = "me"
+    message["Subject"] = subject
+
+    encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+    return {"message": {"raw": encoded_message}}
+
+
+def fill_placeholders(text: str, variables: dict) -> str:
+    """Replace {{name}} placeholders with values from variables, leaving unknown ones as-is."""
+    # Bulk items usually share a subject/body, so each text is parsed once
+    return compile_template(text).render(variables)
+
+
+def build_bulk_draft_request(item: dict) -> dict:
+    if not item.get("to"):
+        raise ValueError("item is missing a 'to' address")
+    variables = item.get("variables") or {}
+    return build_draft_request(
+        item["to"],
+        fill_placeholders(item.get("subject", ""), variables),
+        fill_placeholders(item.get("body", ""), variables),
+    )
+
+
+class AsyncGmailClient:
+    """Gmail REST client on a pooled ``httpx.AsyncClient``.
+
+    Shares credentials with the synchronous ``googleapiclient`` service, so
+    token refresh still happens in one place. Calls go through the account's
+    quota scheduler; errors are raised as ``httpx.HTTPStatusError``.
+
+    Args:
+        client: Preconfigured ``httpx.AsyncClient``; one with its own pool by default.
+        get_credentials: Returns the account's current credentials.
+        scheduler (RequestScheduler): Quota and retry gate of the account.
+    """
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None,
+                 get_credentials: Callable = get_credentials,
+                 scheduler: RequestScheduler = default_scheduler):
+        self.get_credentials = get_credentials
+        self.scheduler = scheduler
+        self._client = client or httpx.AsyncClient(
+            base_url=GMAIL_API_URL,
+            http2=HTTP2_AVAILABLE,
+            limits=POOL_LIMITS,
+            timeout=TIMEOUT,
+        )
+
+    async def _headers(self) -> dict:
+        # Loading credentials may hit disk or refresh the token, keep it off the loop
+        creds = await asyncio.to_thread(self.get_credentials)
+        return {"Authorization": f"Bearer {creds.token}"}
+
+    async def request(self, method: str, path: str, quota_method: str = "", **kwargs) -> dict:
+        """Send a request through the quota scheduler; quota_method names its cost, e.g. "messages.get"."""
+        async def send():
+            headers = await self._headers()
+            return await self._client.request(method, path, headers=headers, **kwargs)
+
+        response = await self.scheduler.execute_async(send, quota_units(quota_method), quota_method)
+        response.raise_for_status()
+        return response.json()
+
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, quota_method: str = "", **kwargs):
+        """Like ``request`` but yields the response with its body unread, for chunked reads."""
+        async def send():
+            headers = await self._headers()
+            request = self._client.build_request(method, path, headers=headers, **kwargs)
+            return await self._client.send(request, stream=True)
+
+        response = await self.scheduler.execute_async(send, quota_units(quota_method), quota_method)
+        try:
+            if response.is_error:
+                await response.aread()
+            response.raise_for_status()
+            yield response
+        finally:
+            await response.aclose()
+
+    async def create_draft(self, to: str, subject: str, body: str, user_id: str = "me") -> dict:
+        return await self.submit_draft(build_draft_request(to, subject, body), user_id=user_id)
+
+    async def submit_draft(self, draft_request: dict, user_id: str = "me") -> dict:
+        """Create a draft from a prebuilt drafts.create request body."""
+        return await self.request("POST", f"users/{user_id}/drafts", "drafts.create", json=draft_request)
+
+    async def list_messages(self, user_id: str = "me", query: str = "",
+                            label_ids: Optional[List[str]] = None,
+                            max_results: int = 10,
+                            page_token: Optional[str] = None) -> dict:
+        params = {"maxResults": max_results, "fields": LIST_FIELDS}
+        if query:
+            params["q"] = query
+        if label_ids:
+            params["labelIds"] = label_ids
+        if page_token:
+            params["pageToken"] = page_token
+        return await self.request("GET", f"users/{user_id}/messages", "messages.list", params=params)
+
+    async def get_message(self, message_id: str, user_id: str = "me",
+                          profile: str = "full",
+                          metadata_headers: Optional[List[str]] = None) -> dict:
+        params = fetch_params(profile, metadata_headers)
+        return await self.request("GET", f"users/{user_id}/messages/{message_id}", "messages.get", params=params)
+
+    async def get_messages(self, message_ids: List[str], user_id: str = "me", profile: str = "full",
+                           concurrency: int = FETCH_CONCURRENCY) -> List[dict]:
+        """Fetch messages concurrently, at most ``concurrency`` at a time; results in input order."""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def get(message_id: str) -> dict:
+            async with semaphore:
+                return await self.get_message(message_id, user_id, profile=profile)
+
+        return await asyncio.gather(*(get(message_id) for message_id in message_ids))
+
+    def stream_attachment(self, message_id: str, attachment_id: str, user_id: str = "me"):
+        """Stream a messages.attachments.get response; the body is {"data": "<base64url>"}."""
+        return self.stream(
+            "GET", f"users/{user_id}/messages/{message_id}/attachments/{attachment_id}",
+            "messages.attachments.get", params={"fields": "data"},
+        )
+
+    async def get_profile(self, user_id: str = "me") -> dict:
+        return await self.request("GET", f"users/{user_id}/profile", "getProfile")
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_client: Optional[AsyncGmailClient] = None
+
+
+def get_async_client() -> AsyncGmailClient:
+    """Get the process-wide async Gmail client"""
+    global _client
+    if _client is None:
+        _client = AsyncGmailClient()
+    return _client
+
+
+def failed_drafts(items: List[dict], error) -> List[dict]:
+    """Per-item results for a bulk request that failed as a whole, e.g. for an unknown account."""
+    return [{"index": index, "to": item.get("to"), "success": False, "error": str(error)}
+            for index, item in enumerate(items)]
+
+
+async def create_drafts_bulk(items: List[dict], concurrency: int = BULK_DRAFT_CONCURRENCY,
+                             client: Optional[AsyncGmailClient] = None) -> List[dict]:
+    """
+    Create many drafts concurrently.
+
+    MIME messages are built in the CPU pool so encoding large batches does
+    not stall the event loop, and at most ``concurrency`` drafts.create
+    calls are in flight at once.
+
+    Args:
+        items: Dicts with 'to', 'subject', 'body' and optional 'variables'
+            used to fill {{name}} placeholders in the subject and body.
+        concurrency: Maximum simultaneous uploads.
+        client: Client of the account to create the drafts in; the default account if None.
+
+    Returns:
+        One result per item, in input order, with 'index', 'to', 'success'
+        and either 'draft_id' or 'error'.
+    """
+    client = client or get_async_client()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def create(index: int, item: dict) -> dict:
+        try:
+            draft_request = await run_cpu(build_bulk_draft_request, item)
+            async with semaphore:
+                draft = await client.submit_draft(draft_request)
+            return {"index": index, "to": item.get("to"), "success": True, "draft_id": draft["id"]}
+        except Exception as error:
+            return {"index": index, "to": item.get("to"), "success": False, "error": str(error)}
+
+    return list(await asyncio.gather(*(create(i, item) for i, item in enumerate(items))))
@@ -0,0 +1,188 @@
+import logging
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from gmail_quota import RequestScheduler, is_retryable_error, quota_units, scheduler as default_scheduler
+
+# Gmail rejects batch requests with more than 100 calls
+MAX_BATCH_SIZE = 100
+
+MESSAGE_FIELDS = "id,threadId,labelIds,snippet,historyId,internalDate"
+DEFAULT_METADATA_HEADERS = ["Subject", "From", "Date"]
+
+# messages.get format plus a partial-response mask for each fetch profile, so
+# only what the caller uses crosses the wire and gets parsed
+FETCH_PROFILES = {
+    "minimal": {"format": "minimal", "fields": MESSAGE_FIELDS},
+    "metadata": {"format": "metadata", "fields": f"{MESSAGE_FIELDS},payload/headers"},
+    "full": {"format": "full", "fields": f"{MESSAGE_FIELDS},payload(partId,mimeType,filename,headers,body,parts)"},
+    "raw": {"format": "raw", "fields": f"{MESSAGE_FIELDS},raw"},
+}
+
+LIST_FIELDS = "messages(id,threadId),nextPageToken"
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_params(profile: str = "full", metadata_headers: Optional[List[str]] = None) -> dict:
+    """
+    messages.get parameters for a fetch profile.
+
+    Args:
+        profile (str): "minimal", "metadata", "full" or "raw".
+        metadata_headers (list): Headers to return with the "metadata" profile.
+
+    Returns:
+        dict: 'format', 'fields' and, for metadata, 'metadataHeaders'.
+    """
+    if profile not in FETCH_PROFILES:
+        raise ValueError(f"Unknown fetch profile {profile!r}, expected one of {list(FETCH_PROFILES)}")
+    params = dict(FETCH_PROFILES[profile])
+    if profile == "metadata":
+        params["metadataHeaders"] = metadata_headers or DEFAULT_METADATA_HEADERS
+    return params
+
+
+def batch_get_messages(service, user_id: str, message_ids: List[str],
+                       profile: str = "full",
+                       metadata_headers: Optional[List[str]] = None,
+                       batch_size: int = MAX_BATCH_SIZE,
+                       scheduler: RequestScheduler = default_scheduler) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """
+    Fetch many messages using Gmail batch HTTP requests.
+
+    Args:
+        service: Authorized Gmail API service instance.
+        user_id (str): User's email address or "me".
+        message_ids (list): Message IDs to fetch.
+        profile (str): Fetch profile, see FETCH_PROFILES.
+        metadata_headers (list): Headers to return with the "metadata" profile.
+        batch_size (int): Calls per batch request, at most MAX_BATCH_SIZE.
+        scheduler (RequestScheduler): Quota and retry gate of the account.
+
+    Returns:
+        tuple: (messages, errors) where messages maps ID -> message resource
+        and errors maps ID -> error string for items that failed.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    # Batch request IDs must be unique
+    pending = list(dict.fromkeys(message_ids))
+    messages = {}
+    errors = {}
+    units_per_call = quota_units("messages.get")
+    params = fetch_params(profile, metadata_headers)
+
+    for attempt in range(scheduler.max_retries + 1):
+        retry = {}
+
+        def on_response(request_id, response, exception):
+            if exception is None:
+                messages[request_id] = response
+            elif attempt < scheduler.max_retries and is_retryable_error(exception):
+                # Rate-limited or transient per-item failures go into the next round
+                retry[request_id] = exception
+            else:
+                errors[request_id] = str(exception)
+
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            batch = service.new_batch_http_request(callback=on_response)
+            for msg_id in chunk:
+                batch.add(
+                    service.users().messages().get(userId=user_id, id=msg_id, **params),
+                    request_id=msg_id,
+                )
+            # Every call inside a batch is billed individually
+            scheduler.execute(batch, units=units_per_call * len(chunk))
+
+        if not retry:
+            break
+        delay = scheduler.retry_delay(attempt, list(retry.values()))
+        logger.warning("%d batched messages.get calls failed, retrying in %.2fs", len(retry), delay)
+        time.sleep(delay)
+        pending = list(retry)
+
+    return messages, errors
+
+
+# messages.list returns at most 500 entries per page
+MAX_PAGE_SIZE = 500
+
+
+def list_message_page(service, user_id: str, query: Optional[str] = None,
+                      label_ids: Optional[List[str]] = None,
+                      page_size: int = MAX_PAGE_SIZE,
+                      page_token: Optional[str] = None,
+                      scheduler: RequestScheduler = default_scheduler) -> Tuple[List[dict], Optional[str]]:
+    """
+    Fetch a single messages.list page.
+
+    Returns:
+        tuple: (messages, next_page_token) where messages are the
+        {'id', 'threadId'} stubs and next_page_token is None on the last page.
+    """
+    params = {"userId": user_id, "maxResults": page_size, "fields": LIST_FIELDS}
+    if query:
+        params["q"] = query
+    if label_ids:
+        params["labelIds"] = label_ids
+    if page_token:
+        params["pageToken"] = page_token
+
+    result = scheduler.execute(service.users().messages().list(**params))
+    return result.get("messages", []), result.get("nextPageToken")
+
+
+def iter_pages(fetch_page: Callable[[int, Optional[str]], Tuple[list, Optional[str]]],
+               limit: Optional[int] = None,
+               page_token: Optional[str] = None) -> Iterator[Tuple[list, Optional[str]]]:
+    """
+    Drive a page-fetching function until the results or the limit run out.
+
+    Args:
+        fetch_page: Called as fetch_page(page_size, page_token) and returns
+            (items, next_page_token).
+        limit (int): Stop after this many items. None walks every page.
+        page_token (str): Resume from a token returned by an earlier page.
+
+    Yields:
+        tuple: (items, next_page_token) for each page.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page_size = MAX_PAGE_SIZE if remaining is None else min(remaining, MAX_PAGE_SIZE)
+        items, page_token = fetch_page(page_size, page_token)
+        yield items, page_token
+
+        if not page_token:
+            return
+        if remaining is not None:
+            remaining -= len(items)
+
+
+def iter_message_pages(service, user_id: str, query: Optional[str] = None,
+                       label_ids: Optional[List[str]] = None,
+                       limit: Optional[int] = None,
+                       page_token: Optional[str] = None,
+                       scheduler: RequestScheduler = default_scheduler) -> Iterator[Tuple[List[dict], Optional[str]]]:
+    """
+    Walk messages.list following nextPageToken.
+
+    Args:
+        service: Authorized Gmail API service instance.
+        user_id (str): User's email address or "me".
+        query (str): Gmail search query, e.g. "is:unread".
+        label_ids (list): Only return messages with all of these labels.
+        limit (int): Stop after this many messages. None walks every page.
+        page_token (str): Resume from a token returned by an earlier page.
+        scheduler (RequestScheduler): Quota and retry gate of the account.
+
+    Yields:
+        tuple: (messages, next_page_token) for each page, where messages are
+        the {'id', 'threadId'} stubs and next_page_token is None on the last page.
+    """
+    def fetch_page(page_size, token):
+        return list_message_page(service, user_id, query=query, label_ids=label_ids,
+                                 page_size=page_size, page_token=token, scheduler=scheduler)
+
+    return iter_pages(fetch_page, limit=limit, page_token=page_token)
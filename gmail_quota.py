@@ -0,0 +1,323 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, List, Optional
+
+import httpx
+from googleapiclient.errors import HttpError
+
+import telemetry
+
+# Gmail allows 250 quota units per user per second, averaged over time
+QUOTA_UNITS_PER_SECOND = 250
+QUOTA_BURST = 250
+
+# Quota cost per method, see https://developers.google.com/gmail/api/reference/quota
+QUOTA_UNITS = {
+    "getProfile": 1,
+    "watch": 100,
+    "stop": 50,
+    "drafts.create": 10,
+    "drafts.get": 5,
+    "drafts.list": 5,
+    "drafts.send": 100,
+    "drafts.update": 15,
+    "history.list": 2,
+    "labels.list": 1,
+    "messages.attachments.get": 5,
+    "messages.get": 5,
+    "messages.list": 5,
+    "messages.modify": 5,
+    "messages.send": 100,
+    "threads.get": 10,
+    "threads.list": 10,
+}
+DEFAULT_QUOTA_UNITS = 5
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 32.0
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+logger = logging.getLogger(__name__)
+
+
+def quota_units(method_id: str) -> int:
+    """Quota cost of a method, given either "messages.get" or "gmail.users.messages.get"."""
+    return QUOTA_UNITS.get(method_id.removeprefix("gmail.users."), DEFAULT_QUOTA_UNITS)
+
+
+def error_reason(error: HttpError) -> Optional[str]:
+    try:
+        return json.loads(error.content)["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def is_retryable(status: int, reason: Optional[str] = None) -> bool:
+    return status in RETRYABLE_STATUSES or (status == 403 and reason in RATE_LIMIT_REASONS)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    if isinstance(error, HttpError):
+        return is_retryable(error.resp.status, error_reason(error))
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket that hands out reservations.
+
+    ``reserve`` always succeeds and returns how long the caller must wait
+    before its units are available, so waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float = QUOTA_UNITS_PER_SECOND, capacity: float = QUOTA_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, units: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= units
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class RequestScheduler:
+    """Single gate in front of every Gmail API call.
+
+    Each call first takes its quota units from a token bucket, then retries
+    429, rate-limit 403 and 5xx responses with capped exponential backoff and
+    full jitter, honouring Retry-After when the server sends it. Counters
+    are available from ``stats()``.
+    """
+
+    def __init__(self, bucket: Optional[TokenBucket] = None, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX):
+        self.bucket = bucket or TokenBucket()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "quota_units": 0,
+            "retries": 0,
+            "failures": 0,
+            "throttled": 0,
+            "throttle_wait_seconds": 0.0,
+            "queue_depth": 0,
+            "max_queue_depth": 0,
+        }
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def retry_delay(self, attempt: int, errors: List[Exception]) -> float:
+        """
+        Delay before retrying calls that failed with ``errors``; counts one retry per error.
+
+        Honours the longest Retry-After any of them carries, otherwise backs
+        off exponentially for ``attempt``.
+        """
+        waits = [
+            parse_retry_after(error.resp.get("retry-after"))
+            for error in errors if isinstance(error, HttpError)
+        ]
+        waits = [wait for wait in waits if wait is not None]
+        self._count(retries=len(errors))
+        telemetry.current_span().set("gmail.retries", attempt + 1)
+        return self.backoff(attempt, max(waits) if waits else None)
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._metrics[key] += delta
+
+    def _enter_wait(self, wait: float):
+        with self._lock:
+            self._metrics["throttled"] += 1
+            self._metrics["throttle_wait_seconds"] += wait
+            self._metrics["queue_depth"] += 1
+            self._metrics["max_queue_depth"] = max(
+                self._metrics["max_queue_depth"], self._metrics["queue_depth"]
+            )
+
+    def _leave_wait(self):
+        self._count(queue_depth=-1)
+
+    def acquire(self, units: float):
+        """Block until ``units`` quota units are available."""
+        self._count(requests=1, quota_units=units)
+        wait = self.bucket.reserve(units)
+        if wait > 0:
+            self._enter_wait(wait)
+            try:
+                time.sleep(wait)
+            finally:
+                self._leave_wait()
+
+    async def acquire_async(self, units: float):
+        self._count(requests=1, quota_units=units)
+        wait = self.bucket.reserve(units)
+        if wait > 0:
+            self._enter_wait(wait)
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._leave_wait()
+
+    def execute(self, request, units: Optional[float] = None):
+        """
+        Execute a googleapiclient request (or batch) under quota and retry control.
+
+        Args:
+            request: HttpRequest or BatchHttpRequest.
+            units (float): Quota cost; defaults to the cost of request.methodId.
+        """
+        method = getattr(request, "methodId", "batch").removeprefix("gmail.users.")
+        if units is None:
+            units = quota_units(method)
+        if not telemetry.ENABLED:
+            return self._execute(request, units)
+        if hasattr(request, "postproc"):
+            request.postproc = _measured(request.postproc, method)
+        with telemetry.span(f"gmail {method}", telemetry.CLIENT, **{"gmail.method": method, "gmail.quota_units": units}):
+            try:
+                result = self._execute(request, units)
+            except HttpError as error:
+                telemetry.GMAIL_REQUESTS.add(method=method, status=str(error.resp.status))
+                raise
+            telemetry.GMAIL_REQUESTS.add(method=method, status="ok")
+            return result
+
+    def _execute(self, request, units: float):
+        attempt = 0
+        while True:
+            self.acquire(units)
+            try:
+                return request.execute()
+            except Exception as error:
+                if attempt >= self.max_retries or not is_retryable_error(error):
+                    self._count(failures=1)
+                    raise
+                delay = self.retry_delay(attempt, [error])
+                logger.warning("Gmail request failed (%s), retrying in %.2fs", error, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    async def execute_async(self, send: Callable[[], Awaitable], units: float, method: str = ""):
+        """
+        Run an async HTTP call under quota and retry control.
+
+        Args:
+            send: Coroutine factory returning an ``httpx.Response``; called once per attempt.
+            units (float): Quota cost of the call.
+            method (str): API method for traces and metrics, e.g. "messages.get".
+
+        Returns:
+            The first non-retryable response (callers check its status).
+        """
+        if not telemetry.ENABLED:
+            return await self._execute_async(send, units)
+        with telemetry.span(f"gmail {method}", telemetry.CLIENT, **{"gmail.method": method, "gmail.quota_units": units}):
+            response = await self._execute_async(send, units)
+            telemetry.current_span().set("http.response.status_code", response.status_code)
+            telemetry.GMAIL_REQUESTS.add(method=method, status="ok" if not response.is_error else str(response.status_code))
+            size = response.headers.get("content-length")
+            if size is None:
+                try:
+                    size = len(response.content)
+                except httpx.ResponseNotRead:
+                    pass
+            if size is not None:
+                telemetry.GMAIL_RESPONSE_SIZE.observe(int(size), method=method)
+            return response
+
+    async def _execute_async(self, send: Callable[[], Awaitable], units: float):
+        attempt = 0
+        while True:
+            await self.acquire_async(units)
+            try:
+                response = await send()
+            except (httpx.TransportError, ConnectionError, TimeoutError) as error:
+                if attempt >= self.max_retries:
+                    self._count(failures=1)
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning("Gmail request failed (%s), retrying in %.2fs", error, delay)
+            else:
+                if response.status_code == 403:
+                    # Streamed responses arrive unread; the rate-limit reason is in the body
+                    try:
+                        await response.aread()
+                    except BaseException:
+                        await response.aclose()
+                        raise
+                if not is_retryable(response.status_code, _response_reason(response)) or attempt >= self.max_retries:
+                    if response.is_error:
+                        self._count(failures=1)
+                    return response
+                delay = self.backoff(attempt, parse_retry_after(response.headers.get("retry-after")))
+                logger.warning("Gmail request returned %s, retrying in %.2fs", response.status_code, delay)
+                # Release the connection of a streamed response we are not going to read
+                await response.aclose()
+            self._count(retries=1)
+            telemetry.current_span().set("gmail.retries", attempt + 1)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._metrics)
+
+
+def _measured(postproc, method: str):
+    """Wrap an HttpRequest's postproc to record the response body size."""
+    def measure(resp, content):
+        telemetry.GMAIL_RESPONSE_SIZE.observe(len(content or b""), method=method)
+        return postproc(resp, content)
+    return measure
+
+
+def _response_reason(response) -> Optional[str]:
+    if response.status_code != 403:
+        return None
+    try:
+        return response.json()["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError, httpx.ResponseNotRead):
+        return None
+
+
+scheduler = RequestScheduler()
+
+
+def execute(request, units: Optional[float] = None):
+    """Execute a Gmail API request through the shared scheduler"""
+    return scheduler.execute(request, units)
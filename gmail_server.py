@@ -1,48 +1,138 @@
-from typing import Any
+import asyncio
+from contextlib import asynccontextmanager
 import httpx
 from mcp.server.fastmcp import FastMCP
 # from mcp.types import InputField, ToolCallSchema
 
 import os
-import base64
-from email.message import EmailMessage
+import json
+import logging
+import threading
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-from vector_db import vector_store
-
-
-
-SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+import telemetry
+from accounts import DEFAULT_ACCOUNT, get_account, registry
+from attachments import ATTACHMENTS_DIR, AttachmentStore, save_attachment
+from executors import run_cpu, run_io, stats as pool_stats
+from gmail_async import BULK_DRAFT_CONCURRENCY, create_drafts_bulk, failed_drafts
+from gmail_fetch import (
+    DEFAULT_METADATA_HEADERS,
+    batch_get_messages,
+    fetch_params,
+    iter_message_pages,
+    iter_pages,
+    list_message_page,
+)
+from gmail_watch import PUSH_PORT, MailWatcher
+from mail_body import extract_body, is_attachment, walk_parts
+from mail_cache import MailCache, cached_page
+from mail_search import SEARCH_DB, MailSearchIndex, vector_index_file
+from vector_db import (
+    batch_search_templates,
+    cache_stats,
+    embedding_config,
+    get_cached_embeddings,
+    reload_templates,
+    search_templates,
+    warm_up_in_background,
+)
+
+# Never print(): on the stdio transport stdout is the protocol stream
+logger = logging.getLogger(__name__)
+
+
+
+@asynccontextmanager
+async def lifespan(server):
+    # Opt-in: start loading the embedding model while the client handshakes
+    if os.getenv("EMBEDDINGS_WARMUP"):
+        warm_up_in_background()
+    # Opt-in: replace polling with Gmail push notifications
+    topic_name = os.getenv("GMAIL_WATCH_TOPIC")
+    if topic_name:
+        try:
+            await run_io(lambda: get_mailbox().watcher.start(topic_name, token=os.getenv("WATCH_PUSH_TOKEN")))
+        except Exception as error:
+            logger.error("Could not start Gmail watch: %s", error)
+    try:
+        yield {}
+    finally:
+        for mailbox in list(_mailboxes.values()):
+            await run_io(mailbox.close)
 
-mcp = FastMCP("gmail")
 
+mcp = FastMCP("gmail", lifespan=lifespan)
+telemetry.instrument(mcp, "gmail_server")
 
-def get_service():
-    creds = None
 
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+class Mailbox:
+    """Local mail state of one account: cache, search index, attachments and push watch.
 
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-            creds = flow.run_local_server(port=0)
+    Files live in the account's directory, so accounts never share a cache
+    or an index.
+    """
 
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
+    def __init__(self, account):
+        self.account = account
+        self.cache = MailCache(account.path("mail_cache.db"), scheduler=account.scheduler)
+        self.index = MailSearchIndex(
+            path=account.path(SEARCH_DB),
+            vector_path=account.path(vector_index_file(embedding_config().key())),
+            get_embeddings=get_cached_embeddings,
+            background=True,
+        )
+        self.cache.add_listener(self.index)
+        self.attachments = AttachmentStore(account.path(ATTACHMENTS_DIR))
+        self.watcher = MailWatcher(
+            self.cache, account.get_service, on_new_messages=self.prefetch, scheduler=account.scheduler
+        )
+
+    def prefetch(self, service, message_ids, user_id="me"):
+        """Fetch new messages announced by the watch into the mail cache."""
+        messages, errors = batch_get_messages(
+            service, user_id, message_ids, profile="full", scheduler=self.account.scheduler
+        )
+        for msg_id, message in messages.items():
+            self.cache.store(message, summarize_mail(msg_id, message, "full"), "full")
+        if errors:
+            logger.warning("Could not prefetch %d new messages", len(errors))
+
+    def close(self):
+        """Stop the watch and flush the search index (its vector removals are saved lazily)."""
+        if self.watcher.receiver is not None:
+            self.watcher.stop()
+        self.index.close()
+        self.cache.close()
+        self.attachments.close()
+
+
+_mailboxes = {}
+_mailboxes_lock = threading.Lock()
+
+
+def get_mailbox(account: str = None) -> Mailbox:
+    """Mailbox of a configured account, opened on first use; ValueError for unknown accounts."""
+    account = get_account(account)
+    mailbox = _mailboxes.get(account.name)
+    if mailbox is None:
+        with _mailboxes_lock:
+            mailbox = _mailboxes.get(account.name)
+            if mailbox is None:
+                mailbox = _mailboxes[account.name] = Mailbox(account)
+    return mailbox
+
+
+async def open_mailbox(account: str = None) -> Mailbox:
+    """``get_mailbox`` for tools: opening a mailbox the first time (SQLite, FAISS) runs in the I/O pool."""
+    mailbox = _mailboxes.get(account or DEFAULT_ACCOUNT)
+    if mailbox is not None:
+        return mailbox
+    return await run_io(get_mailbox, account)
 
-    service = build("gmail", "v1", credentials=creds)
-    return service
 
 @mcp.tool()
-def prompt_templates(query: str):
+async def prompt_templates(query: str):
     """
     Returns example and most relevant email prompt templates using vector search.
 
@@ -52,19 +142,88 @@ def prompt_templates(query: str):
     Returns:
         List[dict]: A list of top matching email prompt templates with their metadata
     """
-    results = vector_store.similarity_search(query, k=3)
+    # Embedding and FAISS run in the CPU pool so Gmail tools are not held up meanwhile
+    results = await run_cpu(search_templates, query, k=3)
+
+    return [template_result(doc) for doc in results]
+
+
+def template_result(doc):
+    return {
+        "prompt": doc.page_content,
+        "category": doc.metadata.get("category", ""),
+        "template_type": doc.metadata.get("template type", ""),
+        "purpose": doc.metadata.get("purpose of mail", "")
+    }
+
+
+@mcp.tool()
+async def batch_vector_search(queries: list[str], k: int = 3):
+    """
+    Returns the most relevant email prompt templates for many queries at once.
 
+    All queries are embedded in one model call and searched in one FAISS lookup,
+    so triaging a batch of emails costs about the same as a single search.
+
+    Args:
+        queries (list[str]): Natural language queries, e.g. one per incoming email
+        k (int): Number of templates to return per query (default: 3)
+
+    Returns:
+        List[List[dict]]: Matching templates for each query, in query order
+    """
     return [
-        {
-            "prompt": doc.page_content,
-            "category": doc.metadata.get("category", ""),
-            "template_type": doc.metadata.get("template type", ""),
-            "purpose": doc.metadata.get("purpose of mail", "")
-        }
-        for doc in results
+        [template_result(doc) for doc in results]
+        for results in await run_cpu(batch_search_templates, queries, k=k)
     ]
 
 
+@mcp.tool()
+def gmail_quota_stats(account: str = None):
+    """Gmail API scheduler counters of an account: requests, quota units, retries, throttling and queue depth"""
+    return get_account(account).scheduler.stats()
+
+
+@mcp.tool()
+def gmail_accounts():
+    """List the configured Gmail accounts usable as the 'account' parameter of the other tools
+
+    Returns:
+        list: Dicts with 'name' and 'loaded' (whether it has been used since startup).
+    """
+    loaded = {account.name for account in registry.loaded()}
+    return [{"name": name, "loaded": name in loaded} for name in registry.names()]
+
+
+@mcp.tool()
+def embedding_cache_stats():
+    """Hit/miss counters for the query embedding and search result caches"""
+    return cache_stats()
+
+
+@mcp.tool()
+def executor_stats():
+    """Worker pool counters: CPU pool (embedding, FAISS) and I/O pool (blocking Gmail calls)
+
+    Returns:
+        dict: Per pool 'workers', 'queue_size', 'in_flight', 'waiting',
+        'rejected' (calls that timed out waiting for a slot) and totals.
+    """
+    return pool_stats()
+
+
+@mcp.tool()
+async def reload_prompt_templates():
+    """Apply edits to templates/prompts.json now instead of waiting for the file watcher
+
+    Returns:
+        dict: Number of templates added, removed, unchanged and embedded.
+    """
+    try:
+        return await run_cpu(reload_templates)
+    except (OSError, KeyError, ValueError) as error:
+        return f"Error reloading templates: {error}"
+
 
 # @mcp.tool()
 # def gmail_draft_inputs(prompt_templates : str):
@@ -87,183 +246,383 @@ def prompt_templates(query: str):
 #         parameters=placeholders
 #     )
 @mcp.tool()
-def gmail_create_draft(to:str, subject:str, body:str):
+async def gmail_create_draft(to:str, subject:str, body:str, account: str = None):
     """Fill the email template with dynamic placeholders"""
     try:
-        service = get_service()
-
-        message = EmailMessage()
-        message.set_content(body)
-        message["To"] = to
-        message["From"] = "me"
-        message["Subject"] = subject
+        draft = await get_account(account).client.create_draft(to, subject, body)
+        return f"✅ Draft created successfully!\nDraft ID: {draft['id']}"
+    except (httpx.HTTPError, ValueError) as error:
+        return f"❌ An error occurred: {error}"
 
-        encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
 
-        create_message = {"message": {"raw": encoded_message}}
+@mcp.tool()
+async def gmail_create_drafts_bulk(items: list[dict], concurrency: int = BULK_DRAFT_CONCURRENCY,
+                                   account: str = None):
+    """
+    Create many drafts at once.
 
-        draft = service.users().drafts().create(userId="me", body=create_message).execute()
+    Args:
+        items (list[dict]): Each has 'to', 'subject', 'body' and optional 'variables'
+            used to fill {{name}} placeholders in the subject and body.
+        concurrency (int): Maximum number of drafts uploaded at the same time.
+        account (str): Account to create the drafts in, see gmail_accounts; default if omitted.
 
-        print(f"✅ Draft created successfully!\nDraft ID: {draft['id']}")
-    except HttpError as error:
-        print(f"❌ An error occurred: {error}")
+    Returns:
+        list of dict: Per item 'index', 'to', 'success' and 'draft_id' or 'error'.
+    """
+    try:
+        client = get_account(account).client
+    except ValueError as error:
+        return failed_drafts(items, error)
+    return await create_drafts_bulk(items, concurrency=concurrency, client=client)
 
 
 @mcp.tool()
-def extract_unread_emails():
-    service = get_service()
-    unread_emails = []
-    try:
-        result = service.users().messages().list(userId="me", labelIds=["UNREAD"]).execute()
-        messages = result.get("messages", [])
-        for message in messages:
-            unread_emails.append(message)
-    except HttpError as error:
-        print(f"❌ An error occurred: {error}")
-    return unread_emails
-    
+async def extract_unread_emails(max_results: int = 100, page_token: str = None, fetch_profile: str = None,
+                                account: str = None):
+    """
+    List unread messages one page at a time.
+
+    Args:
+        max_results (int): Maximum number of messages to return in this chunk.
+        page_token (str): Cursor returned as 'next_page_token' by a previous call.
+        fetch_profile (str): None returns only IDs. "minimal" adds labels and
+            snippet, "metadata" adds subject/from/date, "full" adds the body and
+            "raw" returns the base64url RFC 822 message.
+        account (str): Mailbox to read, see gmail_accounts; default if omitted.
+
+    Returns:
+        dict: 'messages' for this chunk and 'next_page_token' to continue
+        from, or None once the mailbox is exhausted.
+    """
+    mailbox = await open_mailbox(account)
+
+    def extract():
+        unread_emails = []
+        next_page_token = None
+        try:
+            if fetch_profile is None:
+                for messages, next_page_token in iter_message_pages(
+                    mailbox.account.get_service(), "me", label_ids=["UNREAD"], limit=max_results,
+                    page_token=page_token, scheduler=mailbox.account.scheduler,
+                ):
+                    unread_emails.extend(messages)
+            else:
+                for mail, next_page_token in iter_mail(
+                    mailbox, "me", label_ids=["UNREAD"], limit=max_results,
+                    page_token=page_token, profile=fetch_profile,
+                ):
+                    unread_emails.append(mail)
+        except HttpError as error:
+            logger.error("Could not list unread emails: %s", error)
+            telemetry.current_span().record_exception(error)
+        return {"messages": unread_emails, "next_page_token": next_page_token}
+
+    # Blocking API calls run in the I/O pool so other tools and accounts are served meanwhile
+    return await run_io(extract)
+
+
+def parse_mail(msg_id, mail):
+    """Reduce a full Gmail message resource to id, subject, from, date and body."""
+    payload = mail.get('payload', {})
+    headers = payload.get('headers', [])
+    subject = from_ = date = None
+
+    for header in headers:
+        name = header.get("name", "").lower()
+        if name == "subject":
+            subject = header.get("value")
+        elif name == "from":
+            from_ = header.get("value")
+        elif name == "date":
+            date = header.get("value")
+
+    return {
+        "id": msg_id,
+        "subject": subject,
+        "from": from_,
+        "date": date,
+        "body" : parse_msg(mail)
+    }
+
+
+def summarize_mail(msg_id, mail, profile="full"):
+    """Shape a fetched message for tool output according to its fetch profile."""
+    if profile == "full":
+        return parse_mail(msg_id, mail)
+    if profile == "raw":
+        return {"id": msg_id, "raw": mail.get("raw")}
+
+    summary = {
+        "id": msg_id,
+        "thread_id": mail.get("threadId"),
+        "labels": mail.get("labelIds", []),
+        "snippet": mail.get("snippet"),
+    }
+    if profile == "metadata":
+        headers = _header_values(mail, DEFAULT_METADATA_HEADERS)
+        summary["subject"] = headers.get("Subject")
+        summary["from"] = headers.get("From")
+        summary["date"] = headers.get("Date")
+    return summary
+
+
+def iter_mail(mailbox, user_id, query=None, label_ids=None, limit=None, page_token=None, profile="full"):
+    """
+    Stream summarized messages matching a query, walking every result page.
+
+    Pages and messages already in the mailbox's local cache are served from
+    it; only new listings and unseen messages are fetched from Gmail.
+
+    Yields:
+        tuple: (email dict, next_page_token of the page the email came from).
+    """
+    fetch_params(profile)  # reject unknown profiles before touching the network
+    service = mailbox.account.get_service()
+    scheduler = mailbox.account.scheduler
+    mailbox.cache.sync(service, user_id)
+
+    def fetch_page(page_size, token):
+        return cached_page(
+            mailbox.cache,
+            json.dumps([user_id, query, label_ids, page_size, token, profile]),
+            profile,
+            list_page=lambda: list_message_page(
+                service, user_id, query=query, label_ids=label_ids, page_size=page_size, page_token=token,
+                scheduler=scheduler,
+            ),
+            fetch=lambda ids: batch_get_messages(service, user_id, ids, profile=profile, scheduler=scheduler),
+            summarize=lambda msg_id, mail: summarize_mail(msg_id, mail, profile),
+        )
+
+    for mails, next_page_token in iter_pages(fetch_page, limit=limit, page_token=page_token):
+        for mail in mails:
+            yield mail, next_page_token
+
+
+def iter_unread_emails_after_date(mailbox, user_id, after_date, limit=None, page_token=None, profile="full"):
+    """Stream unread emails after a given date, see iter_mail."""
+    query = f'is:unread after:{after_date}'
+    return iter_mail(mailbox, user_id, query=query, limit=limit, page_token=page_token, profile=profile)
+
+
 @mcp.tool()
-def get_unread_emails_after_date(user_id, after_date):
+async def get_unread_emails_after_date(user_id, after_date, max_results: int = 100, page_token: str = None,
+                                       fetch_profile: str = "full", account: str = None):
     """
     Fetch unread emails after a given date.
 
     Args:
-        service: Authorized Gmail API service instance.
         user_id (str): User's email address or "me".
         after_date (str): Date in "YYYY/MM/DD" format.
+        max_results (int): Maximum number of emails to return in this chunk.
+        page_token (str): Cursor returned as 'next_page_token' by a previous call.
+        fetch_profile (str): "full" (default) includes the body; "metadata"
+            returns only subject/from/date/snippet/labels, "minimal" only
+            labels and snippet, "raw" the base64url RFC 822 message.
+        account (str): Mailbox to read, see gmail_accounts; default if omitted.
 
     Returns:
-        list of dict: Each dict has 'id', 'subject', 'from', 'date', 'body'.
+        dict: 'messages' is a list of dicts with 'id', 'subject', 'from', 'date',
+        'body' (or 'id' and 'error' for messages that could not be fetched);
+        'next_page_token' continues the listing, None once exhausted.
     """
-    try:
-        service = get_service()
-        query = f'is:unread after:{after_date}'
-        results = service.users().messages().list(userId=user_id, q=query).execute()
-        messages = results.get('messages', [])
-        
+    mailbox = await open_mailbox(account)
+
+    def fetch():
         unread_mails = []
-        for msg in messages:
-            msg_id = msg['id']
-            mail = service.users().messages().get(userId=user_id, id=msg_id, format='full').execute()
-
-            payload = mail.get('payload', {})
-            headers = payload.get('headers', [])
-            subject = from_ = date = None
-            
-            for header in headers:
-                name = header.get("name", "").lower()
-                if name == "subject":
-                    subject = header.get("value")
-                elif name == "from":
-                    from_ = header.get("value")
-                elif name == "date":
-                    date = header.get("value")
-
-            # Extract plain text body
-            body = ""
-            if 'parts' in payload:
-                for part in payload['parts']:
-                    if part['mimeType'] == 'text/plain':
-                        data = part['body'].get('data')
-                        if data:
-                            body = base64.urlsafe_b64decode(data).decode("utf-8")
-                            break
-            else:
-                data = payload.get('body', {}).get('data')
-                if data:
-                    body = base64.urlsafe_b64decode(data).decode("utf-8")
+        next_page_token = None
+        try:
+            for mail, next_page_token in iter_unread_emails_after_date(
+                mailbox, user_id, after_date, limit=max_results, page_token=page_token, profile=fetch_profile
+            ):
+                unread_mails.append(mail)
+        except HttpError as error:
+            logger.error("Could not list unread emails after %s: %s", after_date, error)
+            telemetry.current_span().record_exception(error)
+            return {"messages": [], "next_page_token": None}
+        return {"messages": unread_mails, "next_page_token": next_page_token}
+
+    return await run_io(fetch)
 
-            unread_mails.append({
-                "id": msg_id,
-                "subject": subject,
-                "from": from_,
-                "date": date,
-                "body" : parse_msg(mail)
-            })
+def parse_msg(msg):
+    return extract_body(msg.get("payload", {})) or msg.get("snippet")
 
-        return unread_mails
+def _header_values(msg, names):
+    headers = msg.get('payload', {}).get('headers', [])
+    wanted = {name.lower(): name for name in names}
+    values = {}
+    for header in headers:
+        key = wanted.get(header.get('name', '').lower())
+        if key and key not in values:
+            values[key] = header.get('value')
+    return values
 
-    except HttpError as error:
-        print(f"An error occurred: {error}")
-        return []
 
-def parse_msg(msg):
-    if msg.get("payload").get("body").get("data"):
-        return base64.urlsafe_b64decode(msg.get("payload").get("body").get("data").encode("ASCII")).decode("utf-8")
-    return msg.get("snippet")    
+@mcp.tool()
+async def list_emails(max_results: int = 10, query: str = "", page_token: str = None, account: str = None):
+    """List emails from Gmail
 
-# @mcp.tool()
-# def list_emails(max_results: int = 10, query: str = ""):
-#     """List emails from Gmail
-    
-#     Args:
-#         max_results: Maximum number of emails to return (default: 10)
-#         query: Gmail search query (e.g., "from:example@gmail.com", "is:unread")
-#     """
-#     global service
-    
-#     if not service:
-#         return "Error: Gmail not setup. Please run setup_gmail first."
-    
-#     try:
-#         results = service.users().messages().list(
-#             userId='me', 
-#             maxResults=max_results,
-#             q=query
-#         ).execute()
-        
-#         messages = results.get('messages', [])
-        
-#         if not messages:
-#             return "No messages found."
-        
-#         email_list = []
-#         for message in messages:
-#             msg = service.users().messages().get(userId='me', id=message['id']).execute()
-            
-#             # Extract headers
-#             headers = msg['payload'].get('headers', [])
-#             subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-#             from_email = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
-#             date = next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown Date')
-            
-#             email_list.append({
-#                 'id': message['id'],
-#                 'subject': subject,
-#                 'from': from_email,
-#                 'date': date
-#             })
-        
-#         result = f"Found {len(email_list)} emails:\n\n"
-#         for i, email in enumerate(email_list, 1):
-#             result += f"{i}. ID: {email['id']}\n"
-#             result += f"   From: {email['from']}\n"
-#             result += f"   Subject: {email['subject']}\n"
-#             result += f"   Date: {email['date']}\n\n"
-        
-#         return result
-        
-#     except Exception as e:
-#         return f"Error listing emails: {str(e)}"
+    Args:
+        max_results: Maximum number of emails to return (default: 10)
+        query: Gmail search query (e.g., "from:example@gmail.com", "is:unread")
+        page_token: Cursor returned as 'next_page_token' by a previous call
+        account: Mailbox to list, see gmail_accounts; default if omitted
+
+    Returns:
+        dict: 'messages' with 'id', 'subject', 'from', 'date' and 'next_page_token'.
+    """
+    try:
+        client = get_account(account).client
+        result = await client.list_messages(query=query, max_results=max_results, page_token=page_token)
+        message_ids = [message['id'] for message in result.get('messages', [])]
+        # Metadata fetches overlap on the shared connection pool, FETCH_CONCURRENCY at a time
+        messages = await client.get_messages(message_ids, profile='metadata')
+    except (httpx.HTTPError, ValueError) as error:
+        return f"Error listing emails: {error}"
+
+    email_list = []
+    for msg in messages:
+        headers = _header_values(msg, DEFAULT_METADATA_HEADERS)
+        email_list.append({
+            'id': msg['id'],
+            'subject': headers.get('Subject', 'No Subject'),
+            'from': headers.get('From', 'Unknown Sender'),
+            'date': headers.get('Date', 'Unknown Date'),
+        })
+    return {"messages": email_list, "next_page_token": result.get('nextPageToken')}
+
+
+@mcp.tool()
+async def get_email(message_id: str, account: str = None):
+    """Get a single email by ID
+
+    Args:
+        message_id: Gmail message ID, e.g. from list_emails
+        account: Mailbox the message is in, see gmail_accounts; default if omitted
+
+    Returns:
+        dict: 'id', 'subject', 'from', 'date' and 'body'.
+    """
+    try:
+        mail = await get_account(account).client.get_message(message_id, profile='full')
+    except httpx.HTTPError as error:
+        return f"Error getting email: {error}"
+    return parse_mail(message_id, mail)
+
+
+@mcp.tool()
+async def search_mail(query: str, k: int = 10, account: str = None):
+    """Search locally cached mail by keywords and meaning
+
+    Combines a BM25 full-text index with embedding similarity using
+    reciprocal-rank fusion. Runs entirely on messages already fetched by the
+    other tools (or pushed by the watch), so it uses no Gmail API quota.
+    New messages are embedded in the background; until then they are found
+    by keywords only.
+
+    Args:
+        query: Free-text query, e.g. "invoice from acme last quarter"
+        k: Number of results (default: 10)
+        account: Mailbox to search, see gmail_accounts; default if omitted
+
+    Returns:
+        list: Dicts with 'id', 'subject', 'from', 'date', 'snippet', 'score',
+        'lexical_rank' and 'semantic_rank'.
+    """
+    return await run_cpu((await open_mailbox(account)).index.search, query, k)
+
+
+@mcp.tool()
+async def gmail_save_attachments(message_id: str, account: str = None):
+    """Save a message's attachments to disk
+
+    Attachments are streamed to disk and stored by SHA-256, so the same file
+    received in many messages is kept once, and attachments saved before are
+    not downloaded again.
+
+    Args:
+        message_id: Gmail message ID, e.g. from list_emails
+        account: Mailbox the message is in, see gmail_accounts; default if omitted
+
+    Returns:
+        list: One dict per attachment with 'filename', 'mime_type', 'size',
+        'sha256', 'path' and 'deduplicated', or 'filename' and 'error'.
+    """
+    mailbox = await open_mailbox(account)
+    client = mailbox.account.client
+    try:
+        mail = await client.get_message(message_id, profile='full')
+    except httpx.HTTPError as error:
+        return f"Error getting email: {error}"
+
+    async def save(part):
+        try:
+            return await save_attachment(client, mailbox.attachments, message_id, part)
+        except (httpx.HTTPError, OSError, ValueError) as error:
+            return {"filename": part.get("filename"), "error": str(error)}
+
+    parts = [part for part in walk_parts(mail.get("payload", {})) if is_attachment(part)]
+    return list(await asyncio.gather(*(save(part) for part in parts)))
+
+
+@mcp.tool()
+async def gmail_watch_start(topic_name: str = None, label_ids: list[str] = None, port: int = None,
+                            account: str = None):
+    """Switch new-mail ingestion from polling to Gmail push notifications
+
+    Registers a Gmail watch on a Cloud Pub/Sub topic and starts a local
+    endpoint for its push subscription (WATCH_PUSH_HOST/WATCH_PUSH_PORT,
+    path /gmail/push, optional ?token=WATCH_PUSH_TOKEN). Each notification
+    triggers one incremental history sync and prefetches new messages into
+    the mail cache, so the unread-mail tools no longer sync on every call.
+
+    Args:
+        topic_name: "projects/<project>/topics/<topic>", defaults to GMAIL_WATCH_TOPIC
+        label_ids: Only watch these labels, e.g. ["INBOX"]; all mail if omitted
+        port: Local port of the push endpoint, defaults to WATCH_PUSH_PORT;
+            every watched account needs its own
+        account: Mailbox to watch, see gmail_accounts; default if omitted
+
+    Returns:
+        dict: 'historyId', 'expiration' and 'push_url'.
+    """
+    topic_name = topic_name or os.getenv("GMAIL_WATCH_TOPIC")
+    if not topic_name:
+        return "Error starting watch: no topic_name given and GMAIL_WATCH_TOPIC is not set"
+    watcher = (await open_mailbox(account)).watcher
+    try:
+        response = await run_io(
+            watcher.start, topic_name, label_ids, port=port or PUSH_PORT, token=os.getenv("WATCH_PUSH_TOKEN")
+        )
+    except (HttpError, OSError, ValueError) as error:
+        return f"Error starting watch: {error}"
+    return {**response, "push_url": watcher.receiver.url}
+
+
+@mcp.tool()
+async def gmail_watch_stop(account: str = None):
+    """Stop Gmail push notifications for an account and go back to polling"""
+    await run_io((await open_mailbox(account)).watcher.stop)
+    return "Watch stopped"
+
+
+@mcp.tool()
+async def gmail_watch_status(account: str = None):
+    """Push notification counters of an account: notifications, syncs, new messages, expiration"""
+    return (await open_mailbox(account)).watcher.stats()
+
+
+@mcp.tool()
+async def gmail_get_status(account: str = None):
+    """Check Gmail authentication and connection status of an account"""
+    try:
+        profile = await get_account(account).client.get_profile()
+        email = profile['emailAddress']
+        return f"Status: Connected and ready! Authenticated as: {email}"
+    except Exception as e:
+        return f"Status: Error checking connection - {str(e)}"
 
-# @mcp.tool()
-# def get_status():
-#     """Check Gmail authentication and connection status"""
-#     global service, creds
-    
-#     if not creds:
-#         return "Status: Not authenticated. Run setup_gmail first."
-    
-#     if not service:
-#         return "Status: Authenticated but service unavailable."
-        
-#     try:
-#         profile = service.users().getProfile(userId='me').execute()
-#         email = profile['emailAddress']
-#         return f"Status: Connected and ready! Authenticated as: {email}"
-#     except Exception as e:
-#         return f"Status: Error checking connection - {str(e)}"
-    
 if __name__ == "__main__":
     # Initialize and run the server
     # gmail_create_draft(to="dikki6067@gmail.com", subject="Automated Draft", body="This is an automated draft email.")
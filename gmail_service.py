@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+
+# Refresh this long before the access token actually expires
+REFRESH_MARGIN = timedelta(minutes=5)
+# Back-off used by the background refresher after a failed refresh
+REFRESH_RETRY_SECONDS = 60
+
+# Send API calls to another server, e.g. the benchmarks' fake Gmail
+# ("http://127.0.0.1:8089/", with the trailing slash)
+API_ENDPOINT = os.getenv("GMAIL_API_ENDPOINT")
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow() -> datetime:
+    # google-auth stores Credentials.expiry as a naive UTC datetime
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class GmailServiceManager:
+    """Process-wide owner of the Gmail credentials and API client.
+
+    Credentials are loaded once and refreshed in place by a background
+    thread shortly before they expire. ``token.json`` is only rewritten when
+    the serialized token actually changes. The discovery-built service is
+    cached per thread because the underlying httplib2 transport is not
+    thread-safe.
+    """
+
+    def __init__(self, token_path: str = "token.json",
+                 credentials_path: str = "credentials.json",
+                 scopes: list = SCOPES):
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.scopes = scopes
+
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._creds = None
+        self._generation = 0
+        self._persisted_token = None
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def get_credentials(self) -> Credentials:
+        """Return valid credentials, loading or refreshing them if needed."""
+        with self._lock:
+            if self._creds is None:
+                self._creds = self._load_credentials()
+                self._generation += 1
+                self._start_refresher()
+            elif not self._creds.valid or self._expires_soon():
+                self._refresh()
+            return self._creds
+
+    def get_service(self):
+        """Return the Gmail API service for the calling thread."""
+        creds = self.get_credentials()
+        cached = getattr(self._local, "service", None)
+        if cached is None or cached[0] != self._generation:
+            service = build_service(creds)
+            cached = (self._generation, service)
+            self._local.service = cached
+        return cached[1]
+
+    def close(self):
+        """Stop the background refresher."""
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=1)
+            self._refresher = None
+
+    def _load_credentials(self) -> Credentials:
+        creds = None
+        if os.path.exists(self.token_path):
+            creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+            self._persisted_token = creds.to_json()
+
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.scopes)
+                creds = flow.run_local_server(port=0)
+            self._persist(creds)
+        return creds
+
+    def _refresh(self):
+        if not self._creds.refresh_token:
+            # Nothing we can do silently; force the interactive flow again
+            self._creds = self._load_credentials()
+            self._generation += 1
+            return
+        self._creds.refresh(Request())
+        self._persist(self._creds)
+
+    def _persist(self, creds: Credentials):
+        token = creds.to_json()
+        if token == self._persisted_token:
+            return
+        tmp_path = f"{self.token_path}.tmp"
+        with open(tmp_path, "w") as token_file:
+            token_file.write(token)
+        os.replace(tmp_path, self.token_path)
+        self._persisted_token = token
+
+    def _expires_soon(self) -> bool:
+        expiry = self._creds.expiry
+        return expiry is not None and expiry - REFRESH_MARGIN <= _utcnow()
+
+    def _seconds_until_refresh(self):
+        with self._lock:
+            if self._creds is None or self._creds.expiry is None:
+                return None
+            delay = (self._creds.expiry - REFRESH_MARGIN - _utcnow()).total_seconds()
+        return max(delay, 0)
+
+    def _start_refresher(self):
+        if self._refresher is not None or not self._creds.refresh_token:
+            return
+        self._refresher = threading.Thread(
+            target=self._refresh_loop, name="gmail-token-refresher", daemon=True
+        )
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            delay = self._seconds_until_refresh()
+            if delay is None or self._stop.wait(delay):
+                return
+            try:
+                with self._lock:
+                    if self._expires_soon():
+                        self._refresh()
+            except Exception:
+                logger.exception("Background Gmail token refresh failed")
+                if self._stop.wait(REFRESH_RETRY_SECONDS):
+                    return
+
+
+def build_service(creds: Credentials, endpoint: str = API_ENDPOINT):
+    """Build the Gmail API service, optionally against another endpoint."""
+    if not endpoint:
+        return build("gmail", "v1", credentials=creds, cache_discovery=False)
+    # client_options only moves regular calls; batch requests use the
+    # discovery document's rootUrl, so rewrite that instead
+    document = json.loads(get_static_doc("gmail", "v1"))
+    document["rootUrl"] = endpoint
+    return build_from_document(document, credentials=creds)
+
+
+# Credentials of the default account (token.json in the working directory)
+default_manager = GmailServiceManager()
+
+
+def get_service():
+    """Get the cached Gmail service with authentication"""
+    return default_manager.get_service()
+
+
+def get_credentials() -> Credentials:
+    """Get the cached, auto-refreshed Gmail credentials"""
+    return default_manager.get_credentials()
@@ -0,0 +1,290 @@
+import base64
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from gmail_quota import RequestScheduler, scheduler as default_scheduler
+
+PUSH_HOST = os.getenv("WATCH_PUSH_HOST", "127.0.0.1")
+PUSH_PORT = int(os.getenv("WATCH_PUSH_PORT", "8085"))
+PUSH_PATH = "/gmail/push"
+
+# Gmail stops a watch after 7 days; Google recommends renewing daily
+WATCH_RENEW_INTERVAL = 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+
+def start_watch(service, topic_name: str, label_ids: Optional[List[str]] = None, user_id: str = "me",
+                scheduler: RequestScheduler = default_scheduler) -> dict:
+    """
+    Ask Gmail to publish mailbox changes to a Cloud Pub/Sub topic.
+
+    Args:
+        service: Authorized Gmail API service instance.
+        topic_name (str): Full topic name, "projects/<project>/topics/<topic>".
+        label_ids (list): Only notify for changes to these labels; all if None.
+        user_id (str): User's email address or "me".
+        scheduler (RequestScheduler): Quota and retry gate of the account.
+
+    Returns:
+        dict: 'historyId' and 'expiration' (epoch milliseconds).
+    """
+    body = {"topicName": topic_name}
+    if label_ids:
+        body["labelIds"] = label_ids
+        body["labelFilterBehavior"] = "include"
+    return scheduler.execute(service.users().watch(userId=user_id, body=body))
+
+
+def stop_watch(service, user_id: str = "me", scheduler: RequestScheduler = default_scheduler):
+    scheduler.execute(service.users().stop(userId=user_id))
+
+
+def decode_push(body: bytes) -> dict:
+    """
+    Decode a Pub/Sub push request body into the Gmail notification.
+
+    Returns:
+        dict: 'emailAddress' and 'historyId'.
+
+    Raises:
+        ValueError: The body is not a Gmail push notification.
+    """
+    try:
+        envelope = json.loads(body)
+        notification = json.loads(base64.b64decode(envelope["message"]["data"]))
+        return {"emailAddress": notification["emailAddress"], "historyId": int(notification["historyId"])}
+    except (KeyError, TypeError, ValueError) as error:
+        raise ValueError(f"not a Gmail push notification: {error}") from error
+
+
+class PushReceiver:
+    """Minimal HTTP endpoint for a Pub/Sub push subscription.
+
+    Accepts POSTs on PUSH_PATH, optionally requiring ``?token=<token>`` in
+    the URL, and acknowledges with 204 once ``on_notification`` has been
+    handed the decoded notification. Anything else gets a 4xx, which makes
+    Pub/Sub redeliver.
+    """
+
+    def __init__(self, on_notification: Callable[[dict], None], host: str = PUSH_HOST,
+                 port: int = PUSH_PORT, token: Optional[str] = None):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path != PUSH_PATH:
+                    self.send_error(404)
+                    return
+                if receiver.token and parse_qs(url.query).get("token", [None])[0] != receiver.token:
+                    self.send_error(403)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    notification = decode_push(self.rfile.read(length))
+                except ValueError as error:
+                    self.send_error(400, str(error))
+                    return
+                receiver.on_notification(notification)
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug("push receiver: " + format, *args)
+
+        self.on_notification = on_notification
+        self.token = token
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{PUSH_PATH}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="gmail-push", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MailWatcher:
+    """Event-driven mailbox sync.
+
+    Gmail watch notifications (via PushReceiver) wake a worker thread that
+    runs one incremental ``history.list`` sync of the mail cache and hands
+    newly added message IDs to ``on_new_messages`` for prefetching. Bursts
+    of notifications are coalesced into a single sync, redelivered or stale
+    notifications are ignored, and the watch is renewed daily. While the
+    watch is active the cache is marked as watched so the polling tools stop
+    issuing their own history.list calls.
+
+    Args:
+        cache: MailCache to keep current.
+        get_service: Returns an authorized Gmail service for the worker thread.
+        on_new_messages: Called with (service, message_ids) for new mail.
+        user_id (str): User's email address or "me".
+        scheduler (RequestScheduler): Quota and retry gate of the account.
+    """
+
+    def __init__(self, cache, get_service: Callable, on_new_messages: Callable = None, user_id: str = "me",
+                 scheduler: RequestScheduler = default_scheduler):
+        self.cache = cache
+        self.scheduler = scheduler
+        self.get_service = get_service
+        self.on_new_messages = on_new_messages
+        self.user_id = user_id
+        self.receiver: Optional[PushReceiver] = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._latest_history_id = 0
+        self._worker = None
+        self._renew_timer = None
+        self._topic_name = None
+        self._label_ids = None
+        self._address = None
+        self._stats = {
+            "notifications": 0,
+            "stale_notifications": 0,
+            "syncs": 0,
+            "history_records": 0,
+            "new_messages": 0,
+            "errors": 0,
+            "expiration": None,
+        }
+
+    def start(self, topic_name: str, label_ids: Optional[List[str]] = None, host: str = PUSH_HOST,
+              port: int = PUSH_PORT, token: Optional[str] = None) -> dict:
+        """Start the push receiver and worker, then register the Gmail watch.
+
+        If already running, the watch is re-issued with the new topic and
+        labels (users.watch replaces the mailbox's previous watch).
+
+        Raises:
+            ValueError: Already running with the receiver on another address.
+        """
+        if self.receiver is not None:
+            if (host, port) != self._address:
+                raise ValueError(f"push receiver already listening on {self.receiver.url}; stop the watch first")
+            previous = self._topic_name, self._label_ids
+            self._topic_name, self._label_ids = topic_name, label_ids
+            try:
+                response = self.renew()
+            except Exception:
+                # Gmail keeps the previous watch, so keep renewing that one
+                self._topic_name, self._label_ids = previous
+                raise
+            self.receiver.token = token
+            return response
+        self._topic_name = topic_name
+        self._label_ids = label_ids
+        self._address = (host, port)
+        self._stopped.clear()
+        self.receiver = PushReceiver(self.notify, host=host, port=port, token=token)
+        self.receiver.start()
+        self._worker = threading.Thread(target=self._run, name="gmail-watch", daemon=True)
+        self._worker.start()
+        try:
+            return self.renew()
+        except Exception:
+            self._shutdown()
+            raise
+
+    def renew(self) -> dict:
+        response = start_watch(self.get_service(), self._topic_name, self._label_ids, self.user_id, self.scheduler)
+        with self._lock:
+            self._stats["expiration"] = int(response.get("expiration", 0))
+        self.cache.set_watched(self.user_id)
+        self._schedule_renewal()
+        return response
+
+    def _schedule_renewal(self):
+        if self._renew_timer is not None:
+            self._renew_timer.cancel()
+
+        def renew():
+            try:
+                self.renew()
+            except Exception as error:
+                # Fall back to polling until the next renewal attempt succeeds
+                logger.warning("Renewing Gmail watch failed: %s", error)
+                self.cache.set_watched(self.user_id, False)
+                self._count(errors=1)
+                self._schedule_renewal()
+
+        self._renew_timer = threading.Timer(WATCH_RENEW_INTERVAL, renew)
+        self._renew_timer.daemon = True
+        self._renew_timer.start()
+
+    def stop(self):
+        self._shutdown()
+        try:
+            stop_watch(self.get_service(), self.user_id, self.scheduler)
+        except Exception as error:
+            logger.warning("Stopping Gmail watch failed: %s", error)
+
+    def _shutdown(self):
+        self._stopped.set()
+        self._wake.set()
+        self.cache.set_watched(self.user_id, False)
+        if self._renew_timer is not None:
+            self._renew_timer.cancel()
+            self._renew_timer = None
+        if self.receiver is not None:
+            self.receiver.stop()
+            self.receiver = None
+
+    def notify(self, notification: dict):
+        """Record a notification and wake the worker, skipping ones already synced past."""
+        history_id = notification["historyId"]
+        with self._lock:
+            self._stats["notifications"] += 1
+            if history_id <= self._latest_history_id:
+                self._stats["stale_notifications"] += 1
+                return
+            self._latest_history_id = history_id
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            if self._stopped.is_set():
+                return
+            self._wake.clear()
+            try:
+                self.sync()
+            except Exception as error:
+                logger.warning("Gmail watch sync failed: %s", error)
+                self._count(errors=1)
+
+    def sync(self) -> int:
+        service = self.get_service()
+        added = []
+        applied = self.cache.sync(service, self.user_id, force=True, on_added=added.extend)
+        self._count(syncs=1, history_records=applied, new_messages=len(added))
+        if added and self.on_new_messages:
+            self.on_new_messages(service, added)
+        return applied
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._stats[key] += delta
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["active"] = self.receiver is not None
+        stats["push_url"] = self.receiver.url if self.receiver else None
+        stats["latest_history_id"] = self._latest_history_id
+        return stats
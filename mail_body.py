@@ -0,0 +1,152 @@
+import base64
+import binascii
+import codecs
+from html.parser import HTMLParser
+from typing import Iterator, Optional
+
+DEFAULT_CHARSET = "utf-8"
+
+# Tags whose text never belongs in the readable body
+SKIPPED_TAGS = {"script", "style", "head", "title"}
+# Tags that start a new line when flattening HTML
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "br", "div", "dl", "dt", "dd", "footer",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "ol", "p", "pre",
+    "section", "table", "tr", "ul",
+}
+
+
+def walk_parts(payload: dict) -> Iterator[dict]:
+    """
+    Yield the leaf parts of a Gmail message payload in document order.
+
+    Nested multipart containers (mixed, alternative, related, ...) are
+    walked with an explicit stack, so arbitrarily deep messages do not
+    recurse and no intermediate lists are built.
+    """
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get("parts")
+        if children:
+            stack.extend(reversed(children))
+        else:
+            yield part
+
+
+def part_header(part: dict, name: str) -> Optional[str]:
+    name = name.lower()
+    for header in part.get("headers", ()):
+        if header.get("name", "").lower() == name:
+            return header.get("value")
+    return None
+
+
+def part_charset(part: dict) -> str:
+    """Charset from the part's Content-Type header, defaulting to UTF-8."""
+    content_type = part_header(part, "Content-Type") or ""
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "charset":
+            charset = value.strip().strip('"\'')
+            try:
+                return codecs.lookup(charset).name
+            except LookupError:
+                break
+    return DEFAULT_CHARSET
+
+
+def is_attachment(part: dict) -> bool:
+    if part.get("filename") or part.get("body", {}).get("attachmentId"):
+        return True
+    disposition = part_header(part, "Content-Disposition") or ""
+    return disposition.split(";", 1)[0].strip().lower() == "attachment"
+
+
+def decode_part(part: dict) -> str:
+    """
+    Decode a leaf part's base64url body into text using its charset.
+
+    The data is decoded straight from the API string into bytes and then
+    once into text; missing padding is tolerated and undecodable bytes are
+    replaced rather than failing the whole message.
+    """
+    data = part.get("body", {}).get("data")
+    if not data:
+        return ""
+    padding = -len(data) % 4
+    if padding:
+        data += "=" * padding
+    try:
+        raw = base64.urlsafe_b64decode(data)
+    except (binascii.Error, ValueError):
+        return ""
+    return raw.decode(part_charset(part), errors="replace")
+
+
+class _HTMLText(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.chunks.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Flatten HTML to readable text: drop scripts/styles, keep line breaks between blocks."""
+    parser = _HTMLText()
+    parser.feed(html)
+    parser.close()
+    lines = (" ".join(line.split()) for line in "".join(parser.chunks).splitlines())
+    text = []
+    for line in lines:
+        if line or (text and text[-1]):
+            text.append(line)
+    return "\n".join(text).strip()
+
+
+def extract_body(payload: dict, convert_html: bool = True) -> str:
+    """
+    Extract the readable body of a Gmail message payload.
+
+    text/plain is preferred over text/html wherever it appears in the
+    part tree, and only the chosen part is decoded. Attachments are skipped.
+
+    Args:
+        payload (dict): The message's 'payload' from a format=full fetch.
+        convert_html (bool): Flatten an HTML-only body to text; if False
+            the HTML is returned as-is.
+
+    Returns:
+        str: The body text, or "" when the message has no text part.
+    """
+    html_part = None
+    for part in walk_parts(payload):
+        mime_type = part.get("mimeType", "").lower()
+        if not mime_type.startswith("text/") or is_attachment(part):
+            continue
+        if mime_type == "text/plain":
+            text = decode_part(part)
+            if text.strip():
+                return text
+        if mime_type == "text/html" and html_part is None:
+            html_part = part
+    if html_part is None:
+        return ""
+    html = decode_part(html_part)
+    return html_to_text(html) if convert_html else html
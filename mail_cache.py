@@ -0,0 +1,373 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+import telemetry
+from gmail_fetch import MAX_PAGE_SIZE
+from gmail_quota import RequestScheduler, scheduler as default_scheduler
+
+# Skip the history.list round trip if we synced this recently
+MIN_SYNC_INTERVAL = 10.0
+
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+
+# Bump when SCHEMA changes; older cache files are dropped and rebuilt
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    thread_id TEXT,
+    history_id INTEGER,
+    internal_date INTEGER,
+    headers TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    snippet TEXT,
+    PRIMARY KEY (id, profile)
+);
+CREATE TABLE IF NOT EXISTS labels (
+    message_id TEXT NOT NULL,
+    label_id TEXT NOT NULL,
+    PRIMARY KEY (message_id, label_id)
+);
+CREATE INDEX IF NOT EXISTS labels_by_label ON labels (label_id);
+CREATE TABLE IF NOT EXISTS queries (
+    key TEXT PRIMARY KEY,
+    message_ids TEXT NOT NULL,
+    next_page_token TEXT
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class MailCache:
+    """Persistent SQLite store of fetched Gmail messages.
+
+    Messages are keyed by ID and fetch profile and hold their headers, the
+    parsed summary returned by the tools (e.g. subject, from, date, decoded
+    body) and labels.
+    ``sync`` keeps the store current by replaying ``users.history.list``
+    from the last stored ``historyId``, so only changes touch the network.
+    Query results are cached too and dropped whenever a sync sees changes.
+
+    Args:
+        path (str): SQLite file; use one per account.
+        scheduler (RequestScheduler): Quota and retry gate for sync's API calls.
+    """
+
+    def __init__(self, path: str = "mail_cache.db", scheduler: RequestScheduler = default_scheduler):
+        self.path = path
+        self.scheduler = scheduler
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.executescript(
+                "DROP TABLE IF EXISTS messages; DROP TABLE IF EXISTS labels;"
+                "DROP TABLE IF EXISTS queries; DROP TABLE IF EXISTS state;"
+            )
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.executescript(SCHEMA)
+        self._last_sync: Dict[str, float] = {}
+        # Mailboxes kept current by push notifications; callers need not poll them
+        self._watched = set()
+        self._listeners = []
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_listener(self, listener):
+        """Register an object with message_stored(id, summary, profile) and message_deleted(id) hooks."""
+        self._listeners.append(listener)
+
+    # -- messages -------------------------------------------------------
+
+    def get_many(self, message_ids: Iterable[str], profile: str = "full") -> Dict[str, dict]:
+        """Return cached summaries for the given IDs and profile, skipping unknown ones.
+
+        History sync only updates the labels table, so summaries that carry
+        'labels' get them from there rather than from the stored JSON.
+        """
+        message_ids = list(message_ids)
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(message_ids), 500):
+                chunk = message_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id, summary FROM messages WHERE profile = ? AND id IN ({placeholders})",
+                    [profile, *chunk],
+                )
+                labelled = []
+                for msg_id, summary in rows:
+                    found[msg_id] = json.loads(summary)
+                    if "labels" in found[msg_id]:
+                        found[msg_id]["labels"] = []
+                        labelled.append(msg_id)
+                if labelled:
+                    rows = self._conn.execute(
+                        f"SELECT message_id, label_id FROM labels WHERE message_id IN ({','.join('?' * len(labelled))})"
+                        " ORDER BY rowid",
+                        labelled,
+                    )
+                    for msg_id, label in rows:
+                        found[msg_id]["labels"].append(label)
+        return found
+
+    def get_labels(self, message_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT label_id FROM labels WHERE message_id = ?", (message_id,)
+            )
+            return [label for (label,) in rows]
+
+    def store(self, message: dict, summary: dict, profile: str = "full"):
+        """Store a Gmail message resource together with its parsed summary."""
+        headers = message.get("payload", {}).get("headers", [])
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    message["id"],
+                    profile,
+                    message.get("threadId"),
+                    int(message.get("historyId", 0)),
+                    int(message.get("internalDate", 0)),
+                    json.dumps(headers),
+                    json.dumps(summary),
+                    message.get("snippet"),
+                ),
+            )
+            self._set_labels(message["id"], message.get("labelIds", []))
+        for listener in self._listeners:
+            listener.message_stored(message["id"], summary, profile)
+
+    def _set_labels(self, message_id: str, label_ids: Iterable[str]):
+        self._conn.execute("DELETE FROM labels WHERE message_id = ?", (message_id,))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO labels VALUES (?, ?)",
+            [(message_id, label) for label in label_ids],
+        )
+
+    # -- cached queries -------------------------------------------------
+
+    def get_query(self, key: str) -> Optional[Tuple[List[str], Optional[str]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT message_ids, next_page_token FROM queries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put_query(self, key: str, message_ids: List[str], next_page_token: Optional[str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queries VALUES (?, ?, ?)",
+                (key, json.dumps(message_ids), next_page_token),
+            )
+
+    # -- history sync ---------------------------------------------------
+
+    def get_history_id(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE key = ?", (f"history_id:{user_id}",)
+            ).fetchone()
+        return int(row[0]) if row else None
+
+    def _set_history_id(self, user_id: str, history_id):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO state VALUES (?, ?)",
+            (f"history_id:{user_id}", str(history_id)),
+        )
+
+    def set_watched(self, user_id: str, watched: bool = True):
+        """Mark a mailbox as pushed-to; unforced syncs for it become no-ops."""
+        if watched:
+            self._watched.add(user_id)
+        else:
+            self._watched.discard(user_id)
+
+    def is_watched(self, user_id: str) -> bool:
+        return user_id in self._watched
+
+    def sync(self, service, user_id: str = "me", force: bool = False,
+             on_added: Optional[Callable[[List[str]], None]] = None) -> int:
+        """
+        Apply mailbox changes since the last stored historyId.
+
+        Args:
+            service: Authorized Gmail API service instance.
+            user_id (str): User's email address or "me".
+            force (bool): Ignore MIN_SYNC_INTERVAL and push watches.
+            on_added: Called with the IDs of newly added messages that are
+                not cached yet, e.g. to prefetch them.
+
+        Returns:
+            int: Number of history records applied.
+        """
+        now = time.monotonic()
+        if not force and user_id in self._watched:
+            return 0
+        if not force and now - self._last_sync.get(user_id, float("-inf")) < MIN_SYNC_INTERVAL:
+            return 0
+
+        start_history_id = self.get_history_id(user_id)
+        if start_history_id is None:
+            self._reset(service, user_id)
+            self._last_sync[user_id] = now
+            return 0
+
+        applied = 0
+        added = []
+        latest_history_id = start_history_id
+        page_token = None
+        try:
+            while True:
+                params = {
+                    "userId": user_id,
+                    "startHistoryId": start_history_id,
+                    "historyTypes": HISTORY_TYPES,
+                    "maxResults": MAX_PAGE_SIZE,
+                }
+                if page_token:
+                    params["pageToken"] = page_token
+                result = self.scheduler.execute(service.users().history().list(**params))
+                records = result.get("history", [])
+                if records:
+                    added.extend(self._apply(records))
+                    applied += len(records)
+                latest_history_id = int(result.get("historyId", latest_history_id))
+                page_token = result.get("nextPageToken")
+                if not page_token:
+                    break
+        except HttpError as error:
+            if error.resp.status != 404:
+                raise
+            # startHistoryId is too old to replay; start over from now
+            logger.info("Gmail history %s expired, resetting mail cache", start_history_id)
+            self._reset(service, user_id)
+            self._last_sync[user_id] = now
+            return 0
+
+        with self._lock, self._conn:
+            if applied:
+                self._conn.execute("DELETE FROM queries")
+            self._set_history_id(user_id, latest_history_id)
+        self._last_sync[user_id] = now
+        if on_added and added:
+            on_added(list(dict.fromkeys(added)))
+        return applied
+
+    def _reset(self, service, user_id: str):
+        profile = self.scheduler.execute(service.users().getProfile(userId=user_id))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages")
+            self._conn.execute("DELETE FROM labels")
+            self._conn.execute("DELETE FROM queries")
+            self._set_history_id(user_id, profile["historyId"])
+
+    def _apply(self, records: List[dict]) -> List[str]:
+        """Apply history records; returns IDs of added messages that are not cached."""
+        added = []
+        deleted = []
+        with self._lock, self._conn:
+            for record in records:
+                for entry in record.get("messagesDeleted", []):
+                    msg_id = entry["message"]["id"]
+                    deleted.append(msg_id)
+                    self._conn.execute("DELETE FROM messages WHERE id = ?", (msg_id,))
+                    self._conn.execute("DELETE FROM labels WHERE message_id = ?", (msg_id,))
+                for entry in record.get("messagesAdded", []):
+                    message = entry["message"]
+                    if self._is_cached(message["id"]):
+                        self._set_labels(message["id"], message.get("labelIds", []))
+                    else:
+                        added.append(message["id"])
+                for entry in record.get("labelsAdded", []):
+                    msg_id = entry["message"]["id"]
+                    if self._is_cached(msg_id):
+                        self._conn.executemany(
+                            "INSERT OR IGNORE INTO labels VALUES (?, ?)",
+                            [(msg_id, label) for label in entry.get("labelIds", [])],
+                        )
+                for entry in record.get("labelsRemoved", []):
+                    msg_id = entry["message"]["id"]
+                    self._conn.executemany(
+                        "DELETE FROM labels WHERE message_id = ? AND label_id = ?",
+                        [(msg_id, label) for label in entry.get("labelIds", [])],
+                    )
+        for msg_id in deleted:
+            for listener in self._listeners:
+                listener.message_deleted(msg_id)
+        return added
+
+    def _is_cached(self, message_id: str) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM messages WHERE id = ?", (message_id,)
+        ).fetchone() is not None
+
+
+def cached_page(cache: MailCache, key: str, profile: str,
+                list_page: Callable[[], Tuple[List[dict], Optional[str]]],
+                fetch: Callable[[List[str]], Tuple[Dict[str, dict], Dict[str, str]]],
+                summarize: Callable[[str, dict], dict]) -> Tuple[List[dict], Optional[str]]:
+    """
+    Answer one page of a message query, touching the network only for deltas.
+
+    Call ``cache.sync`` first so cached pages reflect the latest mailbox state.
+
+    Args:
+        cache: MailCache to read from and write to.
+        key (str): Identifies the page, e.g. its query, size and page token.
+        profile (str): Fetch profile the summaries were built from.
+        list_page: Returns (message stubs, next_page_token) from the API.
+        fetch: Fetches message resources by ID, returning (messages, errors).
+        summarize: Turns (message_id, message) into the dict returned to callers.
+
+    Returns:
+        tuple: (summaries, next_page_token). Failed fetches appear as
+        {'id', 'error'} entries.
+    """
+    hit = cache.get_query(key)
+    telemetry.record_cache("mail_queries", hits=int(hit is not None), misses=int(hit is None))
+    if hit is not None:
+        message_ids, next_page_token = hit
+    else:
+        stubs, next_page_token = list_page()
+        message_ids = [stub["id"] for stub in stubs]
+
+    summaries = cache.get_many(message_ids, profile)
+    missing = [msg_id for msg_id in message_ids if msg_id not in summaries]
+    telemetry.record_cache("mail_messages", hits=len(message_ids) - len(missing), misses=len(missing))
+    errors = {}
+    if missing:
+        fetched, errors = fetch(missing)
+        for msg_id, message in fetched.items():
+            summary = summarize(msg_id, message)
+            cache.store(message, summary, profile)
+            summaries[msg_id] = summary
+
+    if hit is None and not errors:
+        cache.put_query(key, message_ids, next_page_token)
+
+    results = [
+        summaries[msg_id] if msg_id in summaries else {"id": msg_id, "error": errors.get(msg_id, "not found")}
+        for msg_id in message_ids
+    ]
+    return results, next_page_token
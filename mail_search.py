@@ -0,0 +1,408 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional
+
+import telemetry
+
+SEARCH_DB = "mail_search.db"
+VECTOR_INDEX_FILE = "mail_search.faiss"
+
+# Constant from the original reciprocal-rank fusion paper (Cormack et al.)
+RRF_K = 60
+# Candidates taken from each ranker before fusion, per requested result
+CANDIDATES_PER_RESULT = 10
+# Messages embedded per model call when catching up on new mail
+EMBED_BATCH_SIZE = 64
+# Batches a search may embed inline when there is no background worker
+SEARCH_EMBED_BATCHES = 1
+# Characters of the body fed to the embedding model; longer text is truncated by it anyway
+EMBED_TEXT_CHARS = 2000
+# Column weights for bm25(): subject, sender, snippet, body
+BM25_WEIGHTS = (5.0, 2.0, 1.0, 1.0)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    profile TEXT NOT NULL,
+    subject TEXT,
+    sender TEXT,
+    date TEXT,
+    snippet TEXT,
+    body TEXT,
+    embedded INTEGER NOT NULL DEFAULT 0
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    subject, sender, snippet, body, content='docs', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO docs_fts(rowid, subject, sender, snippet, body)
+    VALUES (new.rowid, new.subject, new.sender, new.snippet, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, subject, sender, snippet, body)
+    VALUES ('delete', old.rowid, old.subject, old.sender, old.snippet, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_au AFTER UPDATE OF subject, sender, snippet, body ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, subject, sender, snippet, body)
+    VALUES ('delete', old.rowid, old.subject, old.sender, old.snippet, old.body);
+    INSERT INTO docs_fts(rowid, subject, sender, snippet, body)
+    VALUES (new.rowid, new.subject, new.sender, new.snippet, new.body);
+END;
+CREATE INDEX IF NOT EXISTS docs_pending ON docs (embedded);
+"""
+
+# Richer profiles replace poorer ones in the index, never the other way round
+PROFILE_RANK = {"minimal": 0, "metadata": 1, "full": 2}
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+logger = logging.getLogger(__name__)
+
+
+def vector_index_file(model_key: str) -> str:
+    """Per-model FAISS file, so switching embedding models re-embeds instead of mixing vectors."""
+    return f"mail_search.{re.sub(r'[^A-Za-z0-9]+', '-', model_key).strip('-')}.faiss"
+
+
+def fts_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 OR-query of quoted terms, so user input cannot break the syntax."""
+    terms = dict.fromkeys(term.lower() for term in TOKEN.findall(query))
+    return " OR ".join(f'"{term}"' for term in terms) or None
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = RRF_K) -> Dict[int, float]:
+    """Fuse ranked ID lists: each list contributes 1 / (k + rank) for every ID it contains."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+class MailSearchIndex:
+    """Local hybrid (BM25 + embedding) search over fetched messages.
+
+    Lexical search uses an SQLite FTS5 inverted index ranked by BM25;
+    semantic search uses a FAISS inner-product index over normalized message
+    embeddings, keyed by the same row IDs. Results are merged with
+    reciprocal-rank fusion. Register the index as a MailCache listener and
+    every stored message is indexed lexically at once; embeddings are
+    computed in batches by ``embed_pending``. With ``background`` a worker
+    thread does that from the first search on, woken by every stored
+    message, so searches never wait for a backlog. Without it a search
+    embeds at most SEARCH_EMBED_BATCHES batches inline. Messages not yet
+    embedded are still found by BM25.
+
+    If the embedding model cannot be loaded, search falls back to BM25 only.
+
+    Args:
+        path (str): SQLite database for documents and the inverted index.
+        vector_path (str): File the FAISS index is persisted to.
+        get_embeddings: Returns a langchain Embeddings object; called lazily.
+        background (bool): Embed new messages in a worker thread.
+    """
+
+    def __init__(self, path: str = SEARCH_DB, vector_path: str = VECTOR_INDEX_FILE,
+                 get_embeddings: Optional[Callable] = None, background: bool = False):
+        self.path = path
+        self.vector_path = vector_path
+        self.get_embeddings = get_embeddings
+        self.background = background
+        self._lock = threading.RLock()
+        self._embed_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+        self._closed = False
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._vectors = self._load_vectors()
+        self._vectors_dirty = False
+        self._semantic_error = None
+
+    def _load_vectors(self):
+        if not os.path.exists(self.vector_path):
+            with self._conn:
+                self._conn.execute("UPDATE docs SET embedded = 0")
+            return None
+        import faiss
+
+        index = faiss.read_index(self.vector_path)
+        self._reconcile(index)
+        return index
+
+    def _reconcile(self, index):
+        """Bring a saved index and the embedded flags back in line after an unclean shutdown.
+
+        Vectors of rows deleted or changed since the index was saved are
+        dropped, and rows marked embedded without a vector are queued again,
+        so only the difference is re-embedded.
+        """
+        import faiss
+        import numpy as np
+
+        indexed = set(faiss.vector_to_array(index.id_map).tolist())
+        embedded = {rowid for (rowid,) in self._conn.execute("SELECT rowid FROM docs WHERE embedded = 1")}
+        stale = indexed - embedded
+        missing = embedded - indexed
+        if stale:
+            index.remove_ids(np.array(sorted(stale), dtype=np.int64))
+        if missing:
+            with self._conn:
+                self._conn.executemany("UPDATE docs SET embedded = 0 WHERE rowid = ?", [(r,) for r in missing])
+        if stale or missing:
+            logger.info("Mail vector index out of sync with %s: dropped %d vectors, re-embedding %d messages",
+                        self.path, len(stale), len(missing))
+            faiss.write_index(index, self.vector_path + ".tmp")
+            os.replace(self.vector_path + ".tmp", self.vector_path)
+
+    def close(self):
+        # Let the worker finish its current batch before the connection goes away
+        self._closed = True
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join()
+        with self._lock:
+            self._save_vectors()
+            self._conn.close()
+
+    def _save_vectors(self):
+        if self._vectors is not None and self._vectors_dirty:
+            import faiss
+
+            faiss.write_index(self._vectors, self.vector_path + ".tmp")
+            os.replace(self.vector_path + ".tmp", self.vector_path)
+            self._vectors_dirty = False
+
+    # -- MailCache listener ---------------------------------------------
+
+    def message_stored(self, message_id: str, summary: dict, profile: str):
+        if profile not in PROFILE_RANK or "error" in summary:
+            return
+        with self._lock:
+            row = self._conn.execute("SELECT rowid, profile FROM docs WHERE id = ?", (message_id,)).fetchone()
+            if row is not None and PROFILE_RANK[row[1]] > PROFILE_RANK[profile]:
+                return
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO docs (id, profile, subject, sender, date, snippet, body, embedded)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, 0)"
+                    " ON CONFLICT(id) DO UPDATE SET profile = excluded.profile, subject = excluded.subject,"
+                    " sender = excluded.sender, date = excluded.date, snippet = excluded.snippet,"
+                    " body = excluded.body, embedded = 0",
+                    (
+                        message_id,
+                        profile,
+                        summary.get("subject"),
+                        summary.get("from"),
+                        summary.get("date"),
+                        summary.get("snippet"),
+                        summary.get("body"),
+                    ),
+                )
+            if row is not None:
+                self._remove_vectors([row[0]])
+        if self._worker is not None:
+            self._wake.set()
+
+    def message_deleted(self, message_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT rowid FROM docs WHERE id = ?", (message_id,)).fetchone()
+            if row is None:
+                return
+            with self._conn:
+                self._conn.execute("DELETE FROM docs WHERE rowid = ?", (row[0],))
+            self._remove_vectors([row[0]])
+
+    def _remove_vectors(self, rowids: List[int]):
+        if self._vectors is not None and self._vectors.ntotal:
+            import numpy as np
+
+            self._vectors.remove_ids(np.array(rowids, dtype=np.int64))
+            self._vectors_dirty = True
+
+    # -- embeddings -----------------------------------------------------
+
+    def _embeddings(self):
+        if self.get_embeddings is None or self._semantic_error is not None:
+            return None
+        try:
+            return self.get_embeddings()
+        except Exception as error:
+            # e.g. sentence-transformers not installed; keep serving BM25 results
+            logger.warning("Semantic mail search disabled: %s", error)
+            self._semantic_error = str(error)
+            return None
+
+    def _request_embedding(self):
+        """Wake the background worker, starting it on first use."""
+        with self._lock:
+            if self._worker is None and not self._closed:
+                self._worker = threading.Thread(target=self._run, name="mail-embed", daemon=True)
+                self._worker.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                self.embed_pending()
+            except Exception as error:
+                logger.warning("Embedding new mail failed: %s", error)
+
+    def embed_pending(self, max_batches: Optional[int] = None) -> int:
+        """Embed messages stored since the last call, up to max_batches batches; returns how many."""
+        embeddings = self._embeddings()
+        if embeddings is None:
+            return 0
+        import faiss
+        import numpy as np
+
+        from faiss_index import normalized
+
+        total = 0
+        batches = 0
+        with self._embed_lock:
+            while not self._closed and (max_batches is None or batches < max_batches):
+                batches += 1
+                with self._lock:
+                    rows = self._conn.execute(
+                        "SELECT rowid, subject, snippet, body FROM docs WHERE embedded = 0 LIMIT ?",
+                        (EMBED_BATCH_SIZE,),
+                    ).fetchall()
+                if not rows:
+                    break
+                texts = [
+                    "\n".join(filter(None, (subject, (body or snippet or "")[:EMBED_TEXT_CHARS])))
+                    for _, subject, snippet, body in rows
+                ]
+                # Embedding runs outside the lock, so messages may be updated or deleted meanwhile
+                matrix = normalized(embeddings.embed_documents(texts))
+                with self._lock:
+                    current = set(self._conn.execute(
+                        f"SELECT rowid, subject, snippet, body FROM docs"
+                        f" WHERE embedded = 0 AND rowid IN ({','.join('?' * len(rows))})",
+                        [row[0] for row in rows],
+                    ).fetchall())
+                    # Only rows still as embedded get their vector; changed ones stay pending
+                    keep = [i for i, row in enumerate(rows) if row in current]
+                    if keep:
+                        rowids = np.array([rows[i][0] for i in keep], dtype=np.int64)
+                        if self._vectors is None:
+                            self._vectors = faiss.IndexIDMap2(faiss.IndexFlatIP(matrix.shape[1]))
+                        self._vectors.add_with_ids(matrix[keep], rowids)
+                        self._vectors_dirty = True
+                        with self._conn:
+                            self._conn.executemany(
+                                "UPDATE docs SET embedded = 1 WHERE rowid = ?", [(int(r),) for r in rowids]
+                            )
+                total += len(keep)
+            with self._lock:
+                self._save_vectors()
+        return total
+
+    # -- search ---------------------------------------------------------
+
+    def lexical(self, query: str, limit: int) -> List[int]:
+        match = fts_query(query)
+        if match is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT rowid FROM docs_fts WHERE docs_fts MATCH ?"
+                f" ORDER BY bm25(docs_fts, {', '.join(map(str, BM25_WEIGHTS))}) LIMIT ?",
+                (match, limit),
+            ).fetchall()
+        return [rowid for (rowid,) in rows]
+
+    def semantic(self, query: str, limit: int) -> List[int]:
+        embeddings = self._embeddings()
+        if embeddings is None or self._vectors is None or not self._vectors.ntotal:
+            return []
+        from faiss_index import normalized
+
+        vector = normalized([embeddings.embed_query(query)])
+        with self._lock:
+            with telemetry.span("faiss.search", **{"faiss.k": limit, "faiss.ntotal": self._vectors.ntotal}):
+                _, ids = self._vectors.search(vector, min(limit, self._vectors.ntotal))
+        return [int(rowid) for rowid in ids[0] if rowid != -1]
+
+    def _any_pending(self, rowids: List[int]) -> bool:
+        if not rowids:
+            return False
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT 1 FROM docs WHERE embedded = 0 AND rowid IN ({','.join('?' * len(rowids))}) LIMIT 1",
+                rowids,
+            ).fetchone() is not None
+
+    def search(self, query: str, k: int = 10) -> List[dict]:
+        """
+        Hybrid search over indexed messages.
+
+        Args:
+            query (str): Free-text query.
+            k (int): Number of results.
+
+        Returns:
+            list: Dicts with 'id', 'subject', 'from', 'date', 'snippet',
+            'score' (fused RRF score), 'lexical_rank' and 'semantic_rank'
+            (None when that ranker did not return the message). While some
+            keyword matches are not embedded yet, results are BM25 only.
+        """
+        if self.background:
+            self._request_embedding()
+        else:
+            self.embed_pending(max_batches=SEARCH_EMBED_BATCHES)
+        candidates = max(k, 1) * CANDIDATES_PER_RESULT
+        lexical = self.lexical(query, candidates)
+        # Fusion would rank unembedded matches below ones both rankers found
+        semantic = [] if self._any_pending(lexical) else self.semantic(query, candidates)
+        scores = reciprocal_rank_fusion([lexical, semantic])
+        top = sorted(scores, key=scores.get, reverse=True)[:k]
+        if not top:
+            return []
+
+        lexical_rank = {rowid: rank for rank, rowid in enumerate(lexical, start=1)}
+        semantic_rank = {rowid: rank for rank, rowid in enumerate(semantic, start=1)}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT rowid, id, subject, sender, date, snippet FROM docs"
+                f" WHERE rowid IN ({','.join('?' * len(top))})",
+                top,
+            ).fetchall()
+        docs = {row[0]: row for row in rows}
+        return [
+            {
+                "id": docs[rowid][1],
+                "subject": docs[rowid][2],
+                "from": docs[rowid][3],
+                "date": docs[rowid][4],
+                "snippet": docs[rowid][5],
+                "score": scores[rowid],
+                "lexical_rank": lexical_rank.get(rowid),
+                "semantic_rank": semantic_rank.get(rowid),
+            }
+            for rowid in top
+            if rowid in docs
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            indexed, pending = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(embedded = 0), 0) FROM docs"
+            ).fetchone()
+        return {
+            "indexed": indexed,
+            "pending_embeddings": pending,
+            "vectors": self._vectors.ntotal if self._vectors is not None else 0,
+            "semantic_error": self._semantic_error,
+        }
@@ -0,0 +1,91 @@
+"""
+Local stand-in for Cloud Pub/Sub push delivery.
+
+Publishes messages to push endpoints using the same envelope Pub/Sub
+sends, and retries non-2xx responses the way a push subscription does,
+so the Gmail watch receiver can be exercised offline:
+
+    python pubsub_local.py http://127.0.0.1:8085/gmail/push me@example.com 123456
+"""
+import argparse
+import base64
+import itertools
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+MAX_DELIVERY_ATTEMPTS = 5
+RETRY_DELAY = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+class LocalPubSub:
+    """In-process topics with push subscriptions.
+
+    Args:
+        subscription (str): Subscription name reported in each envelope.
+    """
+
+    def __init__(self, subscription: str = "projects/local/subscriptions/gmail-push"):
+        self.subscription = subscription
+        self._endpoints: Dict[str, List[str]] = {}
+        self._ids = itertools.count(1)
+        self._client = httpx.Client(timeout=10.0)
+
+    def subscribe(self, topic: str, endpoint: str):
+        self._endpoints.setdefault(topic, []).append(endpoint)
+
+    def envelope(self, data: bytes, attributes: Optional[dict] = None) -> dict:
+        return {
+            "message": {
+                "data": base64.b64encode(data).decode("ascii"),
+                "attributes": attributes or {},
+                "messageId": str(next(self._ids)),
+                "publishTime": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            },
+            "subscription": self.subscription,
+        }
+
+    def publish(self, topic: str, data: bytes, attributes: Optional[dict] = None) -> List[bool]:
+        """Push one message to every endpoint subscribed to topic; returns per-endpoint success."""
+        envelope = self.envelope(data, attributes)
+        return [self._deliver(endpoint, envelope) for endpoint in self._endpoints.get(topic, [])]
+
+    def _deliver(self, endpoint: str, envelope: dict) -> bool:
+        for attempt in range(MAX_DELIVERY_ATTEMPTS):
+            try:
+                response = self._client.post(endpoint, json=envelope)
+                if response.is_success:
+                    return True
+                logger.warning("Push to %s returned %s", endpoint, response.status_code)
+            except httpx.TransportError as error:
+                logger.warning("Push to %s failed: %s", endpoint, error)
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+        return False
+
+    def close(self):
+        self._client.close()
+
+
+def gmail_notification(email_address: str, history_id: int) -> bytes:
+    """The payload Gmail publishes for a mailbox change."""
+    return json.dumps({"emailAddress": email_address, "historyId": history_id}).encode()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Push a Gmail watch notification to a local endpoint")
+    parser.add_argument("endpoint", help="Push URL, e.g. http://127.0.0.1:8085/gmail/push")
+    parser.add_argument("email_address")
+    parser.add_argument("history_id", type=int)
+    args = parser.parse_args()
+
+    pubsub = LocalPubSub()
+    pubsub.subscribe("gmail", args.endpoint)
+    delivered = pubsub.publish("gmail", gmail_notification(args.email_address, args.history_id))
+    print("delivered" if all(delivered) else "delivery failed")
+    pubsub.close()
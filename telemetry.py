@@ -0,0 +1,475 @@
+"""
+Tracing and metrics for the MCP servers, off unless TELEMETRY_EXPORTER is set.
+
+Spans nest through contextvars (tool -> embed -> faiss.search -> gmail
+request) and every finished span feeds a latency histogram. Metrics are
+counters and fixed-bucket histograms. Both are exported without extra
+dependencies:
+
+    TELEMETRY_EXPORTER=otlp-json    append OTLP/JSON lines to TELEMETRY_OTLP_FILE
+    TELEMETRY_EXPORTER=prometheus   serve text metrics on TELEMETRY_PROMETHEUS_PORT/metrics
+    TELEMETRY_EXPORTER=otlp-json,prometheus
+
+When disabled, ``span`` returns a shared no-op span and nothing else runs,
+so instrumented code pays one flag check per call.
+"""
+import atexit
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+
+EXPORTERS = {name.strip() for name in os.getenv("TELEMETRY_EXPORTER", "").split(",") if name.strip()}
+ENABLED = bool(EXPORTERS)
+
+OTLP_FILE = os.getenv("TELEMETRY_OTLP_FILE", "telemetry.otlp.jsonl")
+# Seconds between OTLP file flushes; also flushed at exit
+EXPORT_INTERVAL = float(os.getenv("TELEMETRY_EXPORT_INTERVAL", "5"))
+PROMETHEUS_HOST = os.getenv("TELEMETRY_PROMETHEUS_HOST", "127.0.0.1")
+PROMETHEUS_PORT = int(os.getenv("TELEMETRY_PROMETHEUS_PORT", "9464"))
+
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+logger = logging.getLogger(__name__)
+
+
+class Counter:
+    """Monotonic counter with one series per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, unit: str, description: str):
+        self.name = name
+        self.unit = unit
+        self.description = description
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def series(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class Histogram:
+    """Cumulative histogram over fixed bucket upper bounds, one series per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, unit: str, description: str, buckets: Sequence[float]):
+        self.name = name
+        self.unit = unit
+        self.description = description
+        self.buckets = tuple(buckets)
+        # label key -> [per-bucket counts (+ overflow), count, sum]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        slot = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                slot = i
+                break
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][slot] += 1
+            series[1] += 1
+            series[2] += value
+
+    def series(self):
+        with self._lock:
+            return [(key, (list(counts), count, total)) for key, (counts, count, total) in self._values.items()]
+
+
+SPAN_DURATION = Histogram("span.duration", "ms", "Duration of traced operations by span name", LATENCY_BUCKETS_MS)
+TOOL_RESPONSE_SIZE = Histogram("mcp.tool.response.size", "By", "Size of MCP tool results", SIZE_BUCKETS)
+GMAIL_RESPONSE_SIZE = Histogram("gmail.response.size", "By", "Size of Gmail API response bodies", SIZE_BUCKETS)
+GMAIL_REQUESTS = Counter("gmail.requests", "{request}", "Gmail API calls by method and outcome")
+CACHE_LOOKUPS = Counter("cache.lookups", "{lookup}", "Cache lookups by cache and result (hit or miss)")
+EXECUTOR_WAIT = Histogram("executor.queue.wait", "ms", "Time tool calls waited for a free executor slot",
+                          LATENCY_BUCKETS_MS)
+METRICS = (SPAN_DURATION, TOOL_RESPONSE_SIZE, GMAIL_RESPONSE_SIZE, GMAIL_REQUESTS, CACHE_LOOKUPS, EXECUTOR_WAIT)
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    """One timed operation; use through ``span``."""
+
+    __slots__ = ("name", "kind", "attributes", "trace_id", "span_id", "parent_id",
+                 "start_ns", "end_ns", "_start", "status", "message", "events", "_token")
+
+    def __init__(self, name: str, kind: int, attributes: dict):
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.status = STATUS_OK
+        self.message = ""
+        self.events = []
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException):
+        """Mark the span failed and attach the error as an exception event."""
+        self.status = STATUS_ERROR
+        self.message = str(error)
+        self.events.append({
+            "timeUnixNano": str(time.time_ns()),
+            "name": "exception",
+            "attributes": [_attribute("exception.type", type(error).__name__),
+                           _attribute("exception.message", str(error))],
+        })
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is None:
+            self.trace_id = f"{random.getrandbits(128):032x}"
+            self.parent_id = ""
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self._token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, error, traceback):
+        elapsed = time.perf_counter_ns() - self._start
+        self.end_ns = self.start_ns + elapsed
+        _current_span.reset(self._token)
+        if error is not None:
+            self.record_exception(error)
+        SPAN_DURATION.observe(elapsed / 1e6, span=self.name, status="error" if self.status == STATUS_ERROR else "ok")
+        if _span_sink is not None:
+            _span_sink(self)
+        return False
+
+    def to_otlp(self) -> dict:
+        record = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.message} if self.message else {"code": self.status},
+        }
+        if self.parent_id:
+            record["parentSpanId"] = self.parent_id
+        if self.events:
+            record["events"] = self.events
+        return record
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def record_exception(self, error):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, error, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("telemetry_span", default=None)
+_span_sink = None
+
+
+def span(name: str, kind: int = INTERNAL, **attributes):
+    """
+    Context manager timing one operation as a child of the current span.
+
+    Args:
+        name (str): Span name, also the ``span`` label of its latency histogram.
+        kind (int): OTLP span kind (INTERNAL, SERVER or CLIENT).
+        **attributes: Span attributes; use ``set`` on the span to add more.
+
+    Returns:
+        The span, or a shared no-op span when telemetry is disabled.
+    """
+    if not ENABLED:
+        return NOOP_SPAN
+    return Span(name, kind, attributes)
+
+
+def current_span():
+    """The innermost active span, or the no-op span outside any span."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0):
+    """Count cache lookups for hit-rate metrics."""
+    if ENABLED:
+        if hits:
+            CACHE_LOOKUPS.add(hits, cache=cache, result="hit")
+        if misses:
+            CACHE_LOOKUPS.add(misses, cache=cache, result="miss")
+
+
+def payload_size(value) -> int:
+    """Size in bytes of a tool result as it is sent to the client."""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if not isinstance(value, str):
+        value = json.dumps(value, default=str)
+    return len(value.encode("utf-8"))
+
+
+def trace_tool(function):
+    """Wrap an MCP tool function (sync or async) in a SERVER span with its result size."""
+    name = function.__name__
+
+    def finish(tool_span, result):
+        size = payload_size(result)
+        tool_span.set("mcp.tool.response.size", size)
+        TOOL_RESPONSE_SIZE.observe(size, tool=name)
+        return result
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def traced(*args, **kwargs):
+            with span(f"tool {name}", SERVER, **{"mcp.tool.name": name}) as tool_span:
+                return finish(tool_span, await function(*args, **kwargs))
+    else:
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            with span(f"tool {name}", SERVER, **{"mcp.tool.name": name}) as tool_span:
+                return finish(tool_span, function(*args, **kwargs))
+    return traced
+
+
+def instrument(mcp, service_name: Optional[str] = None):
+    """
+    Trace every tool registered on a FastMCP server from now on and start the exporters.
+
+    Call right after creating the server, before any ``@mcp.tool()``. Does
+    nothing when telemetry is disabled.
+
+    Args:
+        mcp: FastMCP server.
+        service_name (str): ``service.name`` resource attribute; the server name by default.
+    """
+    if not ENABLED:
+        return
+    start_exporters(service_name or mcp.name)
+    register = mcp.tool
+
+    @functools.wraps(register)
+    def tool(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+        return lambda function: decorator(trace_tool(function))
+
+    mcp.tool = tool
+
+
+# -- exporters ----------------------------------------------------------------
+
+def _resource(service_name: str) -> dict:
+    return {"attributes": [_attribute("service.name", service_name),
+                           _attribute("process.pid", os.getpid())]}
+
+
+def otlp_metrics(start_ns: int) -> list:
+    """Cumulative OTLP/JSON metric records for all metrics with data."""
+    now = str(time.time_ns())
+    records = []
+    for metric in METRICS:
+        points = []
+        for key, value in metric.series():
+            point = {
+                "attributes": [_attribute(label, label_value) for label, label_value in key],
+                "startTimeUnixNano": str(start_ns),
+                "timeUnixNano": now,
+            }
+            if metric.kind == "counter":
+                point["asInt"] = str(int(value))
+            else:
+                counts, count, total = value
+                point.update(count=str(count), sum=total, bucketCounts=[str(c) for c in counts],
+                             explicitBounds=list(metric.buckets))
+            points.append(point)
+        if not points:
+            continue
+        record = {"name": metric.name, "unit": metric.unit, "description": metric.description}
+        if metric.kind == "counter":
+            record["sum"] = {"dataPoints": points, "aggregationTemporality": 2, "isMonotonic": True}
+        else:
+            record["histogram"] = {"dataPoints": points, "aggregationTemporality": 2}
+        records.append(record)
+    return records
+
+
+def prometheus_text() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        name = metric.name.replace(".", "_")
+        if metric.kind == "counter":
+            name += "_total"
+        lines.append(f"# HELP {name} {metric.description} ({metric.unit})")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in metric.series():
+            labels = [f'{label}="{_escape(label_value)}"' for label, label_value in key]
+            if metric.kind == "counter":
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+                continue
+            counts, count, total = value
+            cumulative = 0
+            for bound, bucket_count in zip((*metric.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else f"{bound:g}"
+                bucket_labels = _labels([*labels, 'le="%s"' % le])
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:g}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels) -> str:
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class OtlpFileExporter:
+    """Appends finished spans and metric snapshots to a file as OTLP/JSON, one export request per line.
+
+    Spans are buffered and written by a daemon thread every ``interval``
+    seconds and at exit, so tools never wait on the file.
+    """
+
+    def __init__(self, path: str, service_name: str, interval: float = EXPORT_INTERVAL):
+        self.path = path
+        self.resource = _resource(service_name)
+        self.interval = interval
+        self.start_ns = time.time_ns()
+        self._spans = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="telemetry-otlp", daemon=True)
+
+    def add(self, finished: Span):
+        with self._lock:
+            self._spans.append(finished)
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except OSError as error:
+                logger.warning("Could not write telemetry to %s: %s", self.path, error)
+
+    def flush(self):
+        with self._lock:
+            spans, self._spans = self._spans, []
+        scope = {"name": "gmail-mcp"}
+        lines = []
+        if spans:
+            lines.append({"resourceSpans": [{"resource": self.resource, "scopeSpans": [
+                {"scope": scope, "spans": [finished.to_otlp() for finished in spans]}]}]})
+        metrics = otlp_metrics(self.start_ns)
+        if metrics and (spans or self._stopped.is_set()):
+            lines.append({"resourceMetrics": [{"resource": self.resource, "scopeMetrics": [
+                {"scope": scope, "metrics": metrics}]}]})
+        if lines:
+            with self._lock, open(self.path, "a", encoding="utf-8") as file:
+                file.writelines(json.dumps(line, separators=(",", ":")) + "\n" for line in lines)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # The default handler writes to stderr on every scrape
+        pass
+
+
+def start_prometheus(host: str = PROMETHEUS_HOST, port: int = PROMETHEUS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics in a daemon thread; None if the port is taken."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as error:
+        logger.warning("Could not serve Prometheus metrics on %s:%s: %s", host, port, error)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="telemetry-prometheus", daemon=True).start()
+    return server
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_exporters(service_name: str):
+    """Start the exporters named in TELEMETRY_EXPORTER, once per process."""
+    global _started, _span_sink
+    with _start_lock:
+        if _started or not ENABLED:
+            return
+        _started = True
+        unknown = EXPORTERS - {"otlp-json", "prometheus"}
+        if unknown:
+            logger.warning("Unknown TELEMETRY_EXPORTER values: %s", ", ".join(sorted(unknown)))
+        if "otlp-json" in EXPORTERS:
+            exporter = OtlpFileExporter(OTLP_FILE, service_name)
+            exporter.start()
+            _span_sink = exporter.add
+        if "prometheus" in EXPORTERS:
+            start_prometheus()
@@ -0,0 +1,91 @@
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, Optional
+
+PLACEHOLDER = re.compile(r'\{\{(\w+)\}\}')
+
+# Distinct texts kept compiled by compile_template, e.g. bulk-draft subjects and bodies
+COMPILE_CACHE_SIZE = 4096
+
+
+class CompiledTemplate:
+    """A template text split once into literal segments and {{name}} slots.
+
+    ``render`` only swaps looked-up values into the pre-split parts and
+    joins them, so filling a template costs no regex work however often it
+    is used.
+
+    Args:
+        text (str): Template text with {{name}} placeholders.
+    """
+
+    __slots__ = ("text", "variables", "_parts", "_slots")
+
+    def __init__(self, text: str):
+        # split() alternates literal, name, literal, ..., always ending on a literal
+        parts = PLACEHOLDER.split(text)
+        self.text = text
+        self.variables = tuple(dict.fromkeys(parts[1::2]))
+        self._parts = parts
+        # (position in parts, name, text kept when no value is given) per slot
+        self._slots = tuple((i, parts[i], "{{" + parts[i] + "}}") for i in range(1, len(parts), 2))
+
+    def render(self, values: Optional[Mapping[str, object]] = None) -> str:
+        """Fill slots from values, leaving placeholders without a value as {{name}}."""
+        if not self._slots or not values:
+            return self.text
+        out = self._parts.copy()
+        for position, name, placeholder in self._slots:
+            value = values.get(name, placeholder)
+            out[position] = value if type(value) is str else str(value)
+        return "".join(out)
+
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def compile_template(text: str) -> CompiledTemplate:
+    """Compiled form of a template text, cached for texts seen repeatedly."""
+    return CompiledTemplate(text)
+
+
+class IndexedTemplate(CompiledTemplate):
+    """A compiled template that remembers its position and source record."""
+
+    __slots__ = ("template_id", "category", "data")
+
+    def __init__(self, template_id: int, data: dict, text_key: str = "template", category_key: str = "category"):
+        super().__init__(data[text_key])
+        self.template_id = template_id
+        self.category = data.get(category_key, "")
+        self.data = data
+
+
+class TemplateIndex:
+    """Templates compiled once at load, with a case-insensitive category index.
+
+    Template IDs are positions in the input list, matching how the
+    templates are addressed elsewhere.
+
+    Args:
+        templates: Template records, each with a text and a category field.
+        text_key (str): Field holding the template text.
+        category_key (str): Field holding the category.
+    """
+
+    def __init__(self, templates: Iterable[dict], text_key: str = "template", category_key: str = "category"):
+        self.templates: List[IndexedTemplate] = [
+            IndexedTemplate(i, data, text_key, category_key) for i, data in enumerate(templates)
+        ]
+        self._by_category: Dict[str, List[IndexedTemplate]] = {}
+        for template in self.templates:
+            self._by_category.setdefault(template.category.lower(), []).append(template)
+        self.categories: List[str] = sorted({template.category for template in self.templates})
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def __getitem__(self, template_id: int) -> IndexedTemplate:
+        return self.templates[template_id]
+
+    def by_category(self, category: str) -> List[IndexedTemplate]:
+        """Templates of a category, in ID order; empty if unknown."""
+        return self._by_category.get(category.lower(), [])
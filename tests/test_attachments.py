@@ -0,0 +1,134 @@
+import asyncio
+import base64
+import json
+import os
+
+import httpx
+
+from attachments import AttachmentStore, save_attachment
+from gmail_async import AsyncGmailClient
+from gmail_quota import RequestScheduler
+
+RATE_LIMITED = {"error": {"code": 403, "errors": [{"reason": "userRateLimitExceeded"}]}}
+
+
+class StreamedBody(httpx.AsyncByteStream):
+    """A body that, like a real network response, is only available once read."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def __aiter__(self):
+        yield self.data
+
+
+def streamed(status, payload):
+    return httpx.Response(status, headers={"Content-Type": "application/json"},
+                          stream=StreamedBody(json.dumps(payload).encode()))
+
+
+class Token:
+    token = "test-token"
+
+
+def make_client(handler):
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://gmail.test/gmail/v1/")
+    return AsyncGmailClient(client=http, get_credentials=Token, scheduler=RequestScheduler(backoff_base=0))
+
+
+def test_streamed_rate_limit_403_is_retried(tmp_path):
+    content = b"attachment payload"
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            return streamed(403, RATE_LIMITED)
+        return streamed(200, {"data": base64.urlsafe_b64encode(content).decode()})
+
+    async def run():
+        client = make_client(handler)
+        store = AttachmentStore(str(tmp_path))
+        part = {"partId": "1", "filename": "a.txt", "mimeType": "text/plain", "body": {"attachmentId": "att"}}
+        try:
+            return await save_attachment(client, store, "msg", part)
+        finally:
+            store.close()
+            await client.aclose()
+
+    record = asyncio.run(run())
+    assert len(calls) == 2
+    assert record["size"] == len(content)
+    with open(record["path"], "rb") as file:
+        assert file.read() == content
+
+
+def test_streamed_forbidden_raises_http_error():
+    def handler(request):
+        return streamed(403, {"error": {"code": 403, "errors": [{"reason": "forbidden"}]}})
+
+    async def run():
+        client = make_client(handler)
+        try:
+            async with client.stream_attachment("msg", "att"):
+                pass
+        except httpx.HTTPStatusError as error:
+            return error
+        finally:
+            await client.aclose()
+
+    error = asyncio.run(run())
+    assert error.response.status_code == 403
+    assert json.loads(error.response.content)["error"]["errors"][0]["reason"] == "forbidden"
+
+
+def test_empty_attachment_is_saved_without_download(tmp_path):
+    def handler(request):
+        raise AssertionError("no request expected")
+
+    async def run():
+        client = make_client(handler)
+        store = AttachmentStore(str(tmp_path))
+        part = {"partId": "2", "filename": "empty.txt", "mimeType": "text/plain", "body": {"size": 0}}
+        try:
+            return await save_attachment(client, store, "msg", part)
+        finally:
+            store.close()
+            await client.aclose()
+
+    record = asyncio.run(run())
+    assert record["size"] == 0
+    assert os.path.getsize(record["path"]) == 0
+
+
+def test_identical_attachments_are_stored_once(tmp_path):
+    content = b"%PDF same invoice in two threads"
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return streamed(200, {"data": base64.urlsafe_b64encode(content).decode()})
+
+    async def run():
+        client = make_client(handler)
+        store = AttachmentStore(str(tmp_path))
+        part = {"partId": "1", "filename": "invoice.pdf", "mimeType": "application/pdf"}
+        try:
+            first = await save_attachment(client, store, "msg-a", {**part, "body": {"attachmentId": "att-a"}})
+            second = await save_attachment(client, store, "msg-b", {**part, "body": {"attachmentId": "att-b"}})
+            again = await save_attachment(client, store, "msg-b", {**part, "body": {"attachmentId": "att-b"}})
+            rows = store._conn.execute("SELECT message_id, sha256 FROM attachments ORDER BY message_id").fetchall()
+            return first, second, again, rows
+        finally:
+            store.close()
+            await client.aclose()
+
+    first, second, again, rows = asyncio.run(run())
+    assert first["deduplicated"] is False
+    assert second["deduplicated"] is True
+    assert first["path"] == second["path"] == again["path"]
+    assert rows == [("msg-a", first["sha256"]), ("msg-b", first["sha256"])]
+    # Both messages are downloaded (Gmail has no content hash), the indexed one is not fetched again
+    assert len(calls) == 2
+    stored = [name for directory, _, names in os.walk(tmp_path) if directory != str(tmp_path) for name in names]
+    assert stored == [first["sha256"]]
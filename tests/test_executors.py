@@ -0,0 +1,41 @@
+import asyncio
+import threading
+
+import pytest
+
+from executors import BoundedExecutor, ExecutorBusy
+
+
+def test_saturated_pool_rejects_after_queue_timeout():
+    pool = BoundedExecutor("test", workers=1, queue_size=0, queue_timeout=0.1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+        return "first"
+
+    async def run():
+        first = asyncio.create_task(pool.run(block))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+
+        with pytest.raises(ExecutorBusy):
+            await pool.run(lambda: "second")
+        stats = pool.stats()
+        assert stats["rejected"] == 1
+        assert stats["in_flight"] == 1
+        assert stats["wait_seconds"] > 0.05
+
+        release.set()
+        assert await first == "first"
+        # The slot is free again once the blocking call has finished
+        assert await pool.run(lambda: "third") == "third"
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+        pool.shutdown()
+    assert pool.stats()["completed"] == 2
@@ -0,0 +1,35 @@
+import asyncio
+
+import httpx
+
+from gmail_async import AsyncGmailClient
+from gmail_quota import RequestScheduler
+
+
+class Token:
+    token = "test-token"
+
+
+def test_get_messages_bounds_concurrency():
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[-1]})
+
+    async def run():
+        http = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://gmail.test/gmail/v1/")
+        client = AsyncGmailClient(client=http, get_credentials=Token, scheduler=RequestScheduler())
+        try:
+            return await client.get_messages([f"m{i}" for i in range(40)], profile="metadata", concurrency=4)
+        finally:
+            await client.aclose()
+
+    messages = asyncio.run(run())
+    assert [message["id"] for message in messages] == [f"m{i}" for i in range(40)]
+    assert peak == 4
@@ -0,0 +1,77 @@
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import gmail_fetch
+from gmail_fetch import batch_get_messages
+from gmail_quota import RequestScheduler, TokenBucket, parse_retry_after
+
+
+def http_error(status, retry_after=None):
+    headers = {"status": status}
+    if retry_after is not None:
+        headers["retry-after"] = retry_after
+    return HttpError(httplib2.Response(headers), b"{}")
+
+
+def test_token_bucket_reservations_queue_in_arrival_order():
+    bucket = TokenBucket(rate=10, capacity=10)
+    assert bucket.reserve(10) == 0.0
+    # Each reservation past the burst waits behind the ones before it
+    assert bucket.reserve(5) == pytest.approx(0.5, abs=0.05)
+    assert bucket.reserve(5) == pytest.approx(1.0, abs=0.05)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-2") == 0.0
+    assert parse_retry_after(formatdate(time.time() + 30, usegmt=True)) == pytest.approx(30, abs=2)
+    assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+class Batch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.ids = []
+
+    def add(self, request, request_id):
+        self.ids.append(request_id)
+
+    def execute(self):
+        for msg_id in self.ids:
+            error = self.service.failures.pop(msg_id, None)
+            self.callback(msg_id, None if error else {"id": msg_id}, error)
+
+
+class FakeService:
+    """Gmail batch messages.get where listed IDs fail once with the given error."""
+
+    def __init__(self, failures):
+        self.failures = failures
+
+    def new_batch_http_request(self, callback):
+        return Batch(self, callback)
+
+    def users(self):
+        return SimpleNamespace(messages=lambda: SimpleNamespace(get=lambda **params: None))
+
+
+def test_batch_retry_honours_retry_after(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(gmail_fetch.time, "sleep", sleeps.append)
+    scheduler = RequestScheduler()
+    service = FakeService({"m2": http_error(429, "7"), "m3": http_error(503, "2")})
+
+    messages, errors = batch_get_messages(service, "me", ["m1", "m2", "m3"], scheduler=scheduler)
+
+    assert sorted(messages) == ["m1", "m2", "m3"]
+    assert errors == {}
+    assert sleeps == [7.0]
+    assert scheduler.stats()["retries"] == 2
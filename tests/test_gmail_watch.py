@@ -0,0 +1,124 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from gmail_quota import RequestScheduler
+from gmail_watch import MailWatcher
+from mail_cache import MailCache
+from pubsub_local import LocalPubSub, gmail_notification
+
+TOPIC = "projects/local/topics/gmail"
+
+
+class Request:
+    def __init__(self, execute):
+        self.execute = execute
+
+
+class FakeService:
+    """Gmail watch, stop, getProfile and history.list; history.list can be held open."""
+
+    def __init__(self):
+        self.history_id = 100
+        self.history = []
+        self.history_calls = 0
+        self.watches = []
+        self.hold = None
+        self.holding = threading.Event()
+
+    def users(self):
+        return SimpleNamespace(
+            getProfile=lambda userId: Request(lambda: {"historyId": str(self.history_id)}),
+            history=lambda: SimpleNamespace(list=self.list_history),
+            watch=self.watch,
+            stop=lambda userId: Request(lambda: {}),
+        )
+
+    def watch(self, userId, body):
+        self.watches.append(body)
+        return Request(lambda: {"historyId": str(self.history_id), "expiration": "1700000000000"})
+
+    def list_history(self, **params):
+        def execute():
+            self.history_calls += 1
+            if self.hold is not None:
+                self.holding.set()
+                self.hold.wait(5)
+            return {"history": self.history, "historyId": str(self.history_id)}
+
+        return Request(execute)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def watched(tmp_path):
+    service = FakeService()
+    cache = MailCache(str(tmp_path / "mail_cache.db"), scheduler=RequestScheduler())
+    cache.sync(service)
+    prefetched = []
+    watcher = MailWatcher(cache, lambda: service, on_new_messages=lambda _, ids: prefetched.extend(ids),
+                          scheduler=RequestScheduler())
+    watcher.start(TOPIC, ["INBOX"], port=0)
+    pubsub = LocalPubSub()
+    pubsub.subscribe(TOPIC, watcher.receiver.url)
+    yield service, cache, watcher, pubsub, prefetched
+    pubsub.close()
+    watcher.stop()
+    cache.close()
+
+
+def test_push_notification_syncs_and_prefetches(watched):
+    service, cache, watcher, pubsub, prefetched = watched
+    assert cache.is_watched("me")
+    assert service.watches == [{"topicName": TOPIC, "labelIds": ["INBOX"], "labelFilterBehavior": "include"}]
+
+    service.history_id = 101
+    service.history = [{"id": "101", "messagesAdded": [{"message": {"id": "m1", "labelIds": ["INBOX"]}}]}]
+    assert pubsub.publish(TOPIC, gmail_notification("me@example.com", 101)) == [True]
+
+    wait_for(lambda: watcher.stats()["syncs"] == 1)
+    assert service.history_calls == 1
+    assert prefetched == ["m1"]
+    assert cache.get_history_id("me") == 101
+
+    # Redelivery of an already-synced notification is acknowledged but ignored
+    assert pubsub.publish(TOPIC, gmail_notification("me@example.com", 101)) == [True]
+    assert watcher.stats()["stale_notifications"] == 1
+
+
+def test_burst_of_notifications_is_coalesced(watched):
+    service, cache, watcher, pubsub, prefetched = watched
+    service.hold = threading.Event()
+    pubsub.publish(TOPIC, gmail_notification("me@example.com", 101))
+    assert service.holding.wait(5)
+
+    # Arrive while the first sync is still running
+    for history_id in range(102, 110):
+        pubsub.publish(TOPIC, gmail_notification("me@example.com", history_id))
+    service.hold.set()
+
+    wait_for(lambda: watcher.stats()["syncs"] == 2)
+    time.sleep(0.1)
+    stats = watcher.stats()
+    assert stats["notifications"] == 9
+    assert stats["syncs"] == 2
+    assert service.history_calls == 2
+
+
+def test_start_again_reissues_watch_with_new_labels(watched):
+    service, cache, watcher, pubsub, prefetched = watched
+    url = watcher.receiver.url
+    watcher.start(TOPIC, ["STARRED"], port=0)
+    assert service.watches[-1]["labelIds"] == ["STARRED"]
+    assert watcher.receiver.url == url
+
+    with pytest.raises(ValueError):
+        watcher.start(TOPIC, port=8999)
@@ -0,0 +1,50 @@
+import base64
+
+from mail_body import extract_body, part_charset
+
+
+def leaf(mime_type, text, charset="utf-8", filename=""):
+    return {
+        "mimeType": mime_type,
+        "filename": filename,
+        "headers": [{"name": "Content-Type", "value": f'{mime_type}; charset="{charset}"'}],
+        "body": {"data": base64.urlsafe_b64encode(text.encode(charset)).decode("ascii").rstrip("=")},
+    }
+
+
+def container(mime_type, *parts):
+    return {"mimeType": mime_type, "headers": [], "parts": list(parts)}
+
+
+def test_charset_from_header_with_utf8_fallback():
+    assert extract_body(leaf("text/plain", "Grüße aus Köln", "iso-8859-1")) == "Grüße aus Köln"
+
+    unknown = leaf("text/plain", "Grüße")
+    unknown["headers"] = [{"name": "Content-Type", "value": 'text/plain; charset="x-no-such-charset"'}]
+    assert part_charset(unknown) == "utf-8"
+    assert extract_body(unknown) == "Grüße"
+
+    # Bytes invalid in the declared charset are replaced, not fatal
+    broken = leaf("text/plain", "Grüße", "iso-8859-1")
+    broken["headers"] = [{"name": "Content-Type", "value": "text/plain; charset=utf-8"}]
+    assert extract_body(broken) == "Gr��e"
+
+
+def test_nested_multipart_prefers_plain_and_skips_attachments():
+    payload = container(
+        "multipart/mixed",
+        leaf("text/plain", "attached notes", filename="notes.txt"),
+        container(
+            "multipart/related",
+            container("multipart/alternative", leaf("text/html", "<p>html body</p>"), leaf("text/plain", "plain body")),
+        ),
+    )
+    assert extract_body(payload) == "plain body"
+
+
+def test_html_only_message_is_flattened():
+    html = "<html><head><title>t</title><style>p {}</style></head><body><p>Hello</p><p>World &amp; co</p></body></html>"
+    payload = container("multipart/mixed", container("multipart/related", leaf("text/html", html)))
+    assert extract_body(payload) == "Hello\n\nWorld & co"
+    assert extract_body(payload, convert_html=False) == html
+    assert extract_body(container("multipart/mixed", leaf("application/pdf", "%PDF", filename="a.pdf"))) == ""
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+from gmail_quota import RequestScheduler
+from mail_cache import MailCache, cached_page
+
+
+class Request:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeService:
+    """Just enough of the Gmail service for MailCache.sync."""
+
+    def __init__(self):
+        self.history_id = 100
+        self.history = []
+
+    def users(self):
+        return SimpleNamespace(getProfile=self.get_profile, history=lambda: SimpleNamespace(list=self.list_history))
+
+    def get_profile(self, userId):
+        return Request({"historyId": str(self.history_id)})
+
+    def list_history(self, **params):
+        return Request({"history": self.history, "historyId": str(self.history_id)})
+
+
+def metadata_summary(msg_id, message):
+    return {"id": msg_id, "labels": message["labelIds"], "snippet": message["snippet"]}
+
+
+def test_label_changes_from_history_are_served(tmp_path):
+    service = FakeService()
+    cache = MailCache(str(tmp_path / "mail_cache.db"), scheduler=RequestScheduler())
+    cache.sync(service)
+    message = {"id": "m1", "historyId": "101", "labelIds": ["INBOX", "UNREAD"], "snippet": "hi"}
+    fetches = []
+
+    def page():
+        return cached_page(
+            cache, "inbox", "metadata",
+            list_page=lambda: ([{"id": "m1"}], None),
+            fetch=lambda ids: (fetches.extend(ids) or {"m1": message}, {}),
+            summarize=metadata_summary,
+        )[0]
+
+    assert page()[0]["labels"] == ["INBOX", "UNREAD"]
+
+    # Read elsewhere, then starred
+    service.history_id = 103
+    service.history = [
+        {"id": "102", "labelsRemoved": [{"message": {"id": "m1"}, "labelIds": ["UNREAD"]}]},
+        {"id": "103", "labelsAdded": [{"message": {"id": "m1"}, "labelIds": ["STARRED"]}]},
+    ]
+    assert cache.sync(service, force=True) == 2
+
+    assert page() == [{"id": "m1", "labels": ["INBOX", "STARRED"], "snippet": "hi"}]
+    assert fetches == ["m1"]
@@ -0,0 +1,117 @@
+import hashlib
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from faiss_index import normalized
+from mail_search import EMBED_BATCH_SIZE, MailSearchIndex
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic hash embeddings that count the texts they embed."""
+
+    def __init__(self, on_embed=None):
+        self.embedded = 0
+        self.on_embed = on_embed
+
+    def _embed(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+        return np.random.default_rng(seed).standard_normal(8).tolist()
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        vectors = [self._embed(text) for text in texts]
+        if self.on_embed is not None:
+            self.on_embed()
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def summary(i, body="body"):
+    return {"subject": f"subject {i}", "from": "a@example.com", "date": "d", "snippet": "s", "body": f"{body} {i}"}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def open_index(tmp_path, embeddings):
+    return MailSearchIndex(str(tmp_path / "search.db"), str(tmp_path / "search.faiss"), lambda: embeddings)
+
+
+def test_restart_reembeds_only_changed_messages(tmp_path):
+    embeddings = CountingEmbeddings()
+    index = open_index(tmp_path, embeddings)
+    for i in range(200):
+        index.message_stored(f"m{i}", summary(i), "metadata")
+    assert index.embed_pending() == 200
+
+    # Profile upgrade and delete, then stop without close()
+    index.message_stored("m1", summary(1, "full body"), "full")
+    index.message_deleted("m2")
+
+    restarted_embeddings = CountingEmbeddings()
+    restarted = open_index(tmp_path, restarted_embeddings)
+    assert restarted.embed_pending() == 1
+    assert restarted_embeddings.embedded == 1
+    assert restarted.stats()["vectors"] == 199
+    assert [hit["id"] for hit in restarted.search("full body 1", k=1)] == ["m1"]
+
+
+def test_message_updated_while_embedding_gets_fresh_vector(tmp_path):
+    index = None
+
+    def update_once():
+        embeddings.on_embed = None
+        index.message_stored("m0", summary(0, "edited"), "full")
+
+    embeddings = CountingEmbeddings(on_embed=update_once)
+    index = open_index(tmp_path, embeddings)
+    for i in range(3):
+        index.message_stored(f"m{i}", summary(i), "metadata")
+
+    assert index.embed_pending() == 3
+    assert index.stats() == {"indexed": 3, "pending_embeddings": 0, "vectors": 3, "semantic_error": None}
+    rowid = index._conn.execute("SELECT rowid FROM docs WHERE id = 'm0'").fetchone()[0]
+    expected = normalized([embeddings.embed_query("subject 0\nedited 0")])[0]
+    assert np.allclose(index._vectors.reconstruct(rowid), expected, atol=1e-6)
+
+
+def test_search_embeds_at_most_one_batch_inline(tmp_path):
+    embeddings = CountingEmbeddings()
+    index = open_index(tmp_path, embeddings)
+    for i in range(EMBED_BATCH_SIZE * 3):
+        index.message_stored(f"m{i}", summary(i), "metadata")
+
+    last = EMBED_BATCH_SIZE * 3 - 1
+    hits = index.search(f"body {last}", k=5)
+    assert embeddings.embedded == EMBED_BATCH_SIZE
+    # Not embedded yet: BM25 only, so it is not outranked by embedded messages
+    assert hits[0]["id"] == f"m{last}"
+    assert all(hit["semantic_rank"] is None for hit in hits)
+
+
+def test_background_worker_embeds_after_first_search(tmp_path):
+    embeddings = CountingEmbeddings()
+    index = MailSearchIndex(str(tmp_path / "search.db"), str(tmp_path / "search.faiss"), lambda: embeddings,
+                            background=True)
+    for i in range(EMBED_BATCH_SIZE * 2):
+        index.message_stored(f"m{i}", summary(i), "metadata")
+    assert embeddings.embedded == 0
+
+    index.search("body 1", k=1)
+    wait_for(lambda: index.stats()["pending_embeddings"] == 0)
+    assert index.stats()["vectors"] == EMBED_BATCH_SIZE * 2
+
+    # Later messages wake the worker on their own
+    index.message_stored("late", summary(999, "late arrival"), "full")
+    wait_for(lambda: index.stats()["pending_embeddings"] == 0)
+    assert [hit["id"] for hit in index.search("late arrival 999", k=1)] == ["late"]
+    index.close()
+    assert not index._worker.is_alive()
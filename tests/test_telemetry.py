@@ -0,0 +1,91 @@
+import asyncio
+import json
+import urllib.request
+
+import pytest
+
+import telemetry
+
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "ENABLED", True)
+    exporter = telemetry.OtlpFileExporter(str(tmp_path / "telemetry.otlp.jsonl"), "test-server")
+    monkeypatch.setattr(telemetry, "_span_sink", exporter.add)
+    return exporter
+
+
+def exported(exporter):
+    exporter.stop()
+    with open(exporter.path, encoding="utf-8") as file:
+        lines = [json.loads(line) for line in file]
+    spans = lines[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    metrics = {metric["name"]: metric for metric in lines[1]["resourceMetrics"][0]["scopeMetrics"][0]["metrics"]}
+    return {span["name"]: span for span in spans}, metrics
+
+
+def attributes(span):
+    return {attribute["key"]: next(iter(attribute["value"].values())) for attribute in span["attributes"]}
+
+
+def test_traced_tool_nests_spans_and_exports_otlp(exporter):
+    @telemetry.trace_tool
+    def lookup_otlp(query):
+        with telemetry.span("embed", model="test"):
+            telemetry.current_span().set("embed.texts", 1)
+        return {"query": query}
+
+    @telemetry.trace_tool
+    async def failing_otlp():
+        raise RuntimeError("boom")
+
+    assert lookup_otlp("hello") == {"query": "hello"}
+    with pytest.raises(RuntimeError):
+        asyncio.run(failing_otlp())
+
+    spans, metrics = exported(exporter)
+    tool, child = spans["tool lookup_otlp"], spans["embed"]
+    assert tool["kind"] == telemetry.SERVER
+    assert "parentSpanId" not in tool
+    assert child["parentSpanId"] == tool["spanId"]
+    assert child["traceId"] == tool["traceId"]
+    assert attributes(child) == {"model": "test", "embed.texts": "1"}
+    assert attributes(tool) == {"mcp.tool.name": "lookup_otlp",
+                                "mcp.tool.response.size": str(len('{"query": "hello"}'))}
+
+    failed = spans["tool failing_otlp"]
+    assert failed["status"] == {"code": telemetry.STATUS_ERROR, "message": "boom"}
+    assert failed["events"][0]["name"] == "exception"
+
+    sizes = {attributes(point)["tool"]: point for point in metrics["mcp.tool.response.size"]["histogram"]["dataPoints"]}
+    assert sizes["lookup_otlp"]["count"] == "1"
+    assert "failing_otlp" not in sizes
+    durations = [attributes(point) for point in metrics["span.duration"]["histogram"]["dataPoints"]]
+    assert {"span": "tool failing_otlp", "status": "error"} in durations
+
+
+def test_prometheus_exporter_serves_tool_metrics(exporter):
+    @telemetry.trace_tool
+    def lookup_prometheus():
+        return "x" * 300
+
+    lookup_prometheus()
+    lookup_prometheus()
+
+    server = telemetry.start_prometheus(port=0)
+    try:
+        host, port = server.server_address[:2]
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+            text = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    lines = text.splitlines()
+    assert "# TYPE mcp_tool_response_size histogram" in lines
+    assert 'mcp_tool_response_size_bucket{tool="lookup_prometheus",le="256"} 0' in lines
+    assert 'mcp_tool_response_size_bucket{tool="lookup_prometheus",le="1024"} 2' in lines
+    assert 'mcp_tool_response_size_bucket{tool="lookup_prometheus",le="+Inf"} 2' in lines
+    assert 'mcp_tool_response_size_count{tool="lookup_prometheus"} 2' in lines
+    assert 'mcp_tool_response_size_sum{tool="lookup_prometheus"} 600' in lines
+    assert 'span_duration_count{span="tool lookup_prometheus",status="ok"} 2' in lines
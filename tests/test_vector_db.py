@@ -0,0 +1,78 @@
+import hashlib
+import json
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import vector_db
+from faiss_index import IndexConfig
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic embeddings derived from a hash of the text."""
+
+    dimension = 16
+
+    def _embed(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+        return np.random.default_rng(seed).standard_normal(self.dimension).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class FixedConfig:
+    def key(self):
+        return "hash-embeddings"
+
+
+def prompt(i):
+    return {"category": f"cat{i}", "template type": "t", "purpose of mail": "p", "prompt": f"template number {i}"}
+
+
+def write_prompts(path, prompts):
+    raw = json.dumps({"prompts": prompts}).encode()
+    path.write_bytes(raw)
+    return raw
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    index_dir = tmp_path / "index"
+    monkeypatch.setattr(vector_db, "INDEX_DIR", str(index_dir))
+    monkeypatch.setattr(vector_db, "INDEX_FILE", str(index_dir / "templates.faiss"))
+    monkeypatch.setattr(vector_db, "VECTORS_FILE", str(index_dir / "vectors.npy"))
+    monkeypatch.setattr(vector_db, "MANIFEST_FILE", str(index_dir / "manifest.json"))
+    monkeypatch.setattr(vector_db, "embedding_config", lambda: FixedConfig())
+    return tmp_path
+
+
+@pytest.mark.parametrize("change", ["add", "remove"])
+def test_reload_after_restart(store_dir, change):
+    embeddings = HashEmbeddings()
+    config = IndexConfig(index_type="flat")
+    prompts = [prompt(i) for i in range(5)]
+    raw = write_prompts(store_dir / "prompts.json", prompts)
+    vector_db.load_vector_store(prompts, raw, embeddings, config)
+
+    # A restart with unchanged prompts loads the saved (memory-mapped) index
+    restarted = vector_db.load_vector_store(prompts, raw, embeddings, config)
+    hits_before = restarted.similarity_search("template number 1", k=1)
+
+    new_prompts = prompts + [prompt(5)] if change == "add" else prompts[1:]
+    new_raw = write_prompts(store_dir / "prompts.json", new_prompts)
+    store, summary = vector_db.update_vector_store(restarted, new_prompts, new_raw, embeddings, config)
+
+    assert store.index.ntotal == len(new_prompts)
+    assert summary["added" if change == "add" else "removed"] == 1
+    assert store.similarity_search("template number 2", k=1)[0].page_content.endswith("template number 2")
+    # The old store keeps searching its own index after the files were replaced
+    assert restarted.similarity_search("template number 1", k=1) == hits_before
+
+    # And the saved files describe the new store
+    reloaded = vector_db.load_vector_store(new_prompts, new_raw, embeddings, config)
+    assert reloaded.index.ntotal == len(new_prompts)
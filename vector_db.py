@@ -1,33 +1,174 @@
 #Model Initialising
-from langchain.embeddings import HuggingFaceEmbeddings
-import faiss
-from langchain_community.docstore.in_memory import InMemoryDocstore
-from langchain_community.vectorstores import FAISS
-from uuid import uuid4
-from langchain_core.documents import Document
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
+# The embedding stack (sentence-transformers, langchain, faiss) is imported and
+# loaded on first use so importing this module stays cheap for Gmail-only calls.
+import hashlib
+import json
+import logging
+import os
+import threading
 from typing import List
+
+import telemetry
+from embedding_cache import CachedEmbeddings, LRUCache, normalize_query
+
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
 #Prompts_Template
-import json
+PROMPTS_PATH = 'templates/prompts.json'
+# Persisted index, vectors and docstore live next to the templates
+INDEX_DIR = 'templates/index'
+INDEX_FILE = os.path.join(INDEX_DIR, 'templates.faiss')
+VECTORS_FILE = os.path.join(INDEX_DIR, 'vectors.npy')
+MANIFEST_FILE = os.path.join(INDEX_DIR, 'manifest.json')
+# Seconds between prompts.json checks; 0 disables hot reload
+TEMPLATES_WATCH_INTERVAL = float(os.getenv("TEMPLATES_WATCH_INTERVAL", "2"))
+
+_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_embedding_config = None
+_embeddings = None
+_cached_embeddings = None
+_vector_store = None
+
+# Query text -> embedding, and (query, k) -> top-k documents
+query_embedding_cache = LRUCache(name="query_embeddings")
+search_result_cache = LRUCache(name="search_results")
+
+logger = logging.getLogger(__name__)
+
+
+def load_prompts():
+    """Read prompts.json, returning (prompts, raw file bytes)."""
+    with open(PROMPTS_PATH, 'rb') as file:
+        raw_prompts = file.read()
+    data = json.loads(raw_prompts.decode('utf-8'))
+    return data.get("prompts", []), raw_prompts
 
-# Load JSON from file
-with open('templates/prompts.json', 'r', encoding='utf-8') as file:
-    data = json.load(file)
 
-# Access prompts
-prompts = data.get("prompts", [])
+def embedding_config():
+    """Embedding backend and model from EMBEDDING_* settings, MODEL_NAME on torch by default."""
+    global _embedding_config
+    if _embedding_config is None:
+        from embedding_backends import EmbeddingConfig
+        _embedding_config = EmbeddingConfig.from_env(MODEL_NAME)
+    return _embedding_config
+
+
+def get_embeddings():
+    """Load the embedding model on first use."""
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                from embedding_backends import load_embeddings
+                _embeddings = load_embeddings(embedding_config())
+    return _embeddings
+
+
+def get_cached_embeddings():
+    """The embedding model wrapped with the shared query embedding cache."""
+    global _cached_embeddings
+    if _cached_embeddings is None:
+        embeddings = get_embeddings()
+        with _lock:
+            if _cached_embeddings is None:
+                _cached_embeddings = CachedEmbeddings(embeddings, query_embedding_cache)
+    return _cached_embeddings
+
+
+def get_vector_store():
+    """Build or load the template vector store on first use."""
+    global _vector_store
+    if _vector_store is None:
+        embeddings = get_cached_embeddings()
+        with _lock:
+            if _vector_store is None:
+                prompts, raw_prompts = load_prompts()
+                _vector_store = load_vector_store(prompts, raw_prompts, embeddings)
+        watch_templates()
+    return _vector_store
+
+
+def search_templates(query: str, k: int = 3):
+    """Top-k templates for a query, served from the result cache when possible."""
+    from faiss_index import search_store
+
+    return search_result_cache.get_or_compute(
+        (normalize_query(query), k), lambda: [doc for doc, _ in search_store(get_vector_store(), query, k)]
+    )
 
 
-index = faiss.IndexFlatL2(len(embeddings.embed_query("hello world")))
+def batch_similarity_search_with_score(store, queries: List[str], k: int = 3):
+    """
+    Search a langchain FAISS store for many queries at once.
+
+    All queries are embedded in a single model call (cached ones are skipped)
+    and looked up with one FAISS search over the resulting matrix.
+
+    Returns:
+        list: One list of (Document, score) pairs per query, in query order.
+    """
+    import faiss
+    import numpy as np
+
+    if not queries:
+        return []
+    embedding = store.embedding_function
+    if isinstance(embedding, CachedEmbeddings):
+        vectors = embedding.embed_queries(queries)
+    else:
+        vectors = embedding.embed_documents(queries)
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if store._normalize_L2:
+        faiss.normalize_L2(matrix)
+    with telemetry.span("faiss.search", **{"faiss.k": k, "faiss.queries": len(queries), "faiss.ntotal": store.index.ntotal}):
+        scores, indices = store.index.search(matrix, k)
+
+    results = []
+    for row_scores, row_indices in zip(scores, indices):
+        hits = []
+        for score, i in zip(row_scores, row_indices):
+            if i == -1:
+                continue
+            doc = store.docstore.search(store.index_to_docstore_id[i])
+            hits.append((doc, float(score)))
+        results.append(hits)
+    return results
+
+
+def batch_search_templates(queries: List[str], k: int = 3):
+    """Top-k templates for each query, searching all uncached queries in one batch."""
+    keys = [(normalize_query(query), k) for query in queries]
+    results = [search_result_cache.get(key) for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending:
+        found = batch_similarity_search_with_score(
+            get_vector_store(), [queries[i] for i in pending], k=k
+        )
+        for i, hits in zip(pending, found):
+            results[i] = [doc for doc, _ in hits]
+            search_result_cache.put(keys[i], results[i])
+    return results
+
+
+def cache_stats() -> dict:
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "search_results": search_result_cache.stats(),
+    }
+
+
+def warm_up_in_background() -> threading.Thread:
+    """Load the model and vector store in a daemon thread."""
+    thread = threading.Thread(target=get_vector_store, name="vector-db-warmup", daemon=True)
+    thread.start()
+    return thread
 
-vector_store = FAISS(
-    embedding_function=embeddings,
-    index=index,
-    docstore=InMemoryDocstore(),
-    index_to_docstore_id={},
-)
 
 def build_docs(prompts:list):
+    from langchain_core.documents import Document
+
     documents = []
     for prompt in prompts:
         document = Document(page_content=prompt["prompt"] , metadata={
@@ -40,14 +181,295 @@ def build_docs(prompts:list):
         documents.append(document)
     return documents
 
-documents = build_docs(prompts)
-uuids = [str(uuid4()) for _ in range(len(documents))]
-vector_store.add_documents(documents=documents, ids=uuids)
+
+def template_hash(prompt: dict) -> str:
+    return hashlib.sha256(json.dumps(prompt, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def template_ids(prompts: list):
+    """
+    Stable document IDs derived from template content.
+
+    An edited template gets a new ID, an untouched one keeps its ID across
+    restarts and reloads. Exact duplicates get "-1", "-2", ... suffixes.
+
+    Returns:
+        tuple: (ids, hashes), one entry per prompt.
+    """
+    hashes = [template_hash(prompt) for prompt in prompts]
+    seen = {}
+    ids = []
+    for content_hash in hashes:
+        count = seen.get(content_hash, 0)
+        seen[content_hash] = count + 1
+        ids.append(content_hash if count == 0 else f"{content_hash}-{count}")
+    return ids, hashes
+
+
+def _read_manifest():
+    try:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("model") != embedding_config().key():
+        return None
+    return manifest
+
+
+def _read_index():
+    import faiss
+
+    # Map the index file instead of reading it into memory where faiss supports it
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
+        return faiss.read_index(INDEX_FILE, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(INDEX_FILE)
+
+
+def _save(index, vectors, manifest):
+    import faiss
+    import numpy as np
+
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    # Write beside and rename over the old files: a live store may still have
+    # INDEX_FILE memory-mapped, and rewriting it in place would pull the pages
+    # out from under searches in flight (SIGBUS)
+    faiss.write_index(index, INDEX_FILE + '.tmp')
+    with open(VECTORS_FILE + '.tmp', 'wb') as file:
+        np.save(file, vectors)
+    with open(MANIFEST_FILE + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(INDEX_FILE + '.tmp', INDEX_FILE)
+    os.replace(VECTORS_FILE + '.tmp', VECTORS_FILE)
+    # Manifest last, so it never describes files that are not in place yet
+    os.replace(MANIFEST_FILE + '.tmp', MANIFEST_FILE)
+
+
+def _embed_prompts(prompts: list, manifest, embeddings):
+    """
+    Embed prompts, reusing stored vectors for templates whose content is unchanged.
+
+    Returns:
+        tuple: (ids, hashes, vectors, number of templates embedded).
+    """
+    import numpy as np
+
+    ids, hashes = template_ids(prompts)
+    previous = {}
+    if manifest is not None and os.path.exists(VECTORS_FILE):
+        stored = np.load(VECTORS_FILE)
+        for row, content_hash in enumerate(manifest["hashes"]):
+            previous.setdefault(content_hash, stored[row])
+
+    # Duplicates share a hash, so each distinct new template is embedded once
+    first_prompt = {}
+    for content_hash, prompt in zip(hashes, prompts):
+        first_prompt.setdefault(content_hash, prompt)
+    missing = [content_hash for content_hash in first_prompt if content_hash not in previous]
+    if missing:
+        new_vectors = embeddings.embed_documents([first_prompt[h]["prompt"] for h in missing])
+        previous.update(zip(missing, new_vectors))
+
+    vectors = np.asarray([previous[content_hash] for content_hash in hashes], dtype='float32')
+    return ids, hashes, vectors, len(missing)
+
+
+def load_vector_store(prompts: list, raw_prompts: bytes, embeddings, config=None):
+    """
+    Build the template vector store, reusing the persisted index when possible.
+
+    The saved index is used as-is when the hash of prompts.json and the index
+    settings match the ones it was built from. Otherwise only added or edited
+    templates are embedded and the index is rebuilt and saved.
+    """
+    from embedding_backends import embedding_dimension
+    from faiss_index import IndexConfig, apply_search_params, build_index, make_vector_store
+
+    if config is None:
+        config = IndexConfig.from_env()
+    prompts_hash = hashlib.sha256(raw_prompts).hexdigest()
+    documents = build_docs(prompts)
+    # Hot reloads append to the index, so its order can differ from the file's
+    by_id = dict(zip(template_ids(prompts)[0], documents))
+    manifest = _read_manifest()
+
+    if (manifest is not None and manifest["prompts_hash"] == prompts_hash
+            and manifest.get("index") == config.build_key() and os.path.exists(INDEX_FILE)
+            and set(manifest["ids"]) == set(by_id)):
+        index = _read_index()
+        apply_search_params(index, config)
+        ids = manifest["ids"]
+        documents = [by_id[doc_id] for doc_id in ids]
+    else:
+        ids, hashes, vectors, _ = _embed_prompts(prompts, manifest, embeddings)
+        if len(vectors):
+            dimension = vectors.shape[1]
+        else:
+            dimension = embedding_dimension(embeddings)
+        vectors = vectors.reshape(len(ids), dimension)
+        index = build_index(vectors, dimension, config)
+        _save(index, vectors, {
+            "model": embedding_config().key(),
+            "prompts_hash": prompts_hash,
+            "index": config.build_key(),
+            "ids": ids,
+            "hashes": hashes,
+        })
+
+    return make_vector_store(embeddings, index, documents, ids)
+
+
+def update_vector_store(store, prompts: list, raw_prompts: bytes, embeddings, config=None):
+    """
+    Apply a new prompts.json to a live template store without touching unchanged templates.
+
+    Only added or edited templates are embedded. With a flat index the
+    removed vectors are dropped from, and the new ones appended to, an owned
+    copy of the live index. Trained or graph indexes (IVF, HNSW) are rebuilt from
+    the stored vectors instead, since they cannot renumber removals in place.
+    The caller swaps in the returned store, so searches running meanwhile
+    keep using the old one.
+
+    Returns:
+        tuple: (new store, {'added', 'removed', 'unchanged', 'embedded'}).
+    """
+    import faiss
+    import numpy as np
+    from faiss_index import IndexConfig, build_index, make_vector_store, normalized
+
+    if config is None:
+        config = IndexConfig.from_env()
+    manifest = _read_manifest()
+    ids, hashes, vectors, embedded = _embed_prompts(prompts, manifest, embeddings)
+    documents = build_docs(prompts)
+
+    old_ids = [store.index_to_docstore_id[position] for position in range(store.index.ntotal)]
+    new_set, old_set = set(ids), set(old_ids)
+    removed = [position for position, doc_id in enumerate(old_ids) if doc_id not in new_set]
+    added = [position for position, doc_id in enumerate(ids) if doc_id not in old_set]
+    summary = {
+        "added": len(added),
+        "removed": len(removed),
+        "unchanged": len(old_ids) - len(removed),
+        "embedded": embedded,
+    }
+
+    same_settings = manifest is not None and manifest.get("index") == config.build_key()
+    if same_settings and isinstance(store.index, faiss.IndexFlat):
+        # Copy the vectors into a new index: the loaded one may be a read-only
+        # memory map (clone_index of which is only a view that faiss refuses to
+        # modify), and searches in flight must keep seeing a consistent index
+        index = faiss.IndexFlat(store.index.d, store.index.metric_type)
+        if store.index.ntotal:
+            index.add(store.index.reconstruct_n(0, store.index.ntotal))
+        if removed:
+            index.remove_ids(np.array(removed, dtype=np.int64))
+        if added:
+            index.add(normalized(vectors[added]))
+        order = [doc_id for doc_id in old_ids if doc_id in new_set] + [ids[position] for position in added]
+    else:
+        dimension = vectors.shape[1] if len(vectors) else store.index.d
+        index = build_index(vectors.reshape(len(ids), dimension), dimension, config)
+        order = ids
+
+    position = {doc_id: i for i, doc_id in enumerate(ids)}
+    rows = [position[doc_id] for doc_id in order]
+    _save(index, vectors[rows] if rows else vectors, {
+        "model": embedding_config().key(),
+        "prompts_hash": hashlib.sha256(raw_prompts).hexdigest(),
+        "index": config.build_key(),
+        "ids": order,
+        "hashes": [hashes[row] for row in rows],
+    })
+    return make_vector_store(embeddings, index, [documents[row] for row in rows], order), summary
+
+
+def reload_templates() -> dict:
+    """
+    Re-read prompts.json and apply the changes to the live template store.
+
+    Returns:
+        dict: Counts of added, removed, unchanged and embedded templates.
+    """
+    global _vector_store
+    with _reload_lock:
+        prompts, raw_prompts = load_prompts()
+        if _vector_store is None:
+            get_vector_store()
+            return {"added": len(prompts), "removed": 0, "unchanged": 0, "embedded": None}
+        store, summary = update_vector_store(_vector_store, prompts, raw_prompts, get_cached_embeddings())
+        _vector_store = store
+        # Cached results may point at removed or outdated templates
+        search_result_cache.clear()
+    return summary
+
+
+class TemplateWatcher:
+    """Polls prompts.json and hot-reloads the template store when it changes.
+
+    Polling the file's mtime and size needs no extra dependency and copes
+    with editors that replace the file instead of writing in place. A change
+    is applied once the file has been stable for one interval, so a reload
+    never reads a half-written file; invalid JSON is logged and skipped
+    until the next change.
+    """
+
+    def __init__(self, path: str = PROMPTS_PATH, interval: float = TEMPLATES_WATCH_INTERVAL,
+                 on_reload=reload_templates):
+        self.path = path
+        self.interval = interval
+        self.on_reload = on_reload
+        self._stopped = threading.Event()
+        self._thread = None
+        self.last_reload = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="templates-watch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        applied = self._stat()
+        pending = None
+        while not self._stopped.wait(self.interval):
+            current = self._stat()
+            if current is None or current == applied:
+                pending = None
+                continue
+            if current != pending:
+                # Changed since the last poll; wait until it settles
+                pending = current
+                continue
+            try:
+                self.last_reload = self.on_reload()
+                logger.info("Reloaded templates: %s", self.last_reload)
+            except (OSError, KeyError, ValueError) as error:
+                logger.warning("Not reloading %s: %s", self.path, error)
+            applied, pending = current, None
 
 
-    
+_template_watcher = None
 
 
+def watch_templates(interval: float = TEMPLATES_WATCH_INTERVAL):
+    """Start the prompts.json watcher once; a non-positive interval disables it."""
+    global _template_watcher
+    with _lock:
+        if _template_watcher is None and interval > 0:
+            _template_watcher = TemplateWatcher(interval=interval).start()
+    return _template_watcher
 
 
 if __name__=="__main__":
@@ -57,9 +479,9 @@ if __name__=="__main__":
     #     print(f"purpose of mail:{prompt["purpose of mail"]}\n")
     #     print(f"prompt:{prompt["prompt"]}\n")
     #     print("="*50)
-    results = vector_store.similarity_search(
+    results = get_vector_store().similarity_search(
     "Email to request leave for 2 days",
     k=2
     )
     for res in results:
-        print(f"* {res.page_content} [{res.metadata}]")
\ No newline at end of file
+        print(f"* {res.page_content} [{res.metadata}]")